@@ -234,6 +234,8 @@ class BalloonModel(HasTraits):
         # prepare integrator
         self.integrator.dt = self.dt
         self.integrator.configure()
+        if isinstance(self.integrator, integrators_module.IntegratorLinearDecay):
+            self.integrator.configure_linear_decay(self.linear_decay())
         self.log.debug("Integration time step size will be: %s seconds" % str(self.integrator.dt))
 
         scheme = self.integrator.scheme
@@ -374,6 +376,14 @@ class BalloonModel(HasTraits):
 
         return numpy.array([ds, df, dv, dq])
 
+    def linear_decay(self):
+        """
+        Rates of the diagonal linear decay of the Balloon model equations,
+        linearized at rest, for integrators taking the linear part exactly.
+        """
+        decay = [1. / self.tau_s, 0., 1. / (self.tau_o * self.alpha), 1. / self.tau_o]
+        return numpy.array(decay).reshape((4, 1, 1))
+
     def result_shape(self, input_shape):
         """Returns the shape of the main result of fmri balloon ..."""
         result_shape = (input_shape[0], input_shape[1],
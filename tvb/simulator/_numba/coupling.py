@@ -28,9 +28,11 @@
 #
 #
 
+import functools
 import numpy
+import numba
 from numba import cuda, float32, int32
-from .util import CUDA_SIM
+from .util import CUDA_SIM, parallel_njit
 
 
 def cu_simple_cfun(offset, cvar):
@@ -170,3 +172,40 @@ def cu_delay_cfun(horizon, cfpre, cfpost, n_cvar, n_thread_per_block, step_strid
             )
 
     return dcfun
+
+
+_CPU_CFUN = '''
+from math import *
+
+def cfun(step, buffer, indptr, indices, weights, idelays, out{arguments}):
+    n_time, n_cvar, n_node, n_mode = buffer.shape
+    t_i = (step - 1) % n_time
+    for i in numba.prange(n_node):
+        for k in range(n_cvar):
+            for m in range(n_mode):
+{parameters}
+                x_i = buffer[t_i, k, i, m]
+                gx = 0.0
+                for jj in range(indptr[i], indptr[i + 1]):
+                    t_j = t_i - idelays[jj]
+                    if t_j < 0:
+                        t_j += n_time
+                    x_j = buffer[t_j, k, indices[jj], m]
+                    gx += weights[jj] * ({pre})
+                out[k, i, m] = {post}
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_expr_cfun(pre, post, parameters):
+    """
+    Construct parallel Numba CPU function for delayed sparse coupling with given pre & post summation
+    expressions. Delayed states are read from a (time, cvar, node, mode) history buffer for afferents
+    in CSR order, and each parameter is passed as an array of per mode values.
+
+    """
+    arguments = ''.join(', p_%s' % (name, ) for name in parameters)
+    lines = ''.join('                %s = p_%s[m]\n' % (name, name) for name in parameters)
+    namespace = {'numba': numba}
+    exec(_CPU_CFUN.format(arguments=arguments, parameters=lines, pre=pre, post=post), namespace)
+    return parallel_njit(namespace['cfun'], fastmath={'afn', 'arcp', 'contract', 'reassoc'})
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Fused Numba CPU backend for region simulations.
+
+The whole simulation step, i.e. sparse delayed coupling, model dfun, integration
+scheme, history update and Raw, SubSample or TemporalAverage monitor sampling, is
+generated as a single ``nopython`` kernel advancing blocks of steps, with nodes
+processed in parallel. The kernel operates on the simulator's history buffer and
+monitor stocks in place, such that the NumPy loop may continue where it stopped.
+
+"""
+
+import math
+import numpy
+import numba
+from tvb.simulator import coupling, integrators, monitors, noise
+from tvb.simulator.history import MemmapHistory
+from .util import parallel_njit
+
+# pre- and post-summation expressions of supported couplings, and their parameters
+_COUPLINGS = {
+    coupling.Linear: ('x_j', 'p[0] * gx + p[1]', lambda c, n_cvar: (c.a, c.b)),
+    coupling.Scaling: ('x_j', 'p[0] * gx', lambda c, n_cvar: (c.a, )),
+    coupling.Difference: ('x_j - x_i', 'p[0] * gx', lambda c, n_cvar: (c.a, )),
+    coupling.HyperbolicTangent: ('p[0] * (1 + math.tanh((p[1] * x_j - p[2]) / p[3]))', 'gx',
+                                 lambda c, n_cvar: (c.a, c.b, c.midpoint, c.sigma)),
+    coupling.Kuramoto: ('math.sin(x_j - x_i)', 'p[0] * gx', lambda c, n_cvar: (c.a / n_cvar, )),
+}
+
+_HEUN = '''
+            node_dfun(state[i], c[i], params, i, dx1[i])
+            for v in range(n_svar):
+                inter[i, v] = state[i, v] + dt * dx1[i, v]{noise}
+            {bound_inter}
+            node_dfun(inter[i], c[i], params, i, dx2[i])
+            for v in range(n_svar):
+                state[i, v] = state[i, v] + (dx1[i, v] + dx2[i, v]) * dt / 2.0{noise}
+            {bound_state}'''
+
+_EULER = '''
+            node_dfun(state[i], c[i], params, i, dx1[i])
+            for v in range(n_svar):
+                state[i, v] = state[i, v] + dx1[i, v] * dt{noise}
+            {bound_state}'''
+
+# integration schemes of supported integrators, with the noise term of stochastic ones
+_SCHEMES = {
+    integrators.HeunDeterministic: (_HEUN, ''),
+    integrators.HeunStochastic: (_HEUN, ' + noise[t, v, i] * gfun[v, i]'),
+    integrators.EulerDeterministic: (_EULER, ''),
+    integrators.EulerStochastic: (_EULER, ' + gfun[v, i] * noise[t, v, i]'),
+}
+
+_SUBSAMPLE = '''
+            if step % istep{m} == 0:
+                s = step // istep{m} - first{m}
+                for k in range(voi{m}.size):
+                    out{m}[s, k, i] = obs[i, voi{m}[k]]'''
+
+_TEMPORAL_AVERAGE = '''
+            for k in range(voi{m}.size):
+                stock{m}[(step - 1) % istep{m}, k, i] = obs[i, voi{m}[k]]
+            if step % istep{m} == 0:
+                s = step // istep{m} - first{m}
+                for k in range(voi{m}.size):
+                    total = 0.0
+                    for q in range(istep{m}):
+                        total += stock{m}[q, k, i]
+                    out{m}[s, k, i] = total / istep{m}'''
+
+_KERNEL = '''
+def kernel(step0, n_step, state, buffer, cvars, indptr, indices, weights, idelays, p, params, dt,
+           noise, gfun, bidx, lo, hi{monitor_args}):
+    n_node, n_svar = state.shape
+    n_time, n_cvar = buffer.shape[0], buffer.shape[1]
+    c = numpy.empty((n_node, n_cvar), state.dtype)
+    dx1 = numpy.empty((n_node, n_svar), state.dtype)
+    dx2 = numpy.empty((n_node, n_svar), state.dtype)
+    inter = numpy.empty((n_node, n_svar), state.dtype)
+    obs = numpy.empty((n_node, {n_obs}), state.dtype)
+    for t in range(n_step):
+        step = step0 + t
+        for i in numba.prange(n_node):
+            for k in range(n_cvar):
+                x_i = buffer[(step - 1) % n_time, k, i]
+                gx = 0.0
+                for jj in range(indptr[i], indptr[i + 1]):
+                    x_j = buffer[(step - 1 - idelays[jj] + n_time) % n_time, k, indices[jj]]
+                    gx += weights[jj] * ({pre})
+                c[i, k] = {post}
+{scheme}
+        for i in numba.prange(n_node):
+            for k in range(n_cvar):
+                buffer[step % n_time, k, i] = state[i, cvars[k]]
+            observe(state[i], obs[i])
+{monitors}
+'''
+
+
+@numba.njit
+def _bound(x, bidx, lo, hi):
+    "Bound the state variables of a node, where the boundaries are not NaN."
+    for b in range(bidx.size):
+        if x[bidx[b]] < lo[b]:
+            x[bidx[b]] = lo[b]
+        if x[bidx[b]] > hi[b]:
+            x[bidx[b]] = hi[b]
+
+
+def _compile(template, name, namespace, **jit):
+    exec(template, namespace)
+    return numba.njit(**jit)(namespace[name])
+
+
+def make_node_dfun(gufunc, n_param):
+    "Construct Numba function evaluating the generalized ufunc dfun of a model for a single node."
+    arguments = ''.join('params[%d][i:i + 1], ' % k for k in range(n_param))
+    template = "def node_dfun(x, c, params, i, dx):\n    dfun(x, c, %sdx)" % (arguments, )
+    dfun = numba.njit(gufunc.gufunc_builder.py_func)
+    return _compile(template, 'node_dfun', {'dfun': dfun})
+
+
+def make_observe(model):
+    "Construct Numba function evaluating the variables of interest of a model for a single node."
+    template = "def observe(state_, out_):\n"
+    for j, name in enumerate(model.state_variables):
+        template += "    %s = state_[%d]\n" % (name, j)
+    for k, expr in enumerate(model.variables_of_interest):
+        template += "    out_[%d] = %s\n" % (k, expr)
+    return _compile(template, 'observe', {'numpy': numpy, 'math': math})
+
+
+def make_kernel(node_dfun, observe, n_obs, pre, post, scheme, noise_term, bounded, monitor_kinds):
+    "Construct the parallel Numba kernel advancing a region simulation by a block of steps."
+    bound = '_bound({}[i], bidx, lo, hi)' if bounded else ''
+    scheme = scheme.format(noise=noise_term, bound_inter=bound.format('inter'), bound_state=bound.format('state'))
+    monitor_args, monitor_code = '', ''
+    for m, kind in enumerate(monitor_kinds):
+        if kind == 'tavg':
+            monitor_args += ', istep{m}, first{m}, voi{m}, out{m}, stock{m}'.format(m=m)
+            monitor_code += _TEMPORAL_AVERAGE.format(m=m)
+        else:
+            monitor_args += ', istep{m}, first{m}, voi{m}, out{m}'.format(m=m)
+            monitor_code += _SUBSAMPLE.format(m=m)
+    template = _KERNEL.format(monitor_args=monitor_args, n_obs=n_obs, pre=pre, post=post,
+                              scheme=scheme, monitors=monitor_code)
+    namespace = {'numpy': numpy, 'numba': numba, 'math': math, 'node_dfun': node_dfun,
+                 'observe': observe, '_bound': _bound}
+    exec(template, namespace)
+    return parallel_njit(namespace['kernel'])
+
+
+class NumbaBackend(object):
+    """
+    Runs a configured region simulation with a fused kernel, generating the same
+    monitor outputs as the simulator's NumPy loop. Raises ValueError for simulations
+    with components which the kernel does not implement.
+
+    """
+
+    # maximum number of steps per kernel call
+    block_size = 1024
+
+    def __init__(self, simulator):
+        self.simulator = sim = simulator
+        self._check(sim)
+        model, history = sim.model, sim.history
+        gufunc, parameters = model._numba_dfun_parameters()
+        types = gufunc.types[0].split('->')[0][2:]
+        dtype = sim.dtype
+        self.params = tuple(numpy.broadcast_to(numpy.asarray(parameter), (sim.number_of_nodes, ))
+                            .astype(dtype if char == 'd' else char) for parameter, char in zip(parameters, types))
+        pre, post, coupling_params = _COUPLINGS[type(sim.coupling)]
+        self.coupling_params = numpy.array([numpy.asarray(p).item() for p in coupling_params(sim.coupling, history.n_cvar)])
+        # afferent connections in rows of target nodes, in the row major order of the sparse history
+        rows, order = history.nnz_row_el_idx, history.nnz_row_order
+        self.indptr = numpy.r_[0, numpy.cumsum(numpy.bincount(rows, minlength=history.n_node))]
+        self.indices = history.nnz_col_el_idx[order].astype(numpy.intp)
+        self.weights = history.nnz_weights[order]
+        self.idelays = history.nnz_idelays[order]
+        integrator = sim.integrator
+        if integrator.state_variable_boundaries is not None:
+            self.bidx = integrator.bounded_state_variable_indices.astype(numpy.intp)
+            boundaries = numpy.array(integrator.state_variable_boundaries, dtype=float)
+            self.lo, self.hi = boundaries.T.astype(dtype)
+        else:
+            self.bidx, self.lo, self.hi = numpy.zeros(0, numpy.intp), numpy.zeros(0, dtype), numpy.zeros(0, dtype)
+        self.monitor_kinds = ['tavg' if isinstance(monitor, monitors.TemporalAverage) else 'sub'
+                              for monitor in sim.monitors]
+        scheme, noise_term = _SCHEMES[type(integrator)]
+        self.kernel = make_kernel(make_node_dfun(gufunc, len(parameters)), make_observe(model),
+                                  len(model.variables_of_interest), pre, post, scheme, noise_term,
+                                  self.bidx.size > 0, self.monitor_kinds)
+
+    @staticmethod
+    def _check(sim):
+        unsupported = []
+        if sim.surface is not None:
+            unsupported.append('surface simulations')
+        if sim.stimulus is not None:
+            unsupported.append('stimuli')
+        if sim.current_state.shape[2] != 1:
+            unsupported.append('multiple modes')
+        # the kernel reads one mode of the history, batches keep their instances along the modes
+        if sim.history.n_mode != sim.current_state.shape[2]:
+            unsupported.append('batched simulations')
+        # the kernel would bypass the in memory window of recent steps
+        if isinstance(sim.history, MemmapHistory):
+            unsupported.append('memory mapped history')
+        if not hasattr(sim.model, '_numba_dfun_parameters') or sim.model._numba_dfun_parameters() is None:
+            unsupported.append('model %s' % type(sim.model).__name__)
+        if type(sim.coupling) not in _COUPLINGS:
+            unsupported.append('coupling %s' % type(sim.coupling).__name__)
+        elif any(numpy.size(p) != 1 for p in _COUPLINGS[type(sim.coupling)][2](sim.coupling, 1)):
+            unsupported.append('spatialized coupling parameters')
+        integrator = sim.integrator
+        if type(integrator) not in _SCHEMES:
+            unsupported.append('integrator %s' % type(integrator).__name__)
+        elif isinstance(integrator, integrators.IntegratorStochastic) \
+                and type(integrator.noise) is not noise.Additive:
+            unsupported.append('noise %s' % type(integrator.noise).__name__)
+        if integrator.clamped_state_variable_values is not None:
+            unsupported.append('clamped state variables')
+        for monitor in sim.monitors:
+            if type(monitor) not in (monitors.Raw, monitors.SubSample, monitors.TemporalAverage):
+                unsupported.append('monitor %s' % type(monitor).__name__)
+        if unsupported:
+            raise ValueError('The numba backend does not support %s.' % ', '.join(unsupported))
+
+    def _monitor_arguments(self, step0, n_step):
+        "Kernel arguments and sample steps of the monitors for a block of steps."
+        arguments, sample_steps = [], []
+        n_node = self.simulator.number_of_nodes
+        for monitor, kind in zip(self.simulator.monitors, self.monitor_kinds):
+            first = (step0 - 1) // monitor.istep + 1
+            steps = numpy.r_[first:(step0 + n_step - 1) // monitor.istep + 1] * monitor.istep
+            out = numpy.empty((steps.size, monitor.voi.size, n_node), self.simulator.dtype)
+            arguments += [monitor.istep, first, monitor.voi.astype(numpy.intp), out]
+            if kind == 'tavg':
+                arguments.append(monitor._stock[..., 0])
+            sample_steps.append((steps, out))
+        return arguments, sample_steps
+
+    def _noise(self, n_step, shape):
+        "Noise realizations and their scaling for a block of steps."
+        integrator = self.simulator.integrator
+        if not isinstance(integrator, integrators.IntegratorStochastic):
+            return numpy.zeros((0, 0, 0), self.simulator.dtype), numpy.zeros((0, 0), self.simulator.dtype)
+        integrator.noise.prefetch(n_step, shape)
+        realizations = numpy.array([integrator.noise.generate(shape) for _ in range(n_step)])
+        gfun = numpy.broadcast_to(integrator.noise.gfun(numpy.zeros(shape, self.simulator.dtype)), shape)
+        return realizations[..., 0], numpy.ascontiguousarray(gfun[..., 0])
+
+    def _outputs(self, monitor, step, out, k):
+        if isinstance(monitor, monitors.TemporalAverage):
+            time = (step - monitor.istep / 2.0) * monitor.dt
+        else:
+            time = step * monitor.dt
+        return [time, out[k][..., numpy.newaxis]]
+
+    def __call__(self, start, stop, state):
+        """
+        Advance the simulation from step `start` up to but excluding `stop`, starting
+        from `state`, generating monitor outputs as the simulator's NumPy loop.
+
+        """
+        sim = self.simulator
+        history = sim.history
+        x = numpy.ascontiguousarray(state[..., 0].T)
+        buffer = history.buffer[..., 0]
+        for step0 in range(start, stop, self.block_size):
+            n_step = min(self.block_size, stop - step0)
+            realizations, gfun = self._noise(n_step, state.shape)
+            monitor_arguments, sample_steps = self._monitor_arguments(step0, n_step)
+            self.kernel(step0, n_step, x, buffer, history.cvars, self.indptr, self.indices, self.weights,
+                        self.idelays, self.coupling_params, self.params, sim.integrator.dt, realizations, gfun,
+                        self.bidx, self.lo, self.hi, *monitor_arguments)
+            sim.current_state = x.T[..., numpy.newaxis].copy("K" if sim.layout == "node" else "C")
+            outputs = {}
+            for m, (monitor, (steps, out)) in enumerate(zip(sim.monitors, sample_steps)):
+                for k, step in enumerate(steps):
+                    outputs.setdefault(step, [None] * len(sim.monitors))[m] = self._outputs(monitor, step, out, k)
+            for step in sorted(outputs):
+                yield outputs[step]
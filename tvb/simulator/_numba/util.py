@@ -29,6 +29,8 @@
 #
 
 import os
+import functools
+import threading
 import numba
 import numba.cuda
 
@@ -38,6 +40,27 @@ try:
 except:
     CUDA_SIM = False
 
+# parallel kernels run on the workqueue threading layer unless one is chosen with
+# NUMBA_THREADING_LAYER: processes which ran TBB kernels hang at exit once they have
+# started the multiprocessing resource tracker, as ensembles do, and GNU OpenMP
+# aborts forked workers, while workqueue is safe in both cases
+if 'NUMBA_THREADING_LAYER' not in os.environ:
+    numba.config.THREADING_LAYER = 'workqueue'
+
+# workqueue is not thread safe, so parallel kernels are launched one at a time
+PARALLEL_LOCK = threading.Lock()
+
+
+def parallel_njit(fn, **jit):
+    "Compile `fn` as a parallel Numba CPU function, whose launches are serialized by PARALLEL_LOCK."
+    kernel = numba.njit(parallel=True, **jit)(fn)
+
+    @functools.wraps(fn)
+    def launch(*args):
+        with PARALLEL_LOCK:
+            return kernel(*args)
+    return launch
+
 
 _cu_expr_type_map = {
     int: numba.int32,
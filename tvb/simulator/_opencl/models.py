@@ -173,3 +173,8 @@ class CLRWW(ReducedWongWang, CLModel):
         deriv[i] = neg*(0.0f - S) + gt1*(1.0f - S) + i01*dx;
     }
     """
+
+
+def declared_model(model_class):
+    "OpenCL model class evaluating the generated kernel of a model class created by a `ModelSpec`."
+    return type('CL' + model_class.__name__, (model_class, CLModel), {})
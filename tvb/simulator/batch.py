@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Batched execution of parameter sweeps within a single simulator.
+
+A BatchedSimulator integrates several instances of the same network, which
+differ only in selected Model and Coupling parameters, in one integration
+loop, so that the per-step interpreter overhead is paid once per step for the
+whole sweep instead of once per parameter point.
+
+Instances are carried along an extra axis: for the model and integrator, the
+instance axis is folded into the node axis, so that instance ``k`` of node ``i``
+is found at node index ``k * n_node + i``, and per-instance parameters are simply
+spatialized parameters. For the history and coupling, the instance axis is
+folded into the mode axis, such that the delayed states of all instances are
+gathered from contiguous memory and the connectivity is not replicated.
+
+.. moduleauthor:: Marmaduke Woodman <marmaduke.woodman@univ-amu.fr>
+
+"""
+
+import numpy
+from tvb.basic.neotraits.api import Attr, Int
+from . import monitors
+from .simulator import Simulator
+
+
+class BatchedSimulator(Simulator):
+    """
+    A Simulator running a batch of parameter instances of the same network.
+
+    Monitor outputs have an extra leading instance axis, i.e. the data of
+    each sample has shape ``(n_instances, n_voi, n_node, n_mode)``.
+
+    """
+
+    n_instances = Int(
+        label="Number of instances",
+        default=1,
+        doc="""Number of instances to simulate. If any parameter sweeps are
+        given, this is determined by the number of values in the sweeps.""")
+
+    model_sweep = Attr(
+        field_type=dict,
+        label="Model parameter sweep",
+        default=None,
+        required=False,
+        doc="""Mapping of Model parameter names to arrays of per-instance values,
+        of shape (n_instances, ) or (n_instances, n_node).""")
+
+    coupling_sweep = Attr(
+        field_type=dict,
+        label="Coupling parameter sweep",
+        default=None,
+        required=False,
+        doc="""Mapping of Coupling parameter names to arrays of per-instance
+        values, of shape (n_instances, ).""")
+
+    # monitors which only operate per node, and therefore per instance
+    supported_monitors = (monitors.Raw, monitors.SubSample, monitors.TemporalAverage, monitors.Bold,
+                          monitors.ProgressLogger)
+
+    @property
+    def good_history_shape(self):
+        """Returns expected history shape, with instances folded into nodes."""
+        n_time, n_svar, n_reg, n_mode = super(BatchedSimulator, self).good_history_shape
+        return n_time, n_svar, self.n_instances * n_reg, n_mode
+
+    def _fold(self, x):
+        "Move instances from the node to the mode axis, (.., n_inst * n_node, m) -> (.., n_node, n_inst * m)."
+        n_inst, n_reg = self.n_instances, self.connectivity.number_of_regions
+        n_mode = x.shape[-1]
+        x = x.reshape(x.shape[:-2] + (n_inst, n_reg, n_mode))
+        x = numpy.moveaxis(x, -3, -2)
+        return x.reshape(x.shape[:-3] + (n_reg, n_inst * n_mode))
+
+    def _unfold(self, x):
+        "Move instances from the mode to the node axis, (.., n_node, n_inst * m) -> (.., n_inst * n_node, m)."
+        n_inst, n_reg = self.n_instances, self.connectivity.number_of_regions
+        n_mode = x.shape[-1] // n_inst
+        x = x.reshape(x.shape[:-2] + (n_reg, n_inst, n_mode))
+        x = numpy.moveaxis(x, -2, -3)
+        return x.reshape(x.shape[:-3] + (n_inst * n_reg, n_mode))
+
+    def _sweep_values(self, name, values, region_shape=None):
+        values = numpy.asarray(values, dtype=float)
+        if values.shape[0] != self.n_instances or (values.ndim > 1 and values.shape[1:] != region_shape):
+            raise ValueError("Bad shape %s for sweep over %r with %d instances." % (
+                values.shape, name, self.n_instances))
+        return values
+
+    def _configure_sweeps(self):
+        sweeps = [sweep for sweep in (self.model_sweep, self.coupling_sweep) if sweep]
+        sizes = set(len(values) for sweep in sweeps for values in sweep.values())
+        if len(sizes) > 1:
+            raise ValueError("Parameter sweeps have inconsistent numbers of values %s." % (sorted(sizes), ))
+        if sizes:
+            self.n_instances = sizes.pop()
+        self.log.info('Batch of %d instances', self.n_instances)
+
+    def preconfigure(self):
+        """Configure the basic fields, with instances folded into nodes."""
+        self._configure_sweeps()
+        if self.surface is not None:
+            raise ValueError("Batched simulation of surfaces is not supported.")
+        for monitor in self.monitors:
+            if not isinstance(monitor, self.supported_monitors) or isinstance(monitor, monitors.BoldRegionROI):
+                raise ValueError("Monitor %s is not supported for batched simulation." % (type(monitor).__name__, ))
+        super(BatchedSimulator, self).preconfigure()
+        self.number_of_nodes *= self.n_instances
+
+    def configure(self, full_configure=True):
+        """Configure simulator and its components, expanding parameters over instances."""
+        if full_configure:
+            self.preconfigure()
+        n_reg, n_inst = self.connectivity.number_of_regions, self.n_instances
+        model_sweep = self.model_sweep or {}
+        for param in type(self.model).declarative_attrs:
+            value = getattr(self.model, param)
+            if param in model_sweep:
+                values = self._sweep_values(param, model_sweep[param], (n_reg, ))
+                if values.ndim == 1:
+                    values = numpy.repeat(values, n_reg)
+                setattr(self.model, param, values.reshape((-1, )))
+            elif isinstance(value, numpy.ndarray) and value.size == n_reg and n_inst > 1:
+                setattr(self.model, param, numpy.tile(value.reshape((-1, )), n_inst))
+        n_mode = self.model.number_of_modes
+        for param, values in (self.coupling_sweep or {}).items():
+            values = self._sweep_values(param, values)
+            setattr(self.coupling, param, numpy.repeat(values, n_mode))
+        return super(BatchedSimulator, self).configure(full_configure=False)
+
+    def _configure_history(self, initial_conditions):
+        if initial_conditions is not None and initial_conditions.shape[2] == self.connectivity.number_of_regions:
+            initial_conditions = numpy.tile(initial_conditions, (1, 1, self.n_instances, 1))
+        super(BatchedSimulator, self)._configure_history(initial_conditions)
+
+    def _configure_integrator_noise(self):
+        nsig, n_reg = self.integrator.noise.nsig, self.connectivity.number_of_regions
+        if nsig.shape == (n_reg, ) or nsig.shape == (self.model.nvar, n_reg):
+            self.integrator.noise.nsig = numpy.tile(nsig, self.n_instances)
+        super(BatchedSimulator, self)._configure_integrator_noise()
+
+    def _create_history(self, history):
+        """Create a history storing instances along the mode axis."""
+        self.history = self._make_history(self.model.number_of_modes * self.n_instances)
+        self.history.initialize(self._fold(history))
+
+    def _node_coupling(self, coupling):
+        """Map coupling values from the history mode axis back to instance nodes."""
+        return self._unfold(coupling)
+
+    def _history_state(self, state):
+        """Map the state of all instances to the history mode axis."""
+        return self._fold(state)
+
+    def _loop_update_stimulus(self, step, stimulus):
+        """Update stimulus values for current time step, for all instances."""
+        if self.stimulus is not None:
+            stim_step = step - (self.current_step + 1)
+            pattern = numpy.tile(self.stimulus(stim_step).reshape((-1, )), self.n_instances)
+            stimulus[self.model.cvar, :, :] = pattern.reshape((1, -1, 1))
+
+    def _unfold_output(self, output):
+        """Reshape monitor samples to (n_instances, n_voi, n_node, n_mode)."""
+        if output is not None:
+            n_inst = self.n_instances
+            for i, sample in enumerate(output):
+                if sample is not None:
+                    time, data = sample
+                    data = data.reshape((data.shape[0], n_inst, -1, data.shape[-1]))
+                    output[i] = [time, data.transpose((1, 0, 2, 3))]
+        return output
+
+    def _loop_monitor_output(self, step, state):
+        output = super(BatchedSimulator, self)._loop_monitor_output(step, state)
+        return self._unfold_output(output)
+
+    def _chunk_monitor_output(self, steps, states):
+        outputs = super(BatchedSimulator, self)._chunk_monitor_output(steps, states)
+        return [self._unfold_output(output) for output in outputs]
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Calibrated cost model of simulations. Short micro-benchmarks of the configured
+components of a simulator (coupling, integration scheme and model dfun, history
+update, observation and each monitor), or of blocks of steps for the fused,
+chunked and instantaneous loops, are run on the current machine, cached per
+host, and used to predict the wall time and peak memory of a simulation.
+
+"""
+
+import os
+import copy
+import json
+import time
+import socket
+import tracemalloc
+import numpy
+import scipy.sparse
+from tvb.basic.profile import TvbProfile
+from .common import get_logger
+
+LOG = get_logger(__name__)
+
+
+class Estimate(float):
+    "An estimated value, with lower and upper bounds in attributes lo and hi."
+
+    def __new__(cls, value, lo, hi):
+        estimate = float.__new__(cls, value)
+        estimate.lo = float(lo)
+        estimate.hi = float(hi)
+        return estimate
+
+    def __repr__(self):
+        return '%g [%g, %g]' % (self, self.lo, self.hi)
+
+
+def _time_calls(func, args_list):
+    "Time one call of func per args in args_list, returning the array of times."
+    times = []
+    for args in args_list:
+        tic = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - tic)
+    return numpy.array(times)
+
+
+def _sampling_step(monitor, step, rate):
+    "First step at or after step at which monitor, sampling at given rate per step, returns a sample."
+    if rate > 0.0:
+        for step_ in range(step, step + int(2 / rate) + 1):
+            if monitor.number_of_samples(step_ - 1, 1):
+                return step_
+    return step
+
+
+def signature(simulator):
+    "Identifies the configured components, sizes and loop settings which the calibration depends on."
+    history = simulator.history
+    parts = [type(simulator.model).__name__, type(simulator.coupling).__name__,
+             type(simulator.integrator).__name__, 'surface' if simulator.surface is not None else 'region',
+             'node%d' % simulator.number_of_nodes, 'nvar%d' % simulator.model.nvar,
+             'mode%d' % simulator.model.number_of_modes, 'nnz%d' % history.n_nnzw, 'time%d' % history.n_time,
+             type(history).__name__, simulator.backend, simulator.dtype.name,
+             'chunk%d-%d' % (simulator.chunk_size, simulator._chunk_steps()), simulator.layout, 'stage%d' % simulator.stage_coupling]
+    parts += ['%s%g' % (type(monitor).__name__, monitor.period) for monitor in simulator.monitors]
+    return '-'.join(parts)
+
+
+def _runs_per_step(simulator):
+    "Whether the simulator runs the NumPy loop which advances one step per iteration."
+    sim = simulator
+    return sim._numba_backend is None and not sim._instantaneous_coupling() and sim._chunk_steps() <= 1
+
+
+def _measure_steps(sim, n_repeat):
+    """
+    Benchmark the components of the per step NumPy loop, on copies or with state
+    restored, returning their times and the transient bytes of a step.
+
+    """
+    step = sim.current_step + 1
+    state = sim.current_state
+    local_coupling = sim._prepare_local_coupling()
+    stimulus = sim._prepare_stimulus()
+    integrator = copy.deepcopy(sim.integrator)
+    node_coupling = sim._loop_compute_node_coupling(step)
+    observed = sim.model.observe(state)
+    history_state = sim._history_state(state)
+    time_idx = step % sim.history.n_time
+    saved_slot = sim.history.buffer[time_idx].copy()
+
+    def update_history():
+        sim.history.update(step, history_state)
+        sim.history.buffer[time_idx] = saved_slot
+
+    repeat = [()] * n_repeat
+    costs = {
+        'coupling': _time_calls(lambda: sim._loop_compute_node_coupling(step), repeat),
+        'scheme': _time_calls(lambda: integrator.scheme(state.copy(), sim.model.dfun, node_coupling,
+                                                        local_coupling, stimulus), repeat),
+        'history': _time_calls(update_history, repeat),
+        'observe': _time_calls(lambda: sim.model.observe(state), repeat),
+    }
+    for i, monitor in enumerate(sim.monitors):
+        # cost of sampling and non-sampling steps, weighted by the sampling rate
+        monitor = copy.deepcopy(monitor)
+        rate = monitor.number_of_samples(0, 10 ** 6) * 1e-6
+        sample_step = _sampling_step(monitor, step, rate)
+        sample = _time_calls(monitor.record, [(sample_step, observed)] * n_repeat)
+        other = _time_calls(monitor.record, [(sample_step + 1, observed)] * n_repeat)
+        costs['monitor%d_%s' % (i, type(monitor).__name__)] = rate * sample + (1 - rate) * other
+
+    def one_step():
+        next_state = integrator.scheme(state.copy(), sim.model.dfun, sim._loop_compute_node_coupling(step),
+                                       local_coupling, stimulus)
+        for monitor in sim.monitors:
+            copy.deepcopy(monitor).record(step, sim.model.observe(next_state))
+    return costs, _transient_bytes(one_step)
+
+
+def _measure_loop(sim, n_repeat):
+    """
+    Benchmark the simulation loop as run by the simulator, i.e. the fused kernel of the
+    numba backend, chunks or coupling from the current state, by advancing blocks of
+    steps and restoring the simulator's state afterwards. Returns the per step times
+    of the loop and the transient bytes of a block.
+
+    """
+    saved = dict((key, numpy.array(value)) for key, value in sim._checkpoint_state().items())
+    simulation_length, calls = sim.simulation_length, sim.calls
+    n_step = max(sim._chunk_steps(), 10)
+
+    def advance():
+        start = sim.current_step
+        for _ in sim(simulation_length=n_step * sim.integrator.dt):
+            pass
+        return sim.current_step - start
+
+    try:
+        # a first block compiles the kernels of the numba backend
+        advance()
+        times = []
+        for _ in range(n_repeat):
+            tic = time.perf_counter()
+            n_advanced = advance()
+            times.append((time.perf_counter() - tic) / n_advanced)
+        transient_bytes = _transient_bytes(advance)
+    finally:
+        sim._restore_state(saved)
+        sim.simulation_length, sim.calls = simulation_length, calls
+    return {'loop': numpy.array(times)}, transient_bytes
+
+
+def _transient_bytes(func):
+    "Peak memory allocated by a call of func, on top of the memory allocated before."
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    transient_bytes = tracemalloc.get_traced_memory()[1] - before
+    if started:
+        tracemalloc.stop()
+    return transient_bytes
+
+
+class Calibration(object):
+    """
+    Per step costs of the components of a simulator, as mean, min and max times in
+    seconds, with the static and transient memory of the simulation in bytes.
+
+    """
+
+    def __init__(self, costs, static_bytes, transient_bytes):
+        self.costs = costs
+        self.static_bytes = static_bytes
+        self.transient_bytes = transient_bytes
+
+    @classmethod
+    def measure(cls, simulator, n_repeat=20):
+        """
+        Benchmark a configured simulator, on copies or with state restored such that
+        the simulator itself is unaffected. The components of the NumPy loop are timed
+        separately when it advances one step at a time, otherwise blocks of steps of
+        the loop the simulator runs are timed as a whole.
+
+        """
+        sim = simulator
+        if _runs_per_step(sim):
+            costs, transient_bytes = _measure_steps(sim, n_repeat)
+        else:
+            costs, transient_bytes = _measure_loop(sim, n_repeat)
+        costs = dict((name, (float(times.mean()), float(times.min()), float(times.max())))
+                     for name, times in costs.items())
+
+        state = sim.current_state
+        local_coupling = sim._prepare_local_coupling()
+        static_bytes = sim.history.nbytes + 2 * state.nbytes
+        for monitor in sim.monitors:
+            static_bytes += sum(array.nbytes for array in monitor.get_state().values()
+                                if isinstance(array, numpy.ndarray))
+            if hasattr(monitor, 'gain'):
+                static_bytes += monitor.gain.nbytes
+        if scipy.sparse.issparse(local_coupling):
+            static_bytes += local_coupling.data.nbytes + local_coupling.indices.nbytes + local_coupling.indptr.nbytes
+        return cls(costs, int(static_bytes), int(transient_bytes))
+
+    def runtime(self, n_steps):
+        "Estimated wall time in seconds of n_steps steps, bounded by the fastest and slowest calls measured."
+        mean, lo, hi = numpy.sum(list(self.costs.values()), axis=0)
+        return Estimate(n_steps * mean, n_steps * lo, n_steps * hi)
+
+    def memory(self):
+        "Estimated peak memory in bytes of the simulation's arrays, bounded by the static arrays and twice the transient."
+        return Estimate(self.static_bytes + self.transient_bytes, self.static_bytes,
+                        self.static_bytes + 2 * self.transient_bytes)
+
+    def to_dict(self):
+        return {'costs': self.costs, 'static_bytes': self.static_bytes, 'transient_bytes': self.transient_bytes}
+
+    @classmethod
+    def from_dict(cls, data):
+        costs = dict((name, tuple(cost)) for name, cost in data['costs'].items())
+        return cls(costs, data['static_bytes'], data['transient_bytes'])
+
+
+def cache_path(cache_dir=None):
+    "Path of the calibration cache of the current host."
+    if cache_dir is None:
+        cache_dir = os.path.join(TvbProfile.current.TVB_STORAGE, 'calibration')
+    return os.path.join(cache_dir, '%s.json' % socket.gethostname())
+
+
+def calibrate(simulator, cache_dir=None, n_repeat=20, refresh=False):
+    """
+    Return the Calibration of a configured simulator, measuring it unless the cache
+    of the current host holds one for the same components and sizes.
+
+    """
+    path = cache_path(cache_dir)
+    key = signature(simulator)
+    cache = {}
+    if os.path.exists(path):
+        with open(path) as fd:
+            cache = json.load(fd)
+    if key in cache and not refresh:
+        LOG.debug('using cached calibration %s from %s', key, path)
+        return Calibration.from_dict(cache[key])
+    calibration = Calibration.measure(simulator, n_repeat=n_repeat)
+    cache[key] = calibration.to_dict()
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as fd:
+        json.dump(cache, fd, indent=2)
+    LOG.info('calibrated %s, cached in %s', key, path)
+    return calibration
@@ -38,6 +38,7 @@ A module of classes and functions of common use.
 """
 
 import numpy
+import scipy.sparse
 import os
 import re
 import six
@@ -125,6 +126,51 @@ except ImportError:
     psutil = None
 
 
+class RegionOperator(object):
+    """
+    Precomputed sparse operator between nodes, e.g. surface vertices, and the regions
+    they map to, for summing and averaging node values within regions and broadcasting
+    region values to nodes, along a given axis of arrays.
+
+    >>> op = RegionOperator(numpy.r_[0, 0, 1])
+    >>> op.average(numpy.r_[1.0, 3.0, 5.0], axis=0)
+    array([2., 5.])
+    >>> op.broadcast(numpy.r_[2.0, 5.0], axis=0)
+    array([2., 2., 5.])
+
+    """
+
+    def __init__(self, region_map, n_region=None, dtype=numpy.float64):
+        self.region_map = region_map = numpy.asarray(region_map)
+        self.n_node = region_map.size
+        self.n_region = n_region = n_region or int(region_map.max()) + 1
+        self.nodes_per_region = numpy.bincount(region_map, minlength=n_region)
+        nodes = numpy.r_[:self.n_node]
+        self.sum_matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(self.n_node), (region_map, nodes)), shape=(n_region, self.n_node), dtype=dtype)
+        self.mean_matrix = scipy.sparse.csr_matrix(
+            (1.0 / self.nodes_per_region[region_map], (region_map, nodes)), shape=(n_region, self.n_node),
+            dtype=dtype)
+
+    @staticmethod
+    def _apply(matrix, x, axis):
+        x = numpy.moveaxis(x, axis, 0)
+        y = matrix.dot(x.reshape((x.shape[0], -1)))
+        return numpy.moveaxis(y.reshape((-1, ) + x.shape[1:]), 0, axis)
+
+    def sum(self, x, axis=0):
+        "Sum node values of x within each region, along given axis."
+        return self._apply(self.sum_matrix, x, axis)
+
+    def average(self, x, axis=0):
+        "Average node values of x within each region, along given axis."
+        return self._apply(self.mean_matrix, x, axis)
+
+    def broadcast(self, y, axis=0):
+        "Broadcast region values of y to their nodes, along given axis."
+        return numpy.take(y, self.region_map, axis=axis)
+
+
 class Struct(dict):
     """
     the Struct class is a dictionary with matlab/C struct-like access
@@ -181,6 +227,26 @@ def heaviside(array):
         return ret
 
 
+def empty_state(shape, dtype, layout='variable'):
+    """
+    Uninitialized array of shape (..., nvar, node, mode), stored with the state variables
+    outermost ('variable', i.e. C order) or with the state variables of each node
+    contiguous ('node', i.e. a (..., node, nvar, mode) C order array with its axes
+    swapped), the axes having the same meaning in both layouts.
+    """
+    if layout == 'node':
+        shape = tuple(shape)
+        return numpy.empty(shape[:-3] + (shape[-2], shape[-3], shape[-1]), dtype).swapaxes(-3, -2)
+    return numpy.empty(shape, dtype)
+
+
+def as_state_layout(array, layout='variable'):
+    "Array of shape (..., nvar, node, mode) stored in the given layout of `empty_state`, copied only if necessary."
+    if layout == 'node':
+        return numpy.ascontiguousarray(numpy.swapaxes(array, -3, -2)).swapaxes(-3, -2)
+    return numpy.ascontiguousarray(array)
+
+
 # FIXME: this may not work yet: write a numpy array subclass that takes care of this
 #         using indexing magic. makes our life easier.
 def unravel_history(history, horizon, step, arange=numpy.arange):
@@ -81,7 +81,11 @@ following:
 .. moduleauthor:: Paula Sanz Leon <Paula@tvb.invalid>
 
 """
+import os
+import math
+import concurrent.futures
 import numpy
+import scipy.sparse
 from tvb.basic.neotraits.api import HasTraits, NArray, Attr, Range
 from .history import SparseHistory
 from .common import simple_gen_astr
@@ -132,6 +136,93 @@ class Coupling(HasTraits):
         return gx
 
 
+_POOL = None
+
+
+def _pool():
+    "Thread pool shared by coupling engines, created on first use."
+    global _POOL
+    if _POOL is None:
+        _POOL = concurrent.futures.ThreadPoolExecutor(os.cpu_count())
+    return _POOL
+
+
+class DelayGroupedSum(object):
+    """
+    Weighted sum over afferents of the delayed states of sparse histories with the
+    weights and delays of `history`. The weights
+    form one CSR block per distinct delay, stacked horizontally, such that the sum is
+    a sparse matrix product against the stacked time slices of those delays. Rows are
+    split in `n_block` blocks of similar non-zero count, multiplied in parallel.
+
+    """
+
+    def __init__(self, history, n_block=None):
+        h = history # type: SparseHistory
+        # row major order, for the same sums whatever the layout of the history
+        order = h.nnz_row_order
+        self.delays, group = numpy.unique(h.nnz_idelays[order], return_inverse=True)
+        matrix = scipy.sparse.csr_matrix(
+            (h.nnz_weights[order], (h.nnz_row_el_idx[order], group * h.n_node + h.nnz_col_el_idx[order])),
+            shape=(h.n_node, len(self.delays) * h.n_node))
+        self.row_sums = numpy.asarray(matrix.sum(axis=1)).astype(h.nnz_weights.dtype)
+        n_block = min(n_block or os.cpu_count(), h.n_node)
+        bounds = numpy.searchsorted(matrix.indptr, numpy.linspace(0, matrix.nnz, n_block + 1))
+        bounds[0], bounds[-1] = 0, h.n_node
+        self.blocks = [(slice(lo, hi), matrix[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+    def __call__(self, history, step):
+        h = history # type: SparseHistory
+        return self.dot(h.buffer.take((step - 1 - self.delays) % h.n_time, axis=0))
+
+    def dot(self, slices):
+        "Weighted sum of `slices`, the (n_delay, n_cvar, n_node, n_mode) states of each delay."
+        n_delay, n_cvar, n_node, n_mode = slices.shape
+        x = slices.transpose((0, 2, 1, 3)).reshape((-1, n_cvar * n_mode))
+        out = numpy.empty((n_node, x.shape[1]), x.dtype)
+
+        def product(block):
+            rows, matrix = block
+            out[rows] = matrix.dot(x)
+
+        if len(self.blocks) > 1:
+            list(_pool().map(product, self.blocks))
+        else:
+            product(self.blocks[0])
+        return out.reshape((n_node, n_cvar, n_mode)).transpose((1, 0, 2))
+
+
+class SourceDelayPairs(object):
+    """
+    Distinct (source, delay) pairs of the non-zero weights of a history. The weights form a
+    CSR matrix from pairs to target nodes, such that terms which only depend on the delayed
+    source state are evaluated once per pair, and summed with a sparse matrix product.
+
+    """
+
+    def __init__(self, history):
+        h = history # type: SparseHistory
+        key = h.nnz_idelays.astype(numpy.int64) * h.n_node + h.nnz_col_el_idx
+        _, self.first, pair = numpy.unique(key, return_index=True, return_inverse=True)
+        self.n_pair = len(self.first)
+        self.delays, self.cols = h.nnz_idelays[self.first], h.nnz_col_el_idx[self.first]
+        order = h.nnz_row_order
+        self.matrix = scipy.sparse.csr_matrix(
+            (h.nnz_weights[order], (h.nnz_row_el_idx[order], pair[order])), shape=(h.n_node, self.n_pair))
+
+    def query(self, history, step):
+        "Delayed state of each pair for `step`, of shape (n_cvar, n_pair, n_mode)."
+        h = history # type: SparseHistory
+        return h.buffer[(step - 1 - self.delays) % h.n_time, :, self.cols].transpose((1, 0, 2))
+
+    def dot(self, x_p):
+        "Weighted sum of `x_p`, the (n_cvar, n_pair, n_mode) values of each pair."
+        n_cvar, _, n_mode = x_p.shape
+        x = x_p.transpose((1, 0, 2)).reshape((self.n_pair, n_cvar * n_mode))
+        out = self.matrix.dot(x).astype(x.dtype, copy=False)
+        return out.reshape((-1, n_cvar, n_mode)).transpose((1, 0, 2))
+
+
 class SparseCoupling(Coupling):
     """
     A coupling implementation which takes advantage of a sparse weights structure to reduce the
@@ -139,34 +230,129 @@ class SparseCoupling(Coupling):
 
     """
 
-    def _lri(self, nnz_row_el_idx):
-        "Flat array of indices afferent, non-zero-weight connections."
-        if not hasattr(self, '_cached_lri'):
-            rows = numpy.r_[-1, nnz_row_el_idx]
-            self._cached_lri, = numpy.argwhere(numpy.diff(rows)).T
-            self._cached_nzr = numpy.unique(nnz_row_el_idx)
-            self.log.debug('lri.size %d nzr.size %d', self._cached_lri.size, self._cached_nzr.size)
-        return self._cached_lri, self._cached_nzr
+    def _row_sum(self, history, values, out):
+        """
+        Sum `values` of the non-zero weights, of shape (n_cvar, n_nnzw, n_mode), over the afferents
+        of each node into `out`, in row major order whatever the order of the history's non-zero
+        weights, such that layouts keeping them in another order give the same sums.
+
+        """
+        h = history # type: SparseHistory
+
+        def build():
+            indptr = numpy.r_[0, numpy.cumsum(numpy.bincount(h.nnz_row_el_idx, minlength=h.n_node))]
+            ones = numpy.ones(h.n_nnzw, numpy.result_type(h.nnz_weights, h.buffer))
+            return scipy.sparse.csr_matrix((ones, h.nnz_row_order, indptr), shape=(h.n_node, h.n_nnzw))
+
+        rows = h.derived('row_sum', build)
+        n_cvar, _, n_mode = values.shape
+        summed = rows.dot(values.transpose((1, 0, 2)).reshape((h.n_nnzw, n_cvar * n_mode)))
+        out[:] = summed.reshape((h.n_node, n_cvar, n_mode)).transpose((1, 0, 2))
+        return out
+
+    # pre is linear in x_j, and _sum_linear_pre gives its sum from the weighted sum of x_j
+    _linear_pre = False
+
+    def _sum_linear_pre(self, x_i, summed, row_sums):
+        return summed
+
+    def delay_grouped_sum(self, history):
+        """
+        Engine summing linear pre terms over delay groups of `history`, if expected to be
+        faster than evaluating each non-zero weight, i.e. with few distinct delays, else None.
+
+        """
+        h = history # type: SparseHistory
+
+        def build():
+            n_delay = len(numpy.unique(h.nnz_idelays))
+            faster = self._linear_pre and n_delay * h.n_node < h.n_nnzw
+            return DelayGroupedSum(h) if faster else None
+
+        return h.derived(('delay_grouped_sum', self._linear_pre), build)
+
+    # coupling may be evaluated per distinct (source, delay) pair with evaluate_pairs
+    _pairs = False
+
+    def _pairs_faster(self, history, n_pair):
+        "Whether evaluating per pair is expected to be faster than per non-zero weight."
+        return 2 * n_pair < history.n_nnzw
+
+    def source_delay_pairs(self, history):
+        """
+        Distinct (source, delay) pairs of `history`, if evaluating pre terms per pair is expected
+        to be faster than per non-zero weight, i.e. with few distinct delays, else None.
+
+        """
+        if not self._pairs:
+            return None
+
+        def build():
+            pairs = SourceDelayPairs(history)
+            return pairs if self._pairs_faster(history, pairs.n_pair) else None
+
+        return history.derived(('source_delay_pairs', type(self)), build)
+
+    def evaluate_pairs(self, history, x_i, x_p):
+        """
+        Evaluate coupling from current state `x_i` and delayed state `x_p` of the distinct
+        (source, delay) pairs of `history`, for pre terms depending on x_j only.
+
+        """
+        pairs = self.source_delay_pairs(history)
+        return self.post(pairs.dot(self.pre(None, x_p)))
+
+    def evaluate_grouped(self, history, step, x_i):
+        "Evaluate coupling of `step` from current state `x_i` with the delay grouped sum."
+        engine = self.delay_grouped_sum(history)
+        return self.post(self._sum_linear_pre(x_i, engine(history, step), engine.row_sums))
+
+    def evaluate_instantaneous(self, history, x_i):
+        """
+        Evaluate coupling from the current state `x_i` alone, for histories whose delays are
+        all zero, with a sparse matrix product if pre is linear.
+
+        """
+        if not self._linear_pre:
+            return self.evaluate(history, x_i, x_i[:, history.nnz_col_el_idx])
+        engine = history.derived('instantaneous_sum', lambda: DelayGroupedSum(history))
+        return self.post(self._sum_linear_pre(x_i, engine.dot(x_i[numpy.newaxis]), engine.row_sums))
 
     def __call__(self, step, history):
+        if self.delay_grouped_sum(history) is not None:
+            return self.evaluate_grouped(history, step, history.buffer[(step - 1) % history.n_time])
+        pairs = self.source_delay_pairs(history)
+        if pairs is not None:
+            x_i = history.buffer[(step - 1) % history.n_time]
+            return self.evaluate_pairs(history, x_i, pairs.query(history, step))
+        x_i, x_j = history.query_sparse(step)
+        return self.evaluate(history, x_i, x_j)
+
+    def evaluate(self, history, x_i, x_j):
+        """
+        Evaluate coupling from current state `x_i` and delayed afferent state `x_j` of the
+        non-zero weights of `history`, e.g. as returned by `SparseHistory.query_sparse`.
+
+        """
         h = history # type: SparseHistory
-        x_i, x_j = h.query_sparse(step)
         assert x_i.shape == (h.n_cvar, h.n_node, h.n_mode)
         assert x_j.shape == (h.n_cvar, h.n_nnzw, h.n_mode)
         #                              ^ from (columns)
 
+        pairs = self.source_delay_pairs(h)
+        if pairs is not None:
+            return self.evaluate_pairs(h, x_i, x_j[:, pairs.first])
+
         sum = numpy.zeros_like(x_i)
         x_i = x_i[:, h.nnz_row_el_idx]
         assert x_i.shape == (h.n_cvar, h.n_nnzw, h.n_mode)
         #                              ^ to (rows)
 
         pre = self.pre(x_i, x_j)
-        assert pre.shape == (h.n_cvar, h.n_nnzw, h.n_mode)
+        assert pre.shape[1:] == (h.n_nnzw, h.n_mode)
 
         weights_col = h.nnz_weights.reshape((h.n_nnzw, 1))
-        lri, nzr = self._lri(h.nnz_row_el_idx)
-        sum[:, nzr] = numpy.add.reduceat(weights_col * pre, lri, axis=1)
-        return self.post(sum)
+        return self.post(self._row_sum(h, weights_col * pre, sum))
 
 
 class Linear(SparseCoupling):
@@ -191,6 +377,10 @@ class Linear(SparseCoupling):
         doc="Shifts the base of the connection strength while maintaining "
             "the absolute difference between different values.")
 
+    _linear_pre = True
+
+    pre_expr, post_expr = 'x_j', 'a * gx + b'
+
     def post(self, gx):
         return self.a * gx + self.b
 
@@ -215,6 +405,10 @@ class Scaling(SparseCoupling):
             "the ratio between different values."
     )
 
+    _linear_pre = True
+
+    pre_expr, post_expr = 'x_j', 'a * gx'
+
     def post(self, gx):
         return self.a * gx
 
@@ -258,6 +452,10 @@ class HyperbolicTangent(SparseCoupling):
         domain=Range(lo=0.01, hi=1000.0, step=10.0),
         doc="Standard deviation of the coupling")
 
+    _pairs = True
+
+    pre_expr, post_expr = 'a * (1 + tanh((b * x_j - midpoint) / sigma))', 'gx'
+
     def pre(self, x_i, x_j):
         return self.a * (1 +  numpy.tanh((self.b * x_j - self.midpoint) / self.sigma))
 
@@ -265,7 +463,7 @@ class HyperbolicTangent(SparseCoupling):
         return simple_gen_astr(self, 'a b midpoint sigma')
 
 
-class Sigmoidal(Coupling):
+class Sigmoidal(SparseCoupling):
     r"""
     Provides a sigmoidal coupling function of the form
 
@@ -309,6 +507,8 @@ class Sigmoidal(Coupling):
         domain=Range(lo=0.01, hi=1000.0, step=10.0),
         doc="Standard deviation of the sigmoidal",)
 
+    pre_expr, post_expr = 'x_j', 'cmin + (cmax - cmin) / (1.0 + exp(-a * ((gx - midpoint) / sigma)))'
+
     def __str__(self):
         return simple_gen_astr(self, 'cmin cmax midpoint a sigma')
 
@@ -316,7 +516,7 @@ class Sigmoidal(Coupling):
         return self.cmin + ((self.cmax - self.cmin) / (1.0 + numpy.exp(-self.a *((gx - self.midpoint) / self.sigma))))
 
 
-class SigmoidalJansenRit(Coupling):
+class SigmoidalJansenRit(SparseCoupling):
     r"""
     Provides a sigmoidal coupling function as described in the 
     Jansen and Rit model, of the following form
@@ -362,14 +562,14 @@ class SigmoidalJansenRit(Coupling):
         return simple_gen_astr(self, 'cmin cmax midpoint a r')
 
     def pre(self, x_i, x_j):
-        pre = self.cmax / (1.0 + numpy.exp(self.r * (self.midpoint - (x_j[:, 0] - x_j[:, 1]))))
-        return pre[:, numpy.newaxis]
+        pre = self.cmax / (1.0 + numpy.exp(self.r * (self.midpoint - (x_j[0] - x_j[1]))))
+        return pre[numpy.newaxis]
 
     def post(self, gx):
         return self.a * gx
 
 
-class PreSigmoidal(Coupling):
+class PreSigmoidal(SparseCoupling):
     r"""
     Provides a pre-summation sigmoidal coupling function with a static or dynamic
     and local or global threshold.
@@ -427,29 +627,57 @@ class PreSigmoidal(Coupling):
     def __str__(self):
         return simple_gen_astr(self, 'H Q G P theta dynamic globalT')
 
-    def configure(self):
-        """Set the right indirect call."""
-        super(PreSigmoidal, self).configure()
-        self.sliceT = 0 if self.globalT else slice(None)
+    def _transpose_idx(self, history):
+        "Index of the transposed connection of each non-zero weight, or -1 if its weight is zero."
+        h = history # type: SparseHistory
 
-    # override __call__ directly simpler than pre/post form
-    # TODO check use of arrays dims here
-    def __call__(self, step, history, na=numpy.newaxis):
-        g_ij = history.es_weights
-        x_i, x_j = history.query(step)
-        if self.dynamic:
-            _ = (self.P * x_j[:,0] - x_j[:,1,self.sliceT])[:,na]
-        else:
-            _ = self.P * x_j - self.theta[self.sliceT,na]
-        A_j = self.H * (self.Q + numpy.tanh(self.G * _))
+        def build():
+            order = h.nnz_row_order
+            flat = h.nnz_row_el_idx * h.n_node + h.nnz_col_el_idx
+            flat_t = h.nnz_col_el_idx * h.n_node + h.nnz_row_el_idx
+            idx = order[numpy.searchsorted(flat[order], flat_t).clip(0, h.n_nnzw - 1)]
+            return numpy.where(flat[idx] == flat_t, idx, -1)
+
+        return h.derived('transpose_idx', build)
+
+    def _output(self, x):
+        return self.H * (self.Q + numpy.tanh(self.G * x))
+
+    def evaluate(self, history, x_i, x_j):
+        """
+        Evaluate from the delayed state `x_j` of the non-zero weights. As in the dense form
+        of this coupling, connections with zero weight contribute a delayed state of zero.
+
+        """
+        h = history # type: SparseHistory
+        rows, cols, weights = h.nnz_row_el_idx, h.nnz_col_el_idx, h.nnz_weights.reshape((-1, 1))
         if self.dynamic:
-            c_0 = (g_ij[:,0] * A_j[:,0]).sum(axis=0)
-            c_1 = numpy.diag(A_j[:,0,:,0])[:, na]
+            # per node delayed state of self connections
+            diag = rows == cols
+            x_ii = numpy.zeros((2, h.n_node, h.n_mode), x_j.dtype)
+            x_ii[:, rows[diag]] = x_j[:, diag]
+            if self.globalT:
+                # threshold of the first node, as delayed to each node
+                theta = numpy.zeros((h.n_node, h.n_mode), x_j.dtype)
+                theta[rows[cols == 0]] = x_j[1, cols == 0]
+                theta_j, theta_ii = theta[cols], theta
+            else:
+                theta_j, theta_ii = x_j[1], x_ii[1]
+            # summed over efferent connections of each node
+            c_0 = numpy.zeros((h.n_node, h.n_mode), x_j.dtype)
+            numpy.add.at(c_0, cols, weights * self._output(self.P * x_j[0] - theta_j))
+            c_1 = self._output(self.P * x_ii[0] - theta_ii)[:, :1]
             if self.globalT:
                 c_1[:] = c_1.mean()
             return numpy.array([c_0, c_1])
         else: # static threshold
-            return (g_ij.transpose((2, 1, 0, 3)) * A_j).sum(axis=0)
+            # weights pair with the delayed state of the transposed connection
+            idx = self._transpose_idx(h)
+            x_t = numpy.where((idx >= 0)[:, numpy.newaxis], x_j[:, idx], 0.0)
+            theta = self.theta[rows] if self.theta.size > 1 and not self.globalT else self.theta[0]
+            theta = numpy.reshape(theta, (-1, 1))
+            pre = self._output(self.P * x_t - theta)
+            return self._row_sum(h, weights * pre, numpy.zeros_like(x_i))
 
 
 class Difference(SparseCoupling):
@@ -472,6 +700,13 @@ class Difference(SparseCoupling):
     def __str__(self):
         return simple_gen_astr(self, 'a')
 
+    _linear_pre = True
+
+    pre_expr, post_expr = 'x_j - x_i', 'a * gx'
+
+    def _sum_linear_pre(self, x_i, summed, row_sums):
+        return summed - row_sums * x_i
+
     def pre(self, x_i, x_j):
         return x_j - x_i
 
@@ -496,8 +731,127 @@ class Kuramoto(SparseCoupling):
     def __str__(self):
         return simple_gen_astr(self, 'a')
 
+    def _pairs_faster(self, history, n_pair):
+        # sin and cos per pair and per node, against sin per non-zero weight
+        return 2 * (n_pair + history.n_node) < history.n_nnzw
+
+    _pairs = True
+
+    pre_expr, post_expr = 'sin(x_j - x_i)', 'a / n_cvar * gx'
+
+    def evaluate_pairs(self, history, x_i, x_p):
+        r"""
+        Evaluate as :math:`\cos x_i \sum_j G_{ij} \sin x_j - \sin x_i \sum_j G_{ij} \cos x_j`,
+        such that transcendental functions are evaluated per pair and per node rather than
+        per non-zero weight.
+
+        """
+        pairs = self.source_delay_pairs(history)
+        gx = numpy.cos(x_i) * pairs.dot(numpy.sin(x_p)) - numpy.sin(x_i) * pairs.dot(numpy.cos(x_p))
+        return self.post(gx)
+
     def pre(self, x_i, x_j):
         return numpy.sin(x_j - x_i)
 
     def post(self, gx):
         return self.a / gx.shape[0] * gx
+
+
+# math functions available to expressions, with their NumPy equivalents
+_MATH_NUMPY = {'asin': 'arcsin', 'acos': 'arccos', 'atan': 'arctan', 'atan2': 'arctan2', 'asinh': 'arcsinh',
+               'acosh': 'arccosh', 'atanh': 'arctanh', 'pow': 'power'}
+_NUMPY_NAMESPACE = {name: getattr(numpy, _MATH_NUMPY.get(name, name)) for name in dir(math)
+                    if not name.startswith('_') and hasattr(numpy, _MATH_NUMPY.get(name, name))}
+
+
+class Expression(SparseCoupling):
+    r"""
+    Provides a coupling function declared by pre- and post-summation expressions
+
+    .. math::
+        post\left(\sum_j G_{ij} pre(x_i, x_j)\right)
+
+    where `pre_expr` is a function of the current state ``x_i`` and delayed state ``x_j``,
+    and `post_expr` a function of the summed afferents ``gx``. Expressions may refer to the
+    parameters by name, to the number of coupling variables ``n_cvar`` and to the functions
+    and constants of the `math` module. The delayed coupling is compiled with Numba into a
+    kernel which gathers, applies pre, sums and applies post in a single pass, without
+    temporary arrays.
+
+    Built-in couplings with `pre_expr` and `post_expr` are converted with `from_coupling`.
+
+    """
+
+    pre_expr = Attr(
+        field_type=str,
+        label="Pre-summation expression",
+        default="x_j",
+        doc="Expression of the current state x_i and delayed state x_j, applied to each afferent.")
+
+    post_expr = Attr(
+        field_type=str,
+        label="Post-summation expression",
+        default="gx",
+        doc="Expression of the weighted sum of afferents gx.")
+
+    parameters = Attr(
+        field_type=dict,
+        label="Parameters",
+        default=lambda: {},
+        doc="Values of the parameters of the expressions, by name, either scalar or per mode.")
+
+    @classmethod
+    def from_coupling(cls, coupling):
+        "Equivalent expression coupling of a coupling declaring `pre_expr` and `post_expr`."
+        names = [name for name in type(coupling).declarative_attrs if name != 'gid']
+        return cls(pre_expr=coupling.pre_expr, post_expr=coupling.post_expr,
+                   parameters={name: getattr(coupling, name) for name in names})
+
+    def __str__(self):
+        return 'Expression(pre_expr=%r, post_expr=%r)' % (self.pre_expr, self.post_expr)
+
+    def _eval(self, expr, **variables):
+        namespace = dict(_NUMPY_NAMESPACE)
+        namespace.update(self.parameters)
+        namespace.update(variables)
+        return eval(expr, namespace)
+
+    def pre(self, x_i, x_j):
+        return self._eval(self.pre_expr, x_i=x_i, x_j=x_j, n_cvar=x_j.shape[0])
+
+    def post(self, gx):
+        return self._eval(self.post_expr, gx=gx, n_cvar=gx.shape[0])
+
+    def _kernel(self, history):
+        "Compiled kernel with its CSR connectivity and per mode parameters, or None if not applicable."
+        h = history # type: SparseHistory
+        key = self.pre_expr, self.post_expr, tuple(sorted(self.parameters))
+        if getattr(self, '_cached_kernel_key', None) != key:
+            from ._numba.coupling import cpu_expr_cfun
+            self._cached_kernel_key = key
+            self._cached_kernel = cpu_expr_cfun(self.pre_expr, self.post_expr, key[2])
+
+        def csr():
+            order = h.nnz_row_order
+            indptr = numpy.r_[0, numpy.cumsum(numpy.bincount(h.nnz_row_el_idx, minlength=h.n_node))]
+            return indptr, h.nnz_col_el_idx[order].astype(numpy.intp), h.nnz_weights[order], h.nnz_idelays[order]
+
+        parameters = []
+        for name in self._cached_kernel_key[2]:
+            value = numpy.asarray(self.parameters[name]).reshape((-1, ))
+            if value.dtype.kind != 'f':
+                value = value.astype(float)
+            if value.size not in (1, h.n_mode):
+                return None
+            parameters.append(numpy.ascontiguousarray(numpy.broadcast_to(value, (h.n_mode, ))))
+        return self._cached_kernel, h.derived('csr', csr), parameters
+
+    def __call__(self, step, history):
+        kernel = self._kernel(history)
+        if kernel is None:
+            return super(Expression, self).__call__(step, history)
+        cfun, csr, parameters = kernel
+        h = history # type: SparseHistory
+        out = numpy.empty((h.n_cvar, h.n_node, h.n_mode), numpy.result_type(h.buffer.dtype, *parameters))
+        cfun(step, h.buffer, *(csr + (out, ) + tuple(parameters)))
+        return out
@@ -72,12 +72,14 @@ class NDArray(StaticAttr):
 
     State = collections.namedtuple('State', 'array initialized')
 
-    shape, dtype, read_only, instance_state = (), None, True, {}
+    shape, dtype, read_only, order, instance_state = (), None, True, None, {}
 
-    def __init__(self, shape, dtype, read_only=True):
+    def __init__(self, shape, dtype, read_only=True, order=None):
         self.shape = shape # may have strings which eval in owner ns
         self.dtype = dtype
         self.read_only = read_only
+        # axes in memory order, outermost first, or the owner attribute holding them; C order if None
+        self.order = order
         self.instance_state = weakref.WeakKeyDictionary()
 
     def _make_array(self, instance):
@@ -93,7 +95,13 @@ class NDArray(StaticAttr):
             else:
                 raise TypeError('expect int, str but found %r' % (type(dim), ))
             shape.append(dim)
-        array = numpy.empty(shape, self.dtype)
+        order = self.order
+        if isinstance(order, str):
+            order = getattr(instance, order)
+        if order is None:
+            array = numpy.empty(shape, self.dtype)
+        else:
+            array = numpy.empty([shape[axis] for axis in order], self.dtype).transpose(numpy.argsort(order))
         if self.read_only and hasattr(array, 'setflags'):
             array.setflags(write=False)
         return array
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Runs ensembles of independent simulations, e.g. over seeds or parameter grids,
+across a pool of worker processes. Large arrays of the template simulator, such
+as connectivity weights and tract lengths, local connectivity matrices or
+projection gains, are placed once in shared memory and are not pickled per task.
+
+Overrides are dicts mapping dotted attribute paths of the simulator to values,
+e.g. ``{'coupling.a': numpy.r_[0.02], 'model.I': numpy.r_[0.5]}``::
+
+    ensemble = Ensemble(simulator=sim, max_workers=64)
+    for result in ensemble.run(overrides=grid, seeds=range(len(grid))):
+        save(result.index, result.output)
+
+"""
+
+import io
+import copy
+import time
+import pickle
+import numpy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from .common import get_logger
+
+LOG = get_logger(__name__)
+
+
+class EnsembleResult(object):
+    "Output of one task of an ensemble, with the override and seed it was run with."
+
+    def __init__(self, index, override, seed, output, elapsed):
+        self.index = index
+        self.override = override
+        self.seed = seed
+        self.output = output
+        self.elapsed = elapsed
+
+
+class _SharedPickler(pickle.Pickler):
+    "Pickler moving large arrays to shared memory, replacing them by persistent ids."
+
+    def __init__(self, file, min_shared_bytes):
+        pickle.Pickler.__init__(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.min_shared_bytes = min_shared_bytes
+        self.blocks = []
+        self._ids = {}
+
+    def persistent_id(self, obj):
+        if type(obj) is not numpy.ndarray or obj.nbytes < self.min_shared_bytes or obj.dtype.hasobject:
+            return None
+        if id(obj) not in self._ids:
+            block = shared_memory.SharedMemory(create=True, size=max(obj.nbytes, 1))
+            numpy.ndarray(obj.shape, obj.dtype, buffer=block.buf)[...] = obj
+            self._ids[id(obj)] = len(self.blocks)
+            self.blocks.append((block, obj.shape, obj.dtype.str))
+        return self._ids[id(obj)]
+
+
+class _SharedUnpickler(pickle.Unpickler):
+    "Unpickler restoring persistent ids as read-only views of shared memory."
+
+    def __init__(self, file, specs):
+        pickle.Unpickler.__init__(self, file)
+        self.blocks = []
+        self.arrays = []
+        for name, shape, dtype in specs:
+            block = shared_memory.SharedMemory(name=name)
+            array = numpy.ndarray(shape, dtype, buffer=block.buf)
+            array.setflags(write=False)
+            self.blocks.append(block)
+            self.arrays.append(array)
+
+    def persistent_load(self, pid):
+        return self.arrays[pid]
+
+
+# state of worker processes, set by _init_worker
+_worker = {}
+
+
+def _init_worker(payload, specs):
+    unpickler = _SharedUnpickler(io.BytesIO(payload), specs)
+    _worker['template'] = unpickler.load()
+    _worker['blocks'] = unpickler.blocks
+    # shared arrays are not copied per task
+    _worker['memo'] = dict((id(array), array) for array in unpickler.arrays)
+
+
+def _set_path(obj, path, value):
+    "Set attribute given by dotted path, e.g. 'integrator.noise.nsig'."
+    names = path.split('.')
+    for name in names[:-1]:
+        obj = getattr(obj, name)
+    setattr(obj, names[-1], value)
+
+
+def _run_task(index, override, seed, run_kwds):
+    tic = time.time()
+    sim = copy.deepcopy(_worker['template'], dict(_worker['memo']))
+    for path, value in (override or {}).items():
+        _set_path(sim, path, value)
+    if seed is not None:
+        # random initial conditions and the noise stream
+        numpy.random.seed(seed)
+        noise = getattr(sim.integrator, 'noise', None)
+        if noise is not None:
+            noise.random_stream.seed(seed)
+            noise.noise_seed = seed
+    sim.configure()
+    output = sim.run(**run_kwds)
+    return EnsembleResult(index, override, seed, output, time.time() - tic)
+
+
+class Ensemble(object):
+    """
+    Runs copies of a template simulator with overrides and seeds across a fixed pool
+    of worker processes, yielding results as they complete.
+
+    """
+
+    def __init__(self, simulator, max_workers=None, min_shared_bytes=2 ** 12):
+        self.simulator = simulator
+        self.max_workers = max_workers
+        self.min_shared_bytes = min_shared_bytes
+
+    def run(self, overrides=None, seeds=None, **run_kwds):
+        """
+        Run one task per override and seed, which are broadcast against each other if
+        either is None or of length one. The remaining keyword arguments are passed to
+        each simulator's run method. Yields an EnsembleResult per task, in order of
+        completion.
+
+        """
+        overrides = [None] if overrides is None else list(overrides)
+        seeds = [None] if seeds is None else list(seeds)
+        n_task = max(len(overrides), len(seeds))
+        if len(overrides) == 1:
+            overrides = overrides * n_task
+        if len(seeds) == 1:
+            seeds = seeds * n_task
+        if len(overrides) != len(seeds):
+            raise ValueError("Got %d overrides but %d seeds." % (len(overrides), len(seeds)))
+
+        buf = io.BytesIO()
+        pickler = _SharedPickler(buf, self.min_shared_bytes)
+        try:
+            pickler.dump(self.simulator)
+            specs = [(block.name, shape, dtype) for block, shape, dtype in pickler.blocks]
+            LOG.info('ensemble of %d tasks shares %.2f MB, pickles %.2f MB per worker', n_task,
+                     sum(block.size for block, _, _ in pickler.blocks) * 2 ** -20, len(buf.getvalue()) * 2 ** -20)
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(buf.getvalue(), specs)) as executor:
+                futures = [executor.submit(_run_task, i, override, seed, run_kwds)
+                           for i, (override, seed) in enumerate(zip(overrides, seeds))]
+                try:
+                    for n_done, future in enumerate(as_completed(futures)):
+                        result = future.result()
+                        LOG.info('task %d done in %.3f s, %d/%d complete', result.index, result.elapsed,
+                                 n_done + 1, n_task)
+                        yield result
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            for block, _, _ in pickler.blocks:
+                block.close()
+                block.unlink()
@@ -37,6 +37,8 @@ Simulator history implementations.
 """
 
 
+import time
+import tempfile
 import numpy
 from tvb.simulator.common import get_logger
 from .descriptors import StaticAttr, Dim, NDArray
@@ -53,13 +55,17 @@ class BaseHistory(StaticAttr):
     delays = NDArray((n_node, n_node), 'f') # type: numpy.ndarray
     cvars = NDArray((n_cvar, ), 'i') # type: numpy.ndarray
 
+    # memory layout of the buffer's time slices, as in common.empty_state
+    state_layout = 'variable'
+
     @property
     def nbytes(self):
         arrays = 'weights delays cvars'.split()
         return sum([getattr(self, ary).nbytes for ary in arrays])
 
-    def __init__(self, weights, delays, cvars, n_mode):
+    def __init__(self, weights, delays, cvars, n_mode, state_layout='variable'):
         self.n_time, self.n_cvar, self.n_node, self.n_mode = delays.max() + 1, len(cvars), delays.shape[0], n_mode
+        self.state_layout = state_layout
         self.weights = weights
         self.delays = delays
         self.cvars = cvars
@@ -75,35 +81,46 @@ class BaseHistory(StaticAttr):
 
 
 class DenseHistory(BaseHistory):
-    "TVB's traditional history implementation."
-
-    # extended shape arrays for indexing
-    _es = 'n_node', 'n_cvar', 'n_node'
-    es_icvar = NDArray(_es, 'i')
-    es_idelays = NDArray(_es, 'i')
-    es_weights = NDArray(_es + ('n_mode', ), 'f')
-    es_node_ids = NDArray(_es, 'i')
-    buffer = NDArray(('n_time', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
+    """
+    TVB's traditional history implementation. The extended shape arrays `es_*` and the
+    dense `delayed_state` are only built when accessed, i.e. by couplings which
+    evaluate over all pairs of nodes.
+
+    """
+
+    buffer = NDArray(('n_time', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False, order='buffer_order')
     current_state = NDArray(('n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
     delayed_state = NDArray(('n_node', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
 
     @property
-    def nbytes(self):
-        arrays = 'icvar idelays weights node_ids'.split()
-        nbytes = sum([getattr(self, 'es_' + ary).nbytes for ary in arrays])
-        nbytes += self.buffer.nbytes
-        nbytes += BaseHistory.nbytes.fget(self)
-        return nbytes
+    def buffer_order(self):
+        "Memory order of the buffer's axes, with the variables of each node contiguous in the node layout."
+        if self.state_layout == 'node':
+            return 0, 2, 1, 3
+
+    # extended shape arrays for indexing, as broadcast views
+    def _extend(self, array, *shape):
+        return numpy.broadcast_to(array, (self.n_node, self.n_cvar, self.n_node) + shape)
+
+    @property
+    def es_icvar(self):
+        return self._extend(numpy.r_[:self.n_cvar].reshape((1, -1, 1)))
 
-    def __init__(self, weights, delays, cvars, n_mode):
-        super(DenseHistory, self).__init__(weights, delays, cvars, n_mode)
+    @property
+    def es_idelays(self):
+        return self._extend(self.delays[:, numpy.newaxis, :].astype('i'))
+
+    @property
+    def es_weights(self):
+        return self._extend(self.weights[:, numpy.newaxis, :, numpy.newaxis], self.n_mode)
+
+    @property
+    def es_node_ids(self):
+        return self._extend(numpy.r_[:self.n_node].reshape((1, 1, -1)))
 
-        # initialize indexing arrays
-        na = numpy.newaxis
-        self.es_icvar = numpy.r_[:len(self.cvars)][na, :, na]
-        self.es_idelays = self.delays[:, na, :].astype('i')
-        self.es_weights = self.weights[:, na, :, na]
-        self.es_node_ids = numpy.r_[:self.n_node][na, na, :]
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + BaseHistory.nbytes.fget(self)
 
     def initialize(self, init):
         if init.shape[1] > len(self.cvars):
@@ -119,6 +136,11 @@ class DenseHistory(BaseHistory):
     def update(self, step, new_state):
         self.buffer[step % self.n_time] = new_state[self.cvars]
 
+    def update_block(self, step, new_states):
+        "Update history with the states of consecutive steps starting at step."
+        time_idx = (step + numpy.r_[:new_states.shape[0]]) % self.n_time
+        self.buffer[time_idx] = new_states[:, self.cvars]
+
 
 class SparseHistory(DenseHistory):
     "History implementation which stores data only for non-zero weights."
@@ -133,25 +155,29 @@ class SparseHistory(DenseHistory):
     nnz_col_el_idx = NDArray((n_nnzw, ), 'i')
     nnz_weights = NDArray((n_nnzw, ), 'f')
     nnz_row_idx = NDArray((n_nnzr, ), 'i')
+    _delayed_state_zeroed = False
+    # structures derived from the non-zero weights, e.g. by couplings, built on first use
+    _derived = None
 
-    def __init__(self, weights, delays, cvars, n_mode):
-        super(SparseHistory, self).__init__(weights, delays, cvars, n_mode)
+    def __init__(self, weights, delays, cvars, n_mode, state_layout='variable'):
+        super(SparseHistory, self).__init__(weights, delays, cvars, n_mode, state_layout)
         self.time_stride = self.n_cvar * self.n_node * self.n_mode
         self.nnz_mask = weights_nonzero = weights != 0.0 # type: numpy.ndarray
         self.n_nnzw = nnz = weights_nonzero.sum()
-        self.nnz_weights = weights[self.nnz_mask]
-        self.nnz_row_el_idx, self.nnz_col_el_idx = numpy.argwhere(self.nnz_mask).T
+        order = self._nnz_order(delays[weights_nonzero])
+        self.nnz_weights = weights[self.nnz_mask][order]
+        self.nnz_row_el_idx, self.nnz_col_el_idx = numpy.argwhere(self.nnz_mask)[order].T
         nnz_row_idx = numpy.unique(self.nnz_row_el_idx)
         self.n_nnzr = len(nnz_row_idx)
         self.nnz_row_idx = nnz_row_idx
-        self.nnz_idelays = delays[weights_nonzero].astype('i')
-        # build const indices
+        self.nnz_idelays = delays[weights_nonzero].astype('i')[order]
+        # build const indices, into the buffer flattened in memory order
         n, m = self.n_node, self.n_mode
-        icvars_ = numpy.r_[:len(cvars)].reshape((-1, 1, 1)) * n * m
-        nodes_ = numpy.tile(numpy.r_[:n], (n, 1))[self.nnz_mask, numpy.newaxis] * m
+        cvar_stride, node_stride = (m, self.n_cvar * m) if self.state_layout == 'node' else (n * m, m)
+        icvars_ = numpy.r_[:len(cvars)].reshape((-1, 1, 1)) * cvar_stride
+        nodes_ = numpy.tile(numpy.r_[:n], (n, 1))[self.nnz_mask][order, numpy.newaxis] * node_stride
         modes_ = numpy.r_[:m]
         self.const_indices = icvars_ + nodes_ + modes_
-        self.delayed_state[:] = 0.0
 
         LOG.info('history has n_time=%d n_cvar=%d n_node=%d n_nmode=%d, requires %.2f MB',
                  self.n_time, self.n_cvar, self.n_node, self.n_mode, self.nbytes*2**-20)
@@ -159,18 +185,56 @@ class SparseHistory(DenseHistory):
         LOG.info('sparse history has n_nnzw=%d, i.e. %.2f %% sparse', self.n_nnzw,
                  self.n_nnzw * 100.0 / self.n_node**2)
 
+    def _nnz_order(self, nnz_delays):
+        "Order of the non-zero weights kept by the layout, given their delays in row major order."
+        return slice(None)
+
+    @property
+    def nnz_row_order(self):
+        "Permutation of the non-zero weights into row major order, which layouts may not keep."
+        return self.derived('row_order', lambda: numpy.lexsort((self.nnz_col_el_idx, self.nnz_row_el_idx)))
+
+    def derived(self, key, build):
+        """
+        Structure derived from this history, e.g. a coupling engine, returned by `build` on the
+        first call with `key`. These live and die with the history, so that components reused
+        with another history, such as a simulator's default coupling, never see stale ones.
+
+        """
+        if self._derived is None:
+            self._derived = {}
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+
     def query(self, step, out=None):
         current, delayed = self.query_sparse(step)
-        self.delayed_state.transpose((1, 0, 2, 3))[:, self.nnz_mask] = delayed
+        if not self._delayed_state_zeroed:
+            # dense delayed state is only allocated for couplings which query it
+            self.delayed_state[:] = 0.0
+            self._delayed_state_zeroed = True
+        self.delayed_state.transpose((1, 0, 2, 3))[:, self.nnz_row_el_idx, self.nnz_col_el_idx] = delayed
         return current, self.delayed_state
 
     def query_sparse(self, step):
         time_indices = ((step - 1 - self.nnz_idelays + self.n_time) % self.n_time) # type: numpy.ndarray
         time_indices = time_indices.reshape((-1, 1)) * self.time_stride # type: numpy.ndarray
-        delayed_state = self.buffer.take(time_indices + self.const_indices)
+        delayed_state = self.buffer.ravel('K').take(time_indices + self.const_indices)
         current_state = self.buffer[(step - 1) % self.n_time]
         return current_state, delayed_state
 
+    def query_sparse_block(self, step, n_step):
+        """
+        Delayed state of non-zero weights for n_step consecutive steps starting at step, of
+        shape (n_step, n_cvar, n_nnzw, n_mode). Only valid if n_step does not exceed the
+        minimum delay plus one, as the history is not updated within the block.
+
+        """
+        steps = step + numpy.r_[:n_step].reshape((-1, 1))
+        time_indices = ((steps - 1 - self.nnz_idelays + self.n_time) % self.n_time) # type: numpy.ndarray
+        time_indices = time_indices.reshape((n_step, 1, -1, 1)) * self.time_stride # type: numpy.ndarray
+        return self.buffer.ravel('K').take(time_indices + self.const_indices)
+
     @property
     def nbytes(self):
         arrays = 'nnz_mask const_indices nnz_idelays nnz_row_el_idx nnz_col_el_idx nnz_weights nnz_row_idx'.split()
@@ -179,6 +243,217 @@ class SparseHistory(DenseHistory):
         return nbytes
 
 
+class DelayBucketedHistory(SparseHistory):
+    """
+    History implementation which groups non-zero weights by integer delay, such that
+    each group reads its afferent nodes from a single time slice of the buffer into a
+    contiguous range of connections. The non-zero weights are kept in this delay
+    order, in which couplings consume them, rather than the row major order of the
+    sparse history.
+
+    """
+
+    _buckets = None # type: list
+
+    def __init__(self, weights, delays, cvars, n_mode, state_layout='variable'):
+        super(DelayBucketedHistory, self).__init__(weights, delays, cvars, n_mode, state_layout)
+        cols = self.nnz_col_el_idx
+        bucket_delays, starts = numpy.unique(self.nnz_idelays, return_index=True)
+        stops = numpy.r_[starts[1:], self.n_nnzw]
+        self._buckets = [(delay, slice(start, stop), cols[start:stop])
+                         for delay, start, stop in zip(bucket_delays, starts, stops)]
+        LOG.debug('delay bucketed history has %d buckets', len(self._buckets))
+
+    def _nnz_order(self, nnz_delays):
+        return numpy.argsort(nnz_delays, kind='stable')
+
+    def query_sparse(self, step):
+        delayed_state = numpy.empty((self.n_cvar, self.n_nnzw, self.n_mode), self.buffer.dtype)
+        for delay, span, cols in self._buckets:
+            delayed_state[:, span] = self.buffer[(step - 1 - delay) % self.n_time].take(cols, axis=1)
+        current_state = self.buffer[(step - 1) % self.n_time]
+        return current_state, delayed_state
+
+    def query_sparse_block(self, step, n_step):
+        steps = step + numpy.r_[:n_step]
+        delayed_state = numpy.empty((n_step, self.n_cvar, self.n_nnzw, self.n_mode), self.buffer.dtype)
+        for delay, span, cols in self._buckets:
+            delayed_state[:, :, span] = self.buffer[(steps - 1 - delay) % self.n_time].take(cols, axis=2)
+        return delayed_state
+
+
+class NodeMajorHistory(SparseHistory):
+    """
+    History implementation storing the buffer with time innermost, such that delayed
+    states of a node's efferent connections are read from a contiguous time series.
+    The `buffer` attribute remains a time major view of the same memory.
+
+    """
+
+    tbuffer = NDArray(('n_cvar', 'n_node', 'n_mode', 'n_time'), 'f', read_only=False)
+    nm_const_indices = NDArray(('n_cvar', 'n_nnzw', 'n_mode'), 'i')
+
+    @property
+    def buffer(self):
+        return self.tbuffer.transpose((3, 0, 1, 2))
+
+    @buffer.setter
+    def buffer(self, value):
+        self.tbuffer = numpy.transpose(value, (1, 2, 3, 0))
+
+    def __init__(self, weights, delays, cvars, n_mode, state_layout='variable'):
+        # the buffer has a layout of its own, whatever the state layout
+        super(NodeMajorHistory, self).__init__(weights, delays, cvars, n_mode)
+        n, m, t = self.n_node, self.n_mode, self.n_time
+        icvars_ = numpy.r_[:self.n_cvar].reshape((-1, 1, 1)) * n * m * t
+        nodes_ = self.nnz_col_el_idx.reshape((-1, 1)) * m * t
+        modes_ = numpy.r_[:m] * t
+        self.nm_const_indices = icvars_ + nodes_ + modes_
+
+    def _time_indices(self, steps):
+        return (steps - 1 - self.nnz_idelays + self.n_time) % self.n_time
+
+    def query_sparse(self, step):
+        time_indices = self._time_indices(step).reshape((-1, 1))
+        delayed_state = self.tbuffer.take(time_indices + self.nm_const_indices)
+        current_state = self.buffer[(step - 1) % self.n_time]
+        return current_state, delayed_state
+
+    def query_sparse_block(self, step, n_step):
+        steps = step + numpy.r_[:n_step].reshape((-1, 1))
+        time_indices = self._time_indices(steps).reshape((n_step, 1, -1, 1))
+        return self.tbuffer.take(time_indices + self.nm_const_indices)
+
+
+class MemmapHistory(DelayBucketedHistory):
+    """
+    History implementation whose ring buffer lives in a memory mapped temporary file in
+    `directory`, for horizons which do not fit in memory. The most recent `hot_steps`
+    steps are also kept in memory, and delay groups older than the hot window are read
+    from the file oldest first, i.e. sequentially in time.
+
+    """
+
+    hot_steps = Dim()
+    hot = NDArray(('hot_steps', 'n_cvar', 'n_node', 'n_mode'), 'f', read_only=False)
+    _mmap = None # type: numpy.memmap
+    _directory = None # type: str
+    _hot_step = None # type: int
+
+    def __init__(self, weights, delays, cvars, n_mode, state_layout='variable', hot_bytes=2**26, directory=None):
+        slab_bytes = len(cvars) * delays.shape[0] * n_mode * numpy.dtype('f').itemsize
+        self.hot_steps = int(numpy.clip(hot_bytes // slab_bytes, 1, delays.max() + 1))
+        self._directory = directory
+        # the file is stored in the variable layout, whatever the state layout
+        super(MemmapHistory, self).__init__(weights, delays, cvars, n_mode)
+        LOG.info('memmap history keeps %d of %d steps in memory', self.hot_steps, self.n_time)
+
+    @property
+    def buffer(self):
+        if self._mmap is None:
+            shape = self.n_time, self.n_cvar, self.n_node, self.n_mode
+            self._mmap = numpy.memmap(tempfile.TemporaryFile(dir=self._directory), 'f', 'w+', shape=shape)
+        return self._mmap
+
+    @buffer.setter
+    def buffer(self, value):
+        self.buffer[:] = value
+        self._hot_step = None
+
+    def _sync_hot(self, step):
+        "Ensure the hot window holds the steps preceding step."
+        if self._hot_step != step - 1:
+            steps = numpy.r_[step - self.hot_steps:step]
+            self.hot[steps % self.hot_steps] = self.buffer[steps % self.n_time]
+            self._hot_step = step - 1
+
+    def _slices(self, times, delay):
+        "Time slices at times, from the hot window if recent enough according to delay."
+        if delay < self.hot_steps:
+            return self.hot[times % self.hot_steps]
+        return self.buffer[times % self.n_time]
+
+    def query_sparse(self, step):
+        self._sync_hot(step)
+        delayed_state = numpy.empty((self.n_cvar, self.n_nnzw, self.n_mode), self.buffer.dtype)
+        for delay, span, cols in reversed(self._buckets):
+            delayed_state[:, span] = self._slices(step - 1 - delay, delay).take(cols, axis=1)
+        current_state = self.hot[(step - 1) % self.hot_steps]
+        return current_state, delayed_state
+
+    def query_sparse_block(self, step, n_step):
+        self._sync_hot(step)
+        steps = step + numpy.r_[:n_step]
+        delayed_state = numpy.empty((n_step, self.n_cvar, self.n_nnzw, self.n_mode), self.buffer.dtype)
+        for delay, span, cols in reversed(self._buckets):
+            delayed_state[:, :, span] = self._slices(steps - 1 - delay, delay).take(cols, axis=2)
+        return delayed_state
+
+    def update(self, step, new_state):
+        self._sync_hot(step)
+        super(MemmapHistory, self).update(step, new_state)
+        self.hot[step % self.hot_steps] = new_state[self.cvars]
+        self._hot_step = step
+
+    def update_block(self, step, new_states):
+        self._sync_hot(step)
+        super(MemmapHistory, self).update_block(step, new_states)
+        steps = step + numpy.r_[:new_states.shape[0]]
+        self.hot[steps[-self.hot_steps:] % self.hot_steps] = new_states[-self.hot_steps:][:, self.cvars]
+        self._hot_step = steps[-1]
+
+    @property
+    def nbytes(self):
+        "Bytes held in memory, i.e. excluding the memory mapped buffer."
+        return DelayBucketedHistory.nbytes.fget(self) - self.buffer.nbytes + self.hot.nbytes
+
+
+LAYOUTS = {
+    'sparse': SparseHistory,
+    'delay': DelayBucketedHistory,
+    'node': NodeMajorHistory,
+    'memmap': MemmapHistory,
+}
+
+
+def benchmark_layouts(weights, delays, cvars, n_mode, n_step=32, n_repeat=3, layouts=None, n_horizon=256):
+    """
+    Time `n_step` queries and updates of each history layout for the given connectivity,
+    returning the best of `n_repeat` mean times per step in seconds, by layout name. By
+    default, the in memory layouts are compared.
+
+    Layouts are built on a horizon of at most `n_horizon` steps, rather than their full
+    buffers, with the distinct delays ranked in order, such that the delay buckets and the
+    gathers per step are kept, up to `n_horizon` distinct delays.
+
+    """
+    _, rank = numpy.unique(delays, return_inverse=True)
+    delays = numpy.minimum(rank.reshape(delays.shape), n_horizon - 1)
+    times = {}
+    for name in layouts or ('delay', 'node', 'sparse'):
+        history = LAYOUTS[name](weights, delays, cvars, n_mode)
+        history.initialize(numpy.zeros(history.buffer.shape, history.buffer.dtype))
+        state = numpy.zeros((history.cvars.max() + 1, ) + history.buffer.shape[2:], history.buffer.dtype)
+        best = numpy.inf
+        for _ in range(n_repeat):
+            tic = time.perf_counter()
+            for step in range(1, n_step + 1):
+                history.query_sparse(step)
+                history.update(step, state)
+            best = min(best, (time.perf_counter() - tic) / n_step)
+        times[name] = best
+    return times
+
+
+def select_layout(weights, delays, cvars, n_mode, **kwds):
+    "Name of the fastest history layout for the given connectivity, as benchmarked by `benchmark_layouts`."
+    times = benchmark_layouts(weights, delays, cvars, n_mode, **kwds)
+    name = min(times, key=times.get)
+    LOG.info('selected %s history layout, %s', name,
+             ', '.join('%s %.1f us' % (key, times[key] * 1e6) for key in sorted(times)))
+    return name
+
+
 # implement in order  NumPy, Numba & OpenCL versions
 
 # simulator.history becomes impl instance
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Opt-in instrumentation of the simulation loop, timing each phase of the
+simulator's iteration, and optionally the memory allocated in it::
+
+    sim.profiler = PhaseProfiler(track_memory=True)
+    sim.run()
+    report = sim.profiler.report()
+
+Timing wrappers are only installed on the simulator's components for the
+duration of a call, so that a simulator without profiler has no overhead.
+
+"""
+
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from .common import get_logger
+
+LOG = get_logger(__name__)
+
+
+class _Phase(object):
+    "Accumulated measurements of one phase."
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.net_bytes = 0
+        self.peak_bytes = 0
+
+
+class PhaseProfiler(object):
+    """
+    Times the phases of the simulation loop: coupling, stimulus, the integration
+    scheme split into model dfun and noise, history update, observation and each
+    monitor's recording. Times are exclusive, i.e. the time of the dfun is not
+    included in that of the integration scheme. With track_memory, tracemalloc
+    measures the net and peak bytes allocated per phase; peaks of phases enclosing
+    other phases are approximate.
+
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.phases = OrderedDict()
+        self.wall_time = 0.0
+        self._installed = []
+        self._stack = []
+        self._tic = None
+        self._started_tracemalloc = False
+
+    def _wrap(self, name, func):
+        phase = self.phases.setdefault(name, _Phase())
+        stack = self._stack
+        track_memory = self.track_memory
+        timer = time.perf_counter
+
+        def wrapped(*args, **kwargs):
+            if track_memory:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            stack.append(0.0)
+            tic = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = timer() - tic
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                phase.calls += 1
+                phase.time += elapsed - nested
+                if track_memory:
+                    current, peak = tracemalloc.get_traced_memory()
+                    phase.net_bytes += current - before
+                    phase.peak_bytes = max(phase.peak_bytes, peak - before)
+
+        return wrapped
+
+    def _install(self, obj, attr, name):
+        original = obj.__dict__.get(attr)
+        setattr(obj, attr, self._wrap(name, getattr(obj, attr)))
+        self._installed.append((obj, attr, original))
+
+    def install(self, simulator):
+        "Install timing wrappers on the simulator and its components."
+        self._install(simulator, '_loop_compute_node_coupling', 'coupling')
+        self._install(simulator, '_chunk_compute_node_coupling', 'coupling')
+        self._install(simulator, '_instantaneous_node_coupling', 'coupling')
+        self._install(simulator.history, 'query_sparse_block', 'coupling')
+        self._install(simulator, '_loop_update_stimulus', 'stimulus')
+        self._install(simulator.integrator, 'scheme', 'scheme')
+        self._install(simulator.model, 'dfun', 'dfun')
+        noise = getattr(simulator.integrator, 'noise', None)
+        if noise is not None:
+            self._install(noise, 'generate', 'noise')
+            self._install(noise, 'prefetch', 'noise')
+        self._install(simulator, '_loop_update_history', 'history')
+        self._install(simulator.history, 'update_block', 'history')
+        self._install(simulator.model, 'observe', 'observe')
+        for i, monitor in enumerate(simulator.monitors):
+            name = 'monitor%d_%s' % (i, type(monitor).__name__)
+            self._install(monitor, 'record', name)
+            self._install(monitor, 'record_block', name)
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._tic = time.perf_counter()
+
+    def uninstall(self):
+        "Remove the timing wrappers, restoring the original attributes."
+        self.wall_time += time.perf_counter() - self._tic
+        for obj, attr, original in reversed(self._installed):
+            if original is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+        self._installed = []
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def report(self):
+        "Structured report of the measurements, with the time of each phase and its fraction of wall time."
+        wall_time = self.wall_time or 1.0
+        phases = OrderedDict()
+        for name, phase in self.phases.items():
+            if phase.calls == 0:
+                continue
+            phases[name] = entry = OrderedDict()
+            entry['calls'] = phase.calls
+            entry['time'] = phase.time
+            entry['time_per_call'] = phase.time / phase.calls
+            entry['fraction'] = phase.time / wall_time
+            if self.track_memory:
+                entry['net_bytes'] = phase.net_bytes
+                entry['peak_bytes'] = phase.peak_bytes
+        other = self.wall_time - sum(entry['time'] for entry in phases.values())
+        return OrderedDict([('wall_time', self.wall_time),
+                            ('n_steps', self.phases['scheme'].calls if 'scheme' in self.phases else 0),
+                            ('phases', phases),
+                            ('other', other)])
+
+    def to_json(self, path=None):
+        "Return the report as JSON, writing it to path if given."
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as fd:
+                fd.write(text)
+        return text
+
+    def summary(self):
+        "One line summary of the fraction of wall time spent in each phase."
+        report = self.report()
+        parts = ['%s %.1f%%' % (name, 100 * entry['fraction']) for name, entry in report['phases'].items()]
+        return 'profile of %d steps in %.3f s: %s' % (report['n_steps'], report['wall_time'], ', '.join(parts))
@@ -46,10 +46,11 @@ will be consistent with Monitor periods corresponding to any of [4096, 2048, 102
 """
 import abc
 import functools
+import numpy
 import scipy.integrate
 from . import noise
-from .common import get_logger, simple_gen_astr
-from tvb.basic.neotraits.api import HasTraits, Attr, NArray, Float
+from .common import get_logger, simple_gen_astr, empty_state
+from tvb.basic.neotraits.api import HasTraits, Attr, NArray, Float, Int
 
 LOG = get_logger(__name__)
 
@@ -104,6 +105,24 @@ class Integrator(HasTraits):
         label="The values of the state variables which are clamped ",
         required=False)
 
+    inplace = Attr(
+        field_type=bool,
+        default=False,
+        required=False,
+        label="In-place integration",
+        doc="""If True, schemes supporting it evaluate each step in workspace
+        arrays allocated once for the state shape, alternating between two
+        arrays for the next state, instead of allocating temporaries on each
+        step. The returned state is then overwritten two steps later, and must
+        be copied if it is to be kept.""")
+
+    # names of the arrays, shaped like the state, used by the in-place scheme
+    _workspace_arrays = ()
+    _workspace = None
+    # dfun writes derivatives to its out argument
+    _dfun_out = False
+    # memory layout of the workspace arrays, as in common.empty_state
+    _layout = 'variable'
 
     @abc.abstractmethod
     def scheme(self, X, dfun, coupling, local_coupling, stimulus):
@@ -114,6 +133,53 @@ class Integrator(HasTraits):
 
         """
 
+    def configure_workspace(self, shape, dtype, dfun_out=False, layout='variable'):
+        """
+        Allocate the workspace of the in-place scheme for states of given shape,
+        dtype and memory layout. If dfun_out is True, derivatives are evaluated
+        directly into the workspace by passing it to the dfun as its out argument.
+
+        """
+        names = self._workspace_arrays + ('X_a', 'X_b')
+        self._workspace = dict((name, empty_state(shape, dtype, layout)) for name in names)
+        self._dfun_out = dfun_out
+        self._layout = layout
+
+    def _inplace_workspace(self, X):
+        "Workspace for the state X, (re)allocated if its shape or dtype changed."
+        workspace = self._workspace
+        if workspace is None or workspace['X_a'].shape != X.shape or workspace['X_a'].dtype != X.dtype:
+            self.configure_workspace(X.shape, X.dtype, self._dfun_out, self._layout)
+        return self._workspace
+
+    def _next_state(self, X):
+        "Workspace array receiving the next state, never aliasing the current state X."
+        workspace = self._workspace
+        return workspace['X_b'] if X is workspace['X_a'] else workspace['X_a']
+
+    def _dfun_into(self, dfun, X, coupling, local_coupling, out):
+        "Evaluate the dfun into the workspace array out."
+        if self._dfun_out:
+            dfun(X, coupling, local_coupling, out=out)
+        else:
+            out[:] = dfun(X, coupling, local_coupling)
+        return out
+
+    def _add_stimulus(self, X, stimulus):
+        "Add dt * stimulus to X in place."
+        if numpy.ndim(stimulus) == 0:
+            if stimulus != 0.0:
+                X += self.dt * stimulus
+        else:
+            X += numpy.multiply(stimulus, self.dt, out=self._workspace['stimulus'])
+
+    def _constrain_state(self, X):
+        "Apply the state variable boundaries and clamped values, if any, to X in place."
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X)
+
     def bound_state(self, X):
         for sv_ind, sv_bounds in \
                 zip(self.bounded_state_variable_indices,
@@ -126,6 +192,13 @@ class Integrator(HasTraits):
     def clamp_state(self, X):
         X[self.clamped_state_variable_indices] = self.clamped_state_variable_values
 
+    def get_state(self):
+        """Return a dict of the arrays carried by the scheme between steps, empty for one step schemes."""
+        return {}
+
+    def set_state(self, state):
+        """Resume the scheme from a state returned by `get_state`."""
+
     def __str__(self):
         return simple_gen_astr(self, 'dt')
 
@@ -164,6 +237,27 @@ class IntegratorStochastic(Integrator):
         doc = """The stochastic integrator's noise source. It incorporates its
         own instance of Numpy's RandomState.""")  # type: noise.Noise
 
+    sparse_noise = Attr(
+        field_type=bool,
+        default=False,
+        required=False,
+        label="Sparse noise",
+        doc="""If True, random numbers are only drawn for the elements of the
+        state where the noise dispersion nsig is non-zero, e.g. a subset of
+        state variables or nodes, the noise being zero elsewhere. With the legacy
+        bit generator, realizations then differ from those drawn over the whole
+        state. With the others, only the noise streams of the nodes of the support
+        are drawn, and each node keeps its realizations.""")
+
+    def configure_noise_support(self, shape):
+        "Precompute the support of the noise dispersion for states of given shape, if sparse_noise."
+        support = None
+        if self.sparse_noise:
+            nsig = numpy.broadcast_to(self.noise.nsig, shape)
+            support = numpy.flatnonzero(nsig)
+            LOG.debug('drawing noise for %d of %d state elements', support.size, nsig.size)
+        self.noise.configure_support(shape, support)
+
     def __str__(self):
         return simple_gen_astr(self, 'dt noise')
 
@@ -190,7 +284,8 @@ class HeunDeterministic(Integrator):
         cf. Equation 1.11, page 283.
 
         """
-        #import pdb; pdb.set_trace()
+        if self.inplace:
+            return self._scheme_inplace(X, dfun, coupling, local_coupling, stimulus)
         m_dx_tn = dfun(X, coupling, local_coupling)
         inter = X + self.dt * (m_dx_tn + stimulus)
         if self.state_variable_boundaries is not None:
@@ -207,6 +302,27 @@ class HeunDeterministic(Integrator):
             self.clamp_state(X_next)
         return X_next
 
+    _workspace_arrays = ('dX_0', 'dX_1', 'inter', 'stimulus')
+
+    def _scheme_inplace(self, X, dfun, coupling, local_coupling, stimulus):
+        "Heun step evaluated in the workspace, with the operations of the scheme in the same order."
+        workspace = self._inplace_workspace(X)
+        m_dx_tn = self._dfun_into(dfun, X, coupling, local_coupling, workspace['dX_0'])
+        inter = numpy.add(m_dx_tn, stimulus, out=workspace['inter'])
+        inter *= self.dt
+        numpy.add(X, inter, out=inter)
+        self._constrain_state(inter)
+
+        dX = self._dfun_into(dfun, inter, coupling, local_coupling, workspace['dX_1'])
+        numpy.add(m_dx_tn, dX, out=dX)
+        dX *= self.dt
+        dX /= 2.0
+
+        X_next = numpy.add(X, dX, out=self._next_state(X))
+        self._add_stimulus(X_next, stimulus)
+        self._constrain_state(X_next)
+        return X_next
+
 
 class HeunStochastic(IntegratorStochastic):
     """
@@ -229,13 +345,10 @@ class HeunStochastic(IntegratorStochastic):
         See page 1180.
 
         """
+        if self.inplace:
+            return self._scheme_inplace(X, dfun, coupling, local_coupling, stimulus)
         noise = self.noise.generate(X.shape)
-        noise_gfun = self.noise.gfun(X)
-        if (noise_gfun.shape != (1,) and noise.shape[0] != noise_gfun.shape[0]):
-            msg = str("Got shape %s for noise but require %s."
-                      " You need to reconfigure noise after you have changed your model."%(
-                       noise_gfun.shape, (noise.shape[0], noise.shape[1])))
-            raise Exception(msg)
+        noise_gfun = self._noise_gfun(X, noise)
 
         m_dx_tn = dfun(X, coupling, local_coupling)
 
@@ -257,6 +370,44 @@ class HeunStochastic(IntegratorStochastic):
 
         return X_next
 
+    _workspace_arrays = ('dX_0', 'dX_1', 'inter', 'noise', 'stimulus')
+
+    def _noise_gfun(self, X, noise):
+        noise_gfun = self.noise.gfun(X)
+        if (noise_gfun.shape != (1,) and noise.shape[0] != noise_gfun.shape[0]):
+            msg = str("Got shape %s for noise but require %s."
+                      " You need to reconfigure noise after you have changed your model."%(
+                       noise_gfun.shape, (noise.shape[0], noise.shape[1])))
+            raise Exception(msg)
+        return noise_gfun
+
+    def _scheme_inplace(self, X, dfun, coupling, local_coupling, stimulus):
+        "Stochastic Heun step evaluated in the workspace, with the operations of the scheme in the same order."
+        workspace = self._inplace_workspace(X)
+        noise = self.noise.generate(X.shape, out=workspace['noise'])
+        noise_gfun = self._noise_gfun(X, noise)
+
+        m_dx_tn = self._dfun_into(dfun, X, coupling, local_coupling, workspace['dX_0'])
+
+        noise *= noise_gfun
+
+        inter = numpy.multiply(m_dx_tn, self.dt, out=workspace['inter'])
+        numpy.add(X, inter, out=inter)
+        inter += noise
+        self._add_stimulus(inter, stimulus)
+        self._constrain_state(inter)
+
+        dX = self._dfun_into(dfun, inter, coupling, local_coupling, workspace['dX_1'])
+        numpy.add(m_dx_tn, dX, out=dX)
+        dX *= self.dt
+        dX /= 2.0
+
+        X_next = numpy.add(X, dX, out=self._next_state(X))
+        X_next += noise
+        self._add_stimulus(X_next, stimulus)
+        self._constrain_state(X_next)
+        return X_next
+
 
 class EulerDeterministic(Integrator):
     """
@@ -278,6 +429,8 @@ class EulerDeterministic(Integrator):
         cf. Equations 1.3 and 1.13, pages 305 and 306 respectively.
 
         """
+        if self.inplace:
+            return self._scheme_inplace(X, dfun, coupling, local_coupling, stimulus)
 
         self.dX = dfun(X, coupling, local_coupling) 
 
@@ -288,6 +441,18 @@ class EulerDeterministic(Integrator):
             self.clamp_state(X_next)
         return X_next
 
+    _workspace_arrays = ('dX_0', )
+
+    def _scheme_inplace(self, X, dfun, coupling, local_coupling, stimulus):
+        "Euler step evaluated in the workspace, with the operations of the scheme in the same order."
+        workspace = self._inplace_workspace(X)
+        self.dX = self._dfun_into(dfun, X, coupling, local_coupling, workspace['dX_0'])
+        X_next = numpy.add(self.dX, stimulus, out=self._next_state(X))
+        X_next *= self.dt
+        X_next += X
+        self._constrain_state(X_next)
+        return X_next
+
 
 class EulerStochastic(IntegratorStochastic):
     """
@@ -314,6 +479,8 @@ class EulerStochastic(IntegratorStochastic):
         cf. Equations 1.3 and 1.13, pages 305 and 306 respectively.
 
         """
+        if self.inplace:
+            return self._scheme_inplace(X, dfun, coupling, local_coupling, stimulus)
 
         noise = self.noise.generate(X.shape)
         dX = dfun(X, coupling, local_coupling) * self.dt 
@@ -325,6 +492,21 @@ class EulerStochastic(IntegratorStochastic):
             self.clamp_state(X_next)
         return X_next
 
+    _workspace_arrays = ('dX_0', 'noise', 'stimulus')
+
+    def _scheme_inplace(self, X, dfun, coupling, local_coupling, stimulus):
+        "Euler-Maruyama step evaluated in the workspace, with the operations of the scheme in the same order."
+        workspace = self._inplace_workspace(X)
+        noise = self.noise.generate(X.shape, out=workspace['noise'])
+        dX = self._dfun_into(dfun, X, coupling, local_coupling, workspace['dX_0'])
+        dX *= self.dt
+        noise *= self.noise.gfun(X)
+        X_next = numpy.add(X, dX, out=self._next_state(X))
+        X_next += noise
+        self._add_stimulus(X_next, stimulus)
+        self._constrain_state(X_next)
+        return X_next
+
 
 class RungeKutta4thOrderDeterministic(Integrator):
     """
@@ -353,6 +535,8 @@ class RungeKutta4thOrderDeterministic(Integrator):
 
 
         """
+        if self.inplace:
+            return self._scheme_inplace(X, dfun, coupling, local_coupling, stimulus)
 
         dt = self.dt
         dt2 = dt / 2.0
@@ -387,6 +571,381 @@ class RungeKutta4thOrderDeterministic(Integrator):
             self.clamp_state(X_next)
         return X_next
 
+    _workspace_arrays = ('dX_0', 'dX_1', 'dX_2', 'dX_3', 'inter', 'stimulus')
+
+    def _scheme_inplace(self, X, dfun, coupling, local_coupling, stimulus):
+        "Runge-Kutta step evaluated in the workspace, with the operations of the scheme in the same order."
+        workspace = self._inplace_workspace(X)
+        dt = self.dt
+        dt2 = dt / 2.0
+        dt6 = dt / 6.0
+        inter = workspace['inter']
+
+        k1 = self._dfun_into(dfun, X, coupling, local_coupling, workspace['dX_0'])
+        numpy.multiply(k1, dt2, out=inter)
+        inter += X
+        self._constrain_state(inter)
+        k2 = self._dfun_into(dfun, inter, coupling, local_coupling, workspace['dX_1'])
+        numpy.multiply(k2, dt2, out=inter)
+        inter += X
+        self._constrain_state(inter)
+        k3 = self._dfun_into(dfun, inter, coupling, local_coupling, workspace['dX_2'])
+        numpy.multiply(k3, dt, out=inter)
+        inter += X
+        self._constrain_state(inter)
+        k4 = self._dfun_into(dfun, inter, coupling, local_coupling, workspace['dX_3'])
+
+        dX = k2
+        dX *= 2.0
+        dX += k1
+        k3 *= 2.0
+        dX += k3
+        dX += k4
+        dX *= dt6
+
+        X_next = numpy.add(X, dX, out=self._next_state(X))
+        self._add_stimulus(X_next, stimulus)
+        self._constrain_state(X_next)
+        return X_next
+
+
+class MultiRateHeunDeterministic(Integrator):
+    """
+    A multi-rate Heun method, for models whose slow state variables evolve on
+    a time scale much longer than the others, such as the permittivity variable
+    of the Epileptor. The fast state variables are stepped with the Heun scheme
+    at dt, while the derivatives of the slow ones are evaluated once per slow
+    step of n_slow * dt, and held over that slow step.
+
+    Models declaring separate fast and slow dfuns with `split_dfun` only have
+    their slow terms evaluated once per slow step. For other models the slow
+    derivatives are taken from the dfun, which then evaluates all terms.
+
+    """
+
+    _ui_name = "Multi-rate Heun"
+
+    n_slow = Int(
+        label="Steps per slow step",
+        default=10,
+        required=True,
+        doc="""Number of integration steps per step of the slow state variables.""")
+
+    slow_state_variable_indices = NArray(
+        dtype=int,
+        label="indices of the state variables integrated at the slow rate",
+        required=False,
+        doc="""Set by the simulator from the model's slow state variables.""")
+
+    # fast and slow dfuns declared by the model, if any
+    _split_dfun = None
+    # progress through the current slow step
+    _k = 0
+    _f_slow = None
+    _rate = None
+
+    def configure(self):
+        super(MultiRateHeunDeterministic, self).configure()
+        self._k, self._f_slow, self._rate = 0, None, None
+
+    def configure_split_dfun(self, split_dfun):
+        "Use the (fast_dfun, slow_dfun) pair declared by the model, if not None, instead of the dfun."
+        self._split_dfun = split_dfun
+
+    def _start_slow_step(self, f_slow):
+        """
+        Rate of the slow state variables over a slow step, with the second order
+        Adams-Bashforth scheme from their derivative at the start of this and the
+        previous slow step.
+
+        """
+        if self._f_slow is None or self._f_slow.shape != f_slow.shape:
+            self._rate = f_slow
+        else:
+            self._rate = 1.5 * f_slow - 0.5 * self._f_slow
+        self._f_slow = f_slow
+
+    def get_state(self):
+        state = {'k': numpy.array(self._k)}
+        if self._f_slow is not None:
+            state['f_slow'] = self._f_slow
+            state['rate'] = self._rate
+        return state
+
+    def set_state(self, state):
+        self._k = int(state['k'])
+        self._f_slow = numpy.array(state['f_slow']) if 'f_slow' in state else None
+        self._rate = numpy.array(state['rate']) if 'rate' in state else None
+
+    def scheme(self, X, dfun, coupling, local_coupling, stimulus):
+        r"""
+        The slow state variables :math:`z` are advanced with
+
+        .. math::
+            z_{n+1} = z_n + H (3 f_z(X_n) - f_z(X_{n-1})) / 2
+
+        where :math:`H` is the slow step, in increments of dt over the slow step.
+        Their derivative :math:`f_z` is evaluated once at the start of each slow
+        step. Within it, the fast state variables are stepped with the Heun scheme,
+        using the fast dfun if the model declares one. Stimulus only drives the
+        fast state variables.
+
+        """
+        slow = self.slow_state_variable_indices
+        if slow is None:
+            slow = numpy.array([], dtype=int)
+        fast_dfun, slow_dfun = self._split_dfun or (dfun, None)
+
+        m_dx_tn = fast_dfun(X, coupling, local_coupling)
+        if self._k == 0:
+            if slow_dfun is None:
+                f_slow = m_dx_tn[slow]
+            else:
+                f_slow = slow_dfun(X, coupling, local_coupling)
+            self._start_slow_step(f_slow)
+        z_next = X[slow] + self.dt * self._rate
+
+        inter = X + self.dt * (m_dx_tn + stimulus)
+        inter[slow] = z_next
+        if self.state_variable_boundaries is not None:
+            self.bound_state(inter)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(inter)
+
+        dX = (m_dx_tn + fast_dfun(inter, coupling, local_coupling)) * self.dt / 2.0
+
+        X_next = X + dX + self.dt * stimulus
+        X_next[slow] = z_next
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X_next)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X_next)
+        self._k = (self._k + 1) % self.n_slow
+        return X_next
+
+    def __str__(self):
+        return simple_gen_astr(self, 'dt n_slow')
+
+
+class IntegratorLinearDecay(Integrator):
+    r"""
+    The IntegratorLinearDecay class is a base class for integration methods
+    taking exactly the diagonal linear decay of the dfun, written as
+
+        .. math::
+            \dot{X} = -\lambda X + N(X)
+
+    such that stiff decays do not limit the step size. The rates
+    :math:`\lambda` are those given as linear_decay, else those declared by
+    the model, else they are extracted from the diagonal of the Jacobian of
+    the dfun at the first step, and carried over checkpoints.
+
+    """
+
+    linear_decay = NArray(
+        label="Linear decay rates",
+        required=False,
+        doc="""Rates of the diagonal linear decay of the state variables,
+        broadcasting against the state. If not given, the rates declared by the
+        model are used, or else they are extracted from the dfun.""")
+
+    _declared_decay = None
+    # rates extracted from the dfun, kept with checkpoints, see get_state
+    _extracted_decay = None
+    _coefficients = None
+
+    def configure_linear_decay(self, decay):
+        "Use the decay rates declared by the model, unless linear_decay is given."
+        self._declared_decay = decay
+        self._extracted_decay = None
+        self._coefficients = None
+
+    def get_state(self):
+        if self._extracted_decay is None:
+            return {}
+        return {'decay': self._extracted_decay}
+
+    def set_state(self, state):
+        self._extracted_decay = numpy.array(state['decay']) if 'decay' in state else None
+        self._coefficients = None
+
+    @staticmethod
+    def _extract_decay(X, dfun, coupling, local_coupling):
+        "Decay rates from finite differences of the dfun along each state variable, clipped to be positive."
+        dX = dfun(X, coupling, local_coupling)
+        decay = numpy.zeros(X.shape)
+        for i in range(X.shape[0]):
+            X_h = X.copy()
+            X_h[i] += numpy.sqrt(numpy.finfo(X.dtype).eps) * (1.0 + numpy.abs(X[i]))
+            decay[i] = -(dfun(X_h, coupling, local_coupling)[i] - dX[i]) / (X_h[i] - X[i])
+        return numpy.maximum(numpy.nan_to_num(decay), 0.0)
+
+    @abc.abstractmethod
+    def _scheme_coefficients(self, decay):
+        "Coefficients of the scheme for given decay rates."
+
+    def _decay_coefficients(self, X, dfun, coupling, local_coupling):
+        "Decay rates and coefficients of the scheme, computed once for the shape and dtype of the state."
+        key = X.shape, X.dtype, self.dt, id(self.linear_decay)
+        if self._coefficients is None or self._coefficients[0] != key:
+            decay = self.linear_decay
+            if decay is None:
+                decay = self._declared_decay
+            if decay is None:
+                if self._extracted_decay is None or self._extracted_decay.shape != X.shape:
+                    self._extracted_decay = self._extract_decay(X, dfun, coupling, local_coupling)
+                    LOG.debug('extracted linear decay rates in [%g, %g]', self._extracted_decay.min(),
+                              self._extracted_decay.max())
+                decay = self._extracted_decay
+            decay = numpy.asarray(decay, dtype=float)
+            coefficients = [coefficient.astype(X.dtype) for coefficient in self._scheme_coefficients(decay)]
+            self._coefficients = key, [decay.astype(X.dtype)] + coefficients
+        return self._coefficients[1]
+
+    def _nonlinear(self, X, dfun, coupling, local_coupling, stimulus, decay):
+        "The remainder of the dfun and stimulus after removing the linear decay."
+        return dfun(X, coupling, local_coupling) + decay * X + stimulus
+
+    def __str__(self):
+        return simple_gen_astr(self, 'dt linear_decay')
+
+
+class ExponentialEulerDeterministic(IntegratorLinearDecay):
+    """
+    The exponential Euler method integrates the linear decay exactly, and the
+    remainder of the dfun at the first order.
+
+    """
+
+    _ui_name = "Exponential Euler"
+
+    def _scheme_coefficients(self, decay):
+        decay_dt = decay * self.dt
+        # phi_1, the mean of exp(-decay * s) over the step, tends to 1 without decay
+        phi = numpy.ones_like(decay_dt)
+        nz = decay_dt != 0.0
+        phi[nz] = -numpy.expm1(-decay_dt[nz]) / decay_dt[nz]
+        # factor of the standard deviation of the noise integrated over the step
+        sigma = numpy.ones_like(decay_dt)
+        sigma[nz] = numpy.sqrt(-numpy.expm1(-2.0 * decay_dt[nz]) / (2.0 * decay_dt[nz]))
+        return numpy.exp(-decay_dt), phi * self.dt, sigma
+
+    def scheme(self, X, dfun, coupling, local_coupling, stimulus):
+        r"""
+        From [4]_:
+
+        .. math::
+            X_{n+1} = e^{-\lambda dt} X_n + \varphi_1(-\lambda dt) dt N(X_n)
+
+        where :math:`\varphi_1(z) = (e^z - 1) / z`.
+
+        .. [4] Hochbruck and Ostermann, *Exponential integrators*, Acta Numerica
+            19: 209--286, 2010.
+
+        """
+        decay, exp_decay, phi_dt, _ = self._decay_coefficients(X, dfun, coupling, local_coupling)
+        X_next = exp_decay * X + phi_dt * self._nonlinear(X, dfun, coupling, local_coupling, stimulus, decay)
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X_next)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X_next)
+        return X_next
+
+
+class ExponentialEulerStochastic(ExponentialEulerDeterministic, IntegratorStochastic):
+    """
+    The exponential Euler method for stochastic differential equations, whose
+    noise is integrated exactly over the step through the linear decay, so that
+    e.g. an Ornstein-Uhlenbeck process with additive noise has the exact
+    stationary variance for any step size.
+
+    """
+
+    _ui_name = "Stochastic exponential Euler"
+
+    def scheme(self, X, dfun, coupling, local_coupling, stimulus):
+        r"""
+
+        .. math::
+            X_{n+1} = e^{-\lambda dt} X_n + \varphi_1(-\lambda dt) dt N(X_n) +
+                      \sqrt{\varphi_1(-2 \lambda dt)} g(X_n) Z_1
+
+        """
+        decay, exp_decay, phi_dt, sigma = self._decay_coefficients(X, dfun, coupling, local_coupling)
+        noise = self.noise.generate(X.shape)
+        noise_gfun = self.noise.gfun(X)
+        X_next = exp_decay * X + phi_dt * self._nonlinear(X, dfun, coupling, local_coupling, stimulus, decay)
+        X_next += sigma * noise_gfun * noise
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X_next)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X_next)
+        return X_next
+
+    def __str__(self):
+        return simple_gen_astr(self, 'dt noise linear_decay')
+
+
+class IMEXEulerDeterministic(IntegratorLinearDecay):
+    """
+    The implicit-explicit Euler method treats the linear decay implicitly and
+    the remainder of the dfun explicitly, which only requires a division by
+    the diagonal of the linear part.
+
+    """
+
+    _ui_name = "IMEX Euler"
+
+    def _scheme_coefficients(self, decay):
+        return 1.0 / (1.0 + decay * self.dt),
+
+    def scheme(self, X, dfun, coupling, local_coupling, stimulus):
+        r"""
+
+        .. math::
+            X_{n+1} = (X_n + dt N(X_n)) / (1 + \lambda dt)
+
+        """
+        decay, implicit = self._decay_coefficients(X, dfun, coupling, local_coupling)
+        X_next = (X + self.dt * self._nonlinear(X, dfun, coupling, local_coupling, stimulus, decay)) * implicit
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X_next)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X_next)
+        return X_next
+
+
+class IMEXEulerStochastic(IMEXEulerDeterministic, IntegratorStochastic):
+    """
+    The implicit-explicit Euler method for stochastic differential equations,
+    with the noise added to the explicit part.
+
+    """
+
+    _ui_name = "Stochastic IMEX Euler"
+
+    def scheme(self, X, dfun, coupling, local_coupling, stimulus):
+        r"""
+
+        .. math::
+            X_{n+1} = (X_n + dt N(X_n) + g(X_n) Z_1) / (1 + \lambda dt)
+
+        """
+        decay, implicit = self._decay_coefficients(X, dfun, coupling, local_coupling)
+        noise = self.noise.generate(X.shape)
+        noise_gfun = self.noise.gfun(X)
+        X_next = X + self.dt * self._nonlinear(X, dfun, coupling, local_coupling, stimulus, decay)
+        X_next += noise_gfun * noise
+        X_next *= implicit
+        if self.state_variable_boundaries is not None:
+            self.bound_state(X_next)
+        if self.clamped_state_variable_values is not None:
+            self.clamp_state(X_next)
+        return X_next
+
+    def __str__(self):
+        return simple_gen_astr(self, 'dt noise linear_decay')
+
 
 class Identity(Integrator):
     """
@@ -440,7 +999,8 @@ class SciPyODEBase(object):
             self._ode = self._prepare_ode(X, dfun)
         self._ode.y[:] = X.ravel()
         self._ode.set_f_params(coupling, local_coupling)
-        return self._ode.integrate(self._ode.t + self.dt).reshape(X.shape) + self.dt * stimulus
+        X_next = self._ode.integrate(self._ode.t + self.dt).reshape(X.shape)
+        return X_next.astype(X.dtype, copy=False) + self.dt * stimulus
 
 
 class SciPyODE(SciPyODEBase):
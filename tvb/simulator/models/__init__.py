@@ -52,3 +52,4 @@ from .wilson_cowan import WilsonCowan
 from .wong_wang import ReducedWongWang
 from .wong_wang_exc_inh import ReducedWongWangExcInh
 from .zerlaut import ZerlautFirstOrder, ZerlautSecondOrder
+from .dsl import ModelSpec
@@ -32,7 +32,9 @@ This module defines the common imports and abstract base class for model definit
 """
 import sys
 import abc
+import functools
 import numpy
+import numba
 from tvb.basic.neotraits.api import HasTraits
 if sys.version_info[0] == 3:
     import typing
@@ -50,11 +52,17 @@ class Model(HasTraits):
     """
 
     state_variables = ()  # type: typing.Tuple[str]
+    # state variables evolving on a much slower time scale, for multi-rate integration
+    slow_state_variables = ()  # type: typing.Tuple[str]
     variables_of_interest = ()
     _nvar = None   # todo make this a prop len(state_variables)
     number_of_modes = 1
     cvar = None
     state_variable_boundaries = None
+    # dfun writes the derivatives to an array of the state's shape given as `out`
+    _dfun_out = False
+    # preferred memory layout of states, as in common.empty_state
+    state_layout = 'variable'
 
     def _build_observer(self):
         template = ("def observe(state):\n"
@@ -111,6 +119,34 @@ class Model(HasTraits):
         """
         pass
 
+    def linear_decay(self):
+        r"""
+        Rates :math:`\lambda` of the diagonal linear decay of the state variables,
+        such that the dfun reads :math:`-\lambda X + N(X)`, as an array broadcasting
+        against the state, or None if the model does not declare them. Exponential
+        and IMEX integrators take this linear part exactly.
+
+        """
+        return None
+
+    def split_dfun(self):
+        """
+        Pair of functions ``(fast_dfun, slow_dfun)`` with the signature of the dfun,
+        for multi-rate integration, or None if the model does not declare them. The
+        first gives the derivatives of the state variables other than the slow ones,
+        as an array of the state's shape whose slow rows are not used, the second
+        those of the slow state variables only, such that the slow terms are only
+        evaluated once per slow step.
+
+        """
+        return None
+
+    @staticmethod
+    def _diagonal_decay(*rates):
+        "Stack the decay rates of each state variable, given per node or as scalars."
+        rates = numpy.broadcast_arrays(*[numpy.asarray(rate, dtype=float) for rate in rates])
+        return numpy.array(rates).reshape((len(rates), -1, 1))
+
     def initial(self, dt, history_shape, rng=numpy.random):
         """Generates uniformly distributed initial conditions,
         bounded by the state variable limits defined by the model.
@@ -186,6 +222,77 @@ class Model(HasTraits):
 class ModelNumbaDfun(Model):
     "Base model for Numba-implemented dfuns."
 
+    _dfun_out = True
+    # the generalized ufuncs read and write the state variables of each node contiguously
+    state_layout = 'node'
+
+    @staticmethod
+    def _gufunc_out(out):
+        "View of the `out` argument of the dfun as the (node, nvar) output of its generalized ufunc."
+        if out is not None:
+            return out[..., 0].T
+
     @property
     def spatial_param_reshape(self):
-        return -1,
\ No newline at end of file
+        return -1,
+
+    def _numba_dfun_parameters(self):
+        """
+        Return the Numba generalized ufunc of the dfun and the parameters it takes after the
+        state and coupling, in order, for region simulations without local coupling, or None
+        if the model does not provide one. Used by the fused Numba backend, which calls the
+        dfun node by node.
+
+        """
+        return None
+
+    def _numba_split_dfun(self):
+        """
+        Return the Numba generalized ufuncs of the fast and slow terms, taking the arguments
+        of the dfun's, for multi-rate integration, or None if the model does not declare them.
+        The first leaves the derivatives of the slow state variables at zero, the second only
+        evaluates those. See `split_dfun`.
+
+        """
+        return None
+
+    def _gufunc_dfun(self, gufunc, x, c, local_coupling=0.0, out=None):
+        "Evaluate `gufunc`, taking the arguments of the dfun's generalized ufunc, for state `x` and coupling `c`."
+        raise NotImplementedError
+
+    def split_dfun(self):
+        split = self._numba_split_dfun()
+        if split is None:
+            return None
+        fast, slow = split
+        slow_indices = [self.state_variables.index(name) for name in self.slow_state_variables]
+
+        def fast_dfun(x, c, local_coupling=0.0):
+            return self._gufunc_dfun(fast, x, c, local_coupling)
+
+        def slow_dfun(x, c, local_coupling=0.0):
+            return self._gufunc_dfun(slow, x, c, local_coupling)[slow_indices]
+
+        return fast_dfun, slow_dfun
+
+    # signatures of the single precision loops added to the Numba dfuns
+    _float32_signatures = {}
+
+    @staticmethod
+    def _gufunc_for(gufunc, dtype):
+        """
+        Return the Numba generalized ufunc `gufunc`, bound to its single precision loop
+        for float32 states. The dfuns are compiled in double precision on import, and
+        NumPy would pick that loop for float32 arguments, so the single precision loop
+        is compiled on first use and selected explicitly.
+
+        """
+        if dtype != numpy.float32:
+            return gufunc
+        signature = ModelNumbaDfun._float32_signatures.get(gufunc)
+        if signature is None:
+            inputs, output = gufunc.types[0].replace('d', 'f').split('->')
+            gufunc.add(tuple(numba.from_dtype(numpy.dtype(char))[:] for char in inputs + output))
+            gufunc.build_ufunc()
+            signature = ModelNumbaDfun._float32_signatures[gufunc] = inputs + '->' + output
+        return functools.partial(gufunc, signature=signature)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Declarative model definitions, from which the NumPy, Numba and OpenCL implementations of
+the dfun are generated, such that a model is written once and its implementations cannot
+drift apart. A model is declared by its state variables, parameters, coupling variables and
+the expressions of the derivatives::
+
+    spec = ModelSpec(
+        name='FitzHughNagumo2D',
+        state_variables={'V': (-2.0, 4.0), 'W': (-6.0, 6.0)},
+        parameters={'tau': 3.0, 'a': 0.7, 'b': 0.8, 'I': 0.0},
+        derivatives={'V': 'tau * (V - V**3 / 3.0 + W + I + c_0 + lc_0)',
+                     'W': '(a - V - b * W) / tau'},
+        coupling_variables=('V', ))
+    FitzHughNagumo2D = spec.model_class()
+
+Expressions are Python expressions of the state variables, the parameters, the coupling
+terms ``c_0``, ``c_1``, .. of the coupling variables in order, the local coupling term
+``lc_0`` of the first coupling variable, and the functions and constants of the `math`
+module. Conditionals are written as ``x if V > 0.0 else y``.
+
+"""
+
+import abc
+import ast
+import math
+import time
+import functools
+import numpy
+from numba import guvectorize, float64
+from tvb.basic.neotraits.api import NArray, Final, List
+from ..coupling import _NUMPY_NAMESPACE
+from .base import ModelNumbaDfun
+
+# names available to expressions besides the declared ones
+_MATH_NAMES = frozenset(name for name in dir(math) if not name.startswith('_')) | {'abs', 'min', 'max'}
+# OpenCL C equivalents of the math functions and constants, where the names differ
+_MATH_OPENCL = {'abs': 'fabs', 'min': 'fmin', 'max': 'fmax', 'pi': 'M_PI_F', 'e': 'M_E_F',
+                'inf': 'INFINITY', 'nan': 'NAN'}
+# NumPy equivalents of the names available to expressions
+_NUMPY_DSL_NAMESPACE = dict(_NUMPY_NAMESPACE, where=numpy.where, abs=numpy.abs, min=numpy.minimum, max=numpy.maximum)
+_OPERATORS_OPENCL = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Lt: '<', ast.LtE: '<=',
+                     ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!='}
+
+
+class _Where(ast.NodeTransformer):
+    "Rewrites conditional expressions as calls to where, for evaluation over arrays."
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        where = ast.Call(func=ast.Name(id='where', ctx=ast.Load()), args=[node.test, node.body, node.orelse],
+                         keywords=[])
+        return ast.copy_location(where, node)
+
+
+class _OpenCLPrinter(object):
+    "Prints a Python expression as single precision OpenCL C, declared names shadowing math constants."
+
+    def __init__(self, names):
+        self.names = names
+
+    def __call__(self, node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right
+            if isinstance(exponent, ast.Constant) and exponent.value in (2, 3):
+                return '(%s)' % ' * '.join([self(node.left)] * int(exponent.value))
+            return 'pow(%s, %s)' % (self(node.left), self(exponent))
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS_OPENCL:
+            return '(%s %s %s)' % (self(node.left), _OPERATORS_OPENCL[type(node.op)], self(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            return '(%s%s)' % ('-' if isinstance(node.op, ast.USub) else '+', self(node.operand))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _OPERATORS_OPENCL:
+            return '(%s %s %s)' % (self(node.left), _OPERATORS_OPENCL[type(node.ops[0])], self(node.comparators[0]))
+        if isinstance(node, ast.IfExp):
+            return '(%s ? %s : %s)' % (self(node.test), self(node.body), self(node.orelse))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = _MATH_OPENCL.get(node.func.id, node.func.id)
+            return '%s(%s)' % (name, ', '.join(self(arg) for arg in node.args))
+        if isinstance(node, ast.Name):
+            return node.id if node.id in self.names else _MATH_OPENCL.get(node.id, node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return '%rf' % (float(node.value), )
+        raise ValueError('Unsupported syntax in model expression: %s.' % (ast.dump(node), ))
+
+
+_NUMBA_DFUN = '''
+from math import *
+
+def dfun(_x, _c, {arguments}_lc, _dx):
+{unpack}
+    lc_0 = _lc[0]
+{derivatives}
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_gufunc(source, n_param):
+    "Compile the generated source of a Numba dfun into a generalized ufunc over nodes."
+    namespace = {}
+    exec(source, namespace)
+    signature = '(n),(m)' + ',()' * (n_param + 1) + '->(n)'
+    return guvectorize([(float64[:], ) * (n_param + 4)], signature, nopython=True)(namespace['dfun'])
+
+
+_OPENCL_DFUN = '''// {name}, generated from its declaration
+__kernel void dfun(__global float *state, __global float *coupling,
+                   __global float *param, __global float *deriv)
+{{
+    int i = get_global_id(0), n = get_global_size(0);
+{unpack}
+    float lc_0 = 0.0f;
+{derivatives}
+}}
+'''
+
+
+class ModelSpec(object):
+    """
+    Declaration of a model, with state variables given as a dict of their ranges (lo, hi),
+    parameters as a dict of their default values, derivatives as a dict of expressions by
+    state variable, the coupling variables, and optionally the variables of interest,
+    which default to the state variables, and the boundaries of state variables.
+
+    """
+
+    def __init__(self, name, state_variables, parameters, derivatives, coupling_variables,
+                 variables_of_interest=None, state_variable_boundaries=None, doc=None):
+        self.name = name
+        self.state_variables = tuple(state_variables)
+        self.state_variable_range = {sv: numpy.array(state_variables[sv], dtype=float) for sv in self.state_variables}
+        self.parameters = {name: float(value) for name, value in parameters.items()}
+        self.coupling_variables = tuple(coupling_variables)
+        self.variables_of_interest = tuple(variables_of_interest or self.state_variables)
+        self.state_variable_boundaries = state_variable_boundaries
+        self.doc = doc
+        if set(derivatives) != set(self.state_variables):
+            raise ValueError('Derivatives are declared for %s, expected state variables %s.'
+                             % (sorted(derivatives), sorted(self.state_variables)))
+        if not self.coupling_variables or not set(self.coupling_variables) <= set(self.state_variables):
+            raise ValueError('Coupling variables %s are not state variables of the model.'
+                             % (self.coupling_variables, ))
+        self.derivatives = tuple(derivatives[sv] for sv in self.state_variables)
+        self.coupling_terms = tuple('c_%d' % (i, ) for i in range(len(self.coupling_variables)))
+        self.names = set(self.state_variables) | set(self.parameters) | set(self.coupling_terms) | {'lc_0'}
+        self._trees = tuple(self._parse(sv, expr) for sv, expr in zip(self.state_variables, self.derivatives))
+        self._numpy_code = None
+
+    def _parse(self, sv, expr):
+        "Parse the expression of the derivative of sv, checking the names it refers to."
+        try:
+            tree = ast.parse(expr, mode='eval')
+        except SyntaxError as exc:
+            raise ValueError('Invalid expression for the derivative of %s: %s' % (sv, exc))
+        unknown = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - self.names - _MATH_NAMES
+        if unknown:
+            raise ValueError('Unknown names %s in the derivative of %s.' % (sorted(unknown), sv))
+        return tree
+
+    @property
+    def cvar(self):
+        "Indices of the coupling variables among the state variables."
+        return numpy.array([self.state_variables.index(sv) for sv in self.coupling_variables], dtype=numpy.int32)
+
+    def numpy_code(self):
+        "Code objects evaluating the derivatives over arrays, in order of the state variables."
+        if self._numpy_code is None:
+            trees = (_Where().visit(ast.parse(expr, mode='eval')) for expr in self.derivatives)
+            self._numpy_code = tuple(compile(ast.fix_missing_locations(tree), '<%s>' % (self.name, ), 'eval')
+                                     for tree in trees)
+        return self._numpy_code
+
+    def numba_source(self):
+        "Source of the Python function compiled by Numba as the generalized ufunc of the dfun."
+        arguments = ''.join('p_%s, ' % (name, ) for name in self.parameters)
+        unpack = ['    %s = _x[%d]' % (sv, i) for i, sv in enumerate(self.state_variables)]
+        unpack += ['    %s = _c[%d]' % (term, i) for i, term in enumerate(self.coupling_terms)]
+        unpack += ['    %s = p_%s[0]' % (name, name) for name in self.parameters]
+        derivatives = ['    _dx[%d] = %s' % (i, expr) for i, expr in enumerate(self.derivatives)]
+        return _NUMBA_DFUN.format(arguments=arguments, unpack='\n'.join(unpack), derivatives='\n'.join(derivatives))
+
+    def numba_gufunc(self):
+        "Numba generalized ufunc of the state, coupling, parameters and local coupling of a node."
+        return _numba_gufunc(self.numba_source(), len(self.parameters))
+
+    def opencl_source(self):
+        """
+        Source of the OpenCL kernel of the dfun, over nodes in single precision, following the
+        conventions of `tvb.simulator._opencl.models.CLModel`: the state, coupling, parameter
+        and derivative arrays are variable major, i.e. element k of node i at k * n + i.
+
+        """
+        printer = _OpenCLPrinter(self.names)
+        unpack = ['    float %s = state[%d * n + i];' % (sv, i) for i, sv in enumerate(self.state_variables)]
+        unpack += ['    float %s = coupling[%d * n + i];' % (term, i) for i, term in enumerate(self.coupling_terms)]
+        unpack += ['    float %s = param[%d * n + i];' % (name, i) for i, name in enumerate(self.parameters)]
+        derivatives = ['    deriv[%d * n + i] = %s;' % (i, printer(tree.body)) for i, tree in enumerate(self._trees)]
+        return _OPENCL_DFUN.format(name=self.name, unpack='\n'.join(unpack), derivatives='\n'.join(derivatives))
+
+    def model_class(self):
+        """
+        Create the model class declared by the specification, whose dfun evaluates the
+        generated Numba generalized ufunc, with the NumPy implementation as `_numpy_dfun`.
+        Class names are registered by the traits system and should be unique.
+
+        """
+        attrs = {'spec': self, '__module__': __name__, '__doc__': self.doc or 'Model %s, generated from its declaration.' % (self.name, )}
+        for name, value in self.parameters.items():
+            attrs[name] = NArray(label=name, default=numpy.array([value]), doc="Parameter %s." % (name, ))
+        attrs['state_variable_range'] = Final(
+            label="State Variable ranges [lo, hi]",
+            default=self.state_variable_range,
+            doc="Ranges of the state variables, used to draw random initial conditions.")
+        if self.state_variable_boundaries is not None:
+            attrs['state_variable_boundaries'] = Final(
+                label="State Variable boundaries [lo, hi]",
+                default={sv: numpy.array(bounds, dtype=float) for sv, bounds in self.state_variable_boundaries.items()},
+                doc="Boundaries of the state variables. Set None for one-sided boundaries.")
+        attrs['variables_of_interest'] = List(
+            of=str,
+            label="Variables or quantities available to Monitors",
+            choices=self.state_variables,
+            default=self.variables_of_interest,
+            doc="The quantities of interest for monitoring.")
+        attrs['state_variables'] = self.state_variables
+        attrs['_nvar'] = len(self.state_variables)
+        attrs['cvar'] = self.cvar
+        return type(self.name, (DeclaredModel, ), attrs)
+
+
+
+class DeclaredModel(ModelNumbaDfun):
+    "Base class of the models created by `ModelSpec.model_class`."
+
+    @property
+    @abc.abstractmethod
+    def spec(self):
+        "The declaration of the model."
+
+    def _parameter_values(self):
+        return tuple(getattr(self, name) for name in self.spec.parameters)
+
+    def _numpy_dfun(self, state_variables, coupling, local_coupling=0.0):
+        "Derivatives evaluated by NumPy from the declared expressions."
+        spec = self.spec
+        namespace = dict(_NUMPY_DSL_NAMESPACE)
+        for name, value in zip(spec.parameters, self._parameter_values()):
+            namespace[name] = value.reshape((-1, 1)) if numpy.ndim(value) == 1 else value
+        namespace.update(zip(spec.state_variables, state_variables))
+        namespace.update(zip(spec.coupling_terms, coupling))
+        namespace['lc_0'] = local_coupling * state_variables[self.cvar[0]]
+        derivative = numpy.empty_like(state_variables)
+        for i, code in enumerate(spec.numpy_code()):
+            derivative[i] = eval(code, namespace)
+        return derivative
+
+    def _numba_dfun_parameters(self):
+        return self.spec.numba_gufunc(), self._parameter_values() + (0.0, )
+
+    def dfun(self, state_variables, coupling, local_coupling=0.0, out=None):
+        lc_0 = local_coupling * state_variables[self.cvar[0], :, 0]
+        x_ = state_variables.reshape(state_variables.shape[:-1]).T
+        c_ = coupling.reshape(coupling.shape[:-1]).T
+        numba_dfun = self._gufunc_for(self.spec.numba_gufunc(), x_.dtype)
+        deriv = numba_dfun(x_, c_, *(self._parameter_values() + (lc_0, )), out=self._gufunc_out(out))
+        return deriv.T[..., numpy.newaxis]
+
+    @property
+    def _opencl_ordered_params(self):
+        return tuple(self.spec.parameters)
+
+    @property
+    def _opencl_program_source(self):
+        return self.spec.opencl_source()
+
+
+def benchmark_backends(model, n_node=1024, n_repeat=10):
+    """
+    Time the NumPy and Numba dfuns of a declared model for random states of `n_node` nodes,
+    returning the best of `n_repeat` times per call in seconds, by backend name. The dfuns
+    are evaluated once beforehand, such that compilation is not timed.
+
+    """
+    rng = numpy.random.RandomState(42)
+    state = model.initial(0.1, (1, model.nvar, n_node, 1), rng)[0]
+    coupling = rng.randn(len(model.cvar), n_node, 1)
+    times = {}
+    for name, dfun in (('numpy', model._numpy_dfun), ('numba', model.dfun)):
+        dfun(state, coupling)
+        best = numpy.inf
+        for _ in range(n_repeat):
+            tic = time.perf_counter()
+            dfun(state, coupling)
+            best = min(best, time.perf_counter() - tic)
+        times[name] = best
+    return times
@@ -32,16 +32,13 @@ Hindmarsh-Rose-Jirsa Epileptor model.
 """
 import numpy
 from .base import ModelNumbaDfun
-from numba import guvectorize, float64
+from numba import guvectorize, float64, njit
 from tvb.basic.neotraits.api import NArray, List, Range, Final
 
 
-@guvectorize([(float64[:],) * 20], '(n),(m)' + ',()'*17 + '->(n)', nopython=True)
-def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau, modification, ydot):
-    "Gufunc for Hindmarsh-Rose-Jirsa Epileptor model equations."
-
-    c_pop1 = c_pop[0]
-    c_pop2 = c_pop[1]
+@njit
+def _fast_equations(y, c_pop1, c_pop2, Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau, ydot):
+    "Epileptor equations of the fast state variables, shared by the generalized ufuncs."
 
     # population 1
     if y[0] < 0.0:
@@ -51,6 +48,22 @@ def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf
     ydot[0] = tt[0] * (y[1] - y[2] + Iext[0] + Kvf[0] * c_pop1 + ydot[0] * y[0])
     ydot[1] = tt[0] * (c[0] - d[0] * y[0] ** 2 - y[1])
 
+    # population 2
+    ydot[3] = tt[0] * (-y[4] + y[3] - y[3] ** 3 + Iext2[0] + bb[0] * y[5] - 0.3 * (y[2] - 3.5) + Kf[0] * c_pop2)
+    if y[3] < -0.25:
+        ydot[4] = 0.0
+    else:
+        ydot[4] = aa[0] * (y[3] + 0.25)
+    ydot[4] = tt[0] * ((-y[4] + ydot[4]) / tau[0])
+
+    # filter
+    ydot[5] = tt[0] * (-0.01 * (y[5] - 0.1 * y[0]))
+
+
+@njit
+def _slow_equations(y, c_pop1, x0, tt, r, Ks, modification, ydot):
+    "Epileptor equation of the slow permittivity z, shared by the generalized ufuncs."
+
     # energy
     if y[2] < 0.0:
         ydot[2] = - 0.1 * y[2] ** 7
@@ -62,16 +75,25 @@ def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf
         h = 4 * (y[0] - x0[0]) + ydot[2]
     ydot[2] = tt[0] * (r[0] * (h - y[2]  + Ks[0] * c_pop1))
 
-    # population 2
-    ydot[3] = tt[0] * (-y[4] + y[3] - y[3] ** 3 + Iext2[0] + bb[0] * y[5] - 0.3 * (y[2] - 3.5) + Kf[0] * c_pop2)
-    if y[3] < -0.25:
-        ydot[4] = 0.0
-    else:
-        ydot[4] = aa[0] * (y[3] + 0.25)
-    ydot[4] = tt[0] * ((-y[4] + ydot[4]) / tau[0])
 
-    # filter
-    ydot[5] = tt[0] * (-0.01 * (y[5] - 0.1 * y[0]))
+@guvectorize([(float64[:],) * 20], '(n),(m)' + ',()'*17 + '->(n)', nopython=True)
+def _numba_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau, modification, ydot):
+    "Gufunc for Hindmarsh-Rose-Jirsa Epileptor model equations."
+    _fast_equations(y, c_pop[0], c_pop[1], Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau, ydot)
+    _slow_equations(y, c_pop[0], x0, tt, r, Ks, modification, ydot)
+
+
+@guvectorize([(float64[:],) * 20], '(n),(m)' + ',()'*17 + '->(n)', nopython=True)
+def _numba_fast_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau, modification, ydot):
+    "Gufunc for the Epileptor equations of the fast state variables, leaving the slow z at zero."
+    _fast_equations(y, c_pop[0], c_pop[1], Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau, ydot)
+    ydot[2] = 0.0
+
+
+@guvectorize([(float64[:],) * 20], '(n),(m)' + ',()'*17 + '->(n)', nopython=True)
+def _numba_slow_dfun(y, c_pop, x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau, modification, ydot):
+    "Gufunc for the Epileptor equation of the slow z, leaving the fast state variables unevaluated."
+    _slow_equations(y, c_pop[0], x0, tt, r, Ks, modification, ydot)
 
 
 class Epileptor(ModelNumbaDfun):
@@ -283,6 +305,7 @@ class Epileptor(ModelNumbaDfun):
     )
 
     state_variables = ('x1', 'y1', 'z', 'x2', 'y2', 'g')
+    slow_state_variables = ('z', )
 
     _nvar = 6
     cvar = numpy.array([0, 3], dtype=numpy.int32)  # should these not be constant Attr's?
@@ -363,15 +386,26 @@ class Epileptor(ModelNumbaDfun):
 
         return ydot
 
-    def dfun(self, x, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun, (self.x0, self.Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
+                             self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.bb, self.tau, self.modification)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
+        return self._gufunc_dfun(_numba_dfun, x, c, local_coupling, out)
+
+    def _gufunc_dfun(self, gufunc, x, c, local_coupling, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         Iext = self.Iext + local_coupling * x[0, :, 0]
-        deriv = _numba_dfun(x_, c_,
+        deriv = self._gufunc_for(gufunc, x_.dtype)(x_, c_,
                          self.x0, Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
-                         self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.bb, self.tau, self.modification)
+                         self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.bb, self.tau, self.modification,
+                         out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
+    def _numba_split_dfun(self):
+        return _numba_fast_dfun, _numba_slow_dfun
+
 
 
 
@@ -491,6 +525,7 @@ class Epileptor2D(ModelNumbaDfun):
         doc="Quantities of the Epileptor 2D available to monitor.")
 
     state_variables = ('x1', 'z')
+    slow_state_variables = ('z', )
 
     _nvar = 2
     cvar = numpy.array([0], dtype=numpy.int32)
@@ -528,23 +563,30 @@ class Epileptor2D(ModelNumbaDfun):
 
         return ydot
 
-    def dfun(self, x, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun_epi2d, (self.x0, self.Iext, self.a, self.b, self.slope, self.c,
+                                   self.d, self.r, self.Kvf, self.Ks, self.tt, self.modification)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
         """"The dfun using numba for speed."""
+        return self._gufunc_dfun(_numba_dfun_epi2d, x, c, local_coupling, out)
 
+    def _gufunc_dfun(self, gufunc, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         Iext = self.Iext + local_coupling * x[0, :, 0]
-        deriv = _numba_dfun_epi2d(x_, c_,
+        deriv = self._gufunc_for(gufunc, x_.dtype)(x_, c_,
                             self.x0, Iext, self.a, self.b, self.slope, self.c,
-                            self.d, self.r, self.Kvf, self.Ks, self.tt, self.modification)
+                            self.d, self.r, self.Kvf, self.Ks, self.tt, self.modification, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
+    def _numba_split_dfun(self):
+        return _numba_fast_dfun_epi2d, _numba_slow_dfun_epi2d
 
-@guvectorize([(float64[:],) * 15], '(n),(m)' + ',()'* 12 + '->(n)', nopython=True)
-def _numba_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, modification, ydot):
-    "Gufunction for Epileptor 2D model equations."
 
-    c_pop = c_pop[0]
+@njit
+def _fast_equations_epi2d(y, c_pop, Iext, a, b, slope, c, d, Kvf, tt, ydot):
+    "Epileptor 2D equation of the fast x1, shared by the generalized ufuncs."
 
     # population 1
     if y[0] < 0.0:
@@ -553,6 +595,11 @@ def _numba_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, mod
         ydot[0] = - slope[0] - 0.6 * (y[1] - 4.0) ** 2 + d[0] * y[0]
     ydot[0] = tt[0] * (c[0] - y[1] + Iext[0] + Kvf[0] * c_pop - ydot[0] * y[0])
 
+
+@njit
+def _slow_equations_epi2d(y, c_pop, x0, r, Ks, tt, modification, ydot):
+    "Epileptor 2D equation of the slow permittivity z, shared by the generalized ufuncs."
+
     # energy
     if y[1] < 0.0:
         ydot[1] = - 0.1 * y[1] ** 7
@@ -565,3 +612,23 @@ def _numba_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, mod
         h = 4 * (y[0] - x0[0]) + ydot[1]
 
     ydot[1] = tt[0] * (r[0] * (h - y[1] + Ks[0] * c_pop))
+
+
+@guvectorize([(float64[:],) * 15], '(n),(m)' + ',()'* 12 + '->(n)', nopython=True)
+def _numba_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, modification, ydot):
+    "Gufunction for Epileptor 2D model equations."
+    _fast_equations_epi2d(y, c_pop[0], Iext, a, b, slope, c, d, Kvf, tt, ydot)
+    _slow_equations_epi2d(y, c_pop[0], x0, r, Ks, tt, modification, ydot)
+
+
+@guvectorize([(float64[:],) * 15], '(n),(m)' + ',()'* 12 + '->(n)', nopython=True)
+def _numba_fast_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, modification, ydot):
+    "Gufunction for the Epileptor 2D equation of the fast x1, leaving the slow z at zero."
+    _fast_equations_epi2d(y, c_pop[0], Iext, a, b, slope, c, d, Kvf, tt, ydot)
+    ydot[1] = 0.0
+
+
+@guvectorize([(float64[:],) * 15], '(n),(m)' + ',()'* 12 + '->(n)', nopython=True)
+def _numba_slow_dfun_epi2d(y, c_pop, x0, Iext, a, b, slope, c, d, r, Kvf, Ks, tt, modification, ydot):
+    "Gufunction for the Epileptor 2D equation of the slow z, leaving the fast x1 unevaluated."
+    _slow_equations_epi2d(y, c_pop[0], x0, r, Ks, tt, modification, ydot)
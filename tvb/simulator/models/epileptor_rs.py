@@ -34,7 +34,7 @@
 
 import numpy
 from .base import ModelNumbaDfun
-from numba import guvectorize, float64
+from numba import guvectorize, float64, njit
 from tvb.basic.neotraits.api import NArray, List, Range, Final
 
 
@@ -293,6 +293,7 @@ class EpileptorRestingState(ModelNumbaDfun):
         doc="Quantities of JC_Epileptor available to monitor.")
 
     state_variables = ("x1", "y1", "z", "x2", "y2", "g", "x_rs", "y_rs")
+    slow_state_variables = ("z", )
 
     _nvar = 8                                           # number of state-variables
     cvar = numpy.array([0, 3, 6], dtype=numpy.int32)    # coupling variables
@@ -347,30 +348,35 @@ class EpileptorRestingState(ModelNumbaDfun):
         return ydot
 
 
-    def dfun(self, x, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun, (self.x0, self.Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
+                             self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.bb, self.tau,
+                             self.tau_rs, self.I_rs, self.a_rs, self.b_rs, self.d_rs, self.e_rs, self.f_rs,
+                             self.beta_rs, self.alpha_rs, self.gamma_rs, self.K_rs, 0.0)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
+        return self._gufunc_dfun(_numba_dfun, x, c, local_coupling, out)
+
+    def _gufunc_dfun(self, gufunc, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         Iext = self.Iext + local_coupling * x[0, :, 0]
         lc_1 = local_coupling * x[6, :, 0]
-        deriv = _numba_dfun(x_, c_,
+        deriv = self._gufunc_for(gufunc, x_.dtype)(x_, c_,
                             self.x0, Iext, self.Iext2, self.a, self.b, self.slope, self.tt, self.Kvf,
                             self.c, self.d, self.r, self.Ks, self.Kf, self.aa, self.bb, self.tau,
                             self.tau_rs, self.I_rs, self.a_rs, self.b_rs, self.d_rs, self.e_rs, self.f_rs,
-                            self.beta_rs, self.alpha_rs, self.gamma_rs, self.K_rs, lc_1)
+                            self.beta_rs, self.alpha_rs, self.gamma_rs, self.K_rs, lc_1, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
+    def _numba_split_dfun(self):
+        return _numba_fast_dfun, _numba_slow_dfun
 
-@guvectorize([(float64[:],) * 31], '(n),(m)' + ',()' * 28 + '->(n)', nopython=True)
-def _numba_dfun(y, c_pop,
-                x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau,
-                tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1,
-                ydot):
-    "Gufunc for JC_Epileptor model equations."
 
-    #long-range coupling
-    c_pop1 = c_pop[0]
-    c_pop2 = c_pop[1]
-    c_pop3 = c_pop[2]
+@njit
+def _fast_equations(y, c_pop1, c_pop2, c_pop3, Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau,
+                    tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1, ydot):
+    "JC_Epileptor equations of the fast state variables, shared by the generalized ufuncs."
 
     # Epileptor equations
     #population 1
@@ -381,13 +387,6 @@ def _numba_dfun(y, c_pop,
     ydot[0] = tt[0] * (y[1] - y[2] + Iext[0] + Kvf[0] * c_pop1 + ydot[0] * y[0])
     ydot[1] = tt[0] * (c[0] - d[0] * y[0] ** 2 - y[1])
 
-    #energy
-    if y[2] < 0.0:
-        ydot[2] = - 0.1 * y[2] ** 7
-    else:
-        ydot[2] = 0.0
-    ydot[2] = tt[0] * (r[0] * (4 * (y[0] - x0[0]) + ydot[2] - y[2]  + Ks[0] * c_pop1))
-
     #population 2
     ydot[3] = tt[0] * (-y[4] + y[3] - y[3] ** 3 + Iext2[0] + bb[0] * y[5] - 0.3 * (y[2] - 3.5) + Kf[0] * c_pop2)
     if y[3] < -0.25:
@@ -403,3 +402,45 @@ def _numba_dfun(y, c_pop,
     ydot[6] = d_rs[0] * tau_rs[0] * (alpha_rs[0] * y[7] - f_rs[0] * y[6] ** 3 + e_rs[0] * y[6] ** 2 + gamma_rs[0] * I_rs[0] + gamma_rs[0] * K_rs[0] * c_pop3 + lc_1[0])
     ydot[7] = d_rs[0] * (a_rs[0] + b_rs[0] * y[6] - beta_rs[0] * y[7]) / tau_rs[0]
 
+
+@njit
+def _slow_equations(y, c_pop1, x0, tt, r, Ks, ydot):
+    "JC_Epileptor equation of the slow permittivity z, shared by the generalized ufuncs."
+
+    #energy
+    if y[2] < 0.0:
+        ydot[2] = - 0.1 * y[2] ** 7
+    else:
+        ydot[2] = 0.0
+    ydot[2] = tt[0] * (r[0] * (4 * (y[0] - x0[0]) + ydot[2] - y[2]  + Ks[0] * c_pop1))
+
+
+@guvectorize([(float64[:],) * 31], '(n),(m)' + ',()' * 28 + '->(n)', nopython=True)
+def _numba_dfun(y, c_pop,
+                x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau,
+                tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1,
+                ydot):
+    "Gufunc for JC_Epileptor model equations."
+    _fast_equations(y, c_pop[0], c_pop[1], c_pop[2], Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau,
+                    tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1, ydot)
+    _slow_equations(y, c_pop[0], x0, tt, r, Ks, ydot)
+
+
+@guvectorize([(float64[:],) * 31], '(n),(m)' + ',()' * 28 + '->(n)', nopython=True)
+def _numba_fast_dfun(y, c_pop,
+                     x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau,
+                     tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1,
+                     ydot):
+    "Gufunc for the JC_Epileptor equations of the fast state variables, leaving the slow z at zero."
+    _fast_equations(y, c_pop[0], c_pop[1], c_pop[2], Iext, Iext2, a, b, slope, tt, Kvf, c, d, Kf, aa, bb, tau,
+                    tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1, ydot)
+    ydot[2] = 0.0
+
+
+@guvectorize([(float64[:],) * 31], '(n),(m)' + ',()' * 28 + '->(n)', nopython=True)
+def _numba_slow_dfun(y, c_pop,
+                     x0, Iext, Iext2, a, b, slope, tt, Kvf, c, d, r, Ks, Kf, aa, bb, tau,
+                     tau_rs, I_rs, a_rs, b_rs, d_rs, e_rs, f_rs, beta_rs, alpha_rs, gamma_rs, K_rs, lc_1,
+                     ydot):
+    "Gufunc for the JC_Epileptor equation of the slow z, leaving the fast state variables unevaluated."
+    _slow_equations(y, c_pop[0], x0, tt, r, Ks, ydot)
@@ -37,7 +37,7 @@ Saggio codimension 3 Epileptor model
 import numpy
 
 from .base import ModelNumbaDfun
-from numba import guvectorize, float64, int_
+from numba import guvectorize, float64, int_, njit
 from tvb.basic.neotraits.api import NArray, List, Range, Final
 
 
@@ -161,6 +161,7 @@ class EpileptorCodim3(ModelNumbaDfun):
 
     # state variables names
     state_variables = ('x', 'y', 'z')
+    slow_state_variables = ('z', )
 
     # number of state variables
     _nvar = 3
@@ -274,51 +275,113 @@ class EpileptorCodim3(ModelNumbaDfun):
         self.F = numpy.cross(numpy.cross(A, B), A)
         self.F = self.F / numpy.linalg.norm(self.F)
 
-    def dfun(self, state_variables, coupling, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun, (self.E[0], self.E[1], self.E[2], self.F[0], self.F[1],
+                             self.F[2], self.b, self.R, self.c, self.dstar, self.Ks, self.modification, self.N)
+
+    def dfun(self, state_variables, coupling, local_coupling=0.0, out=None):
         """"The dfun using numba for speed"""
+        return self._gufunc_dfun(_numba_dfun, state_variables, coupling, local_coupling, out)
+
+    def _gufunc_dfun(self, gufunc, state_variables, coupling, local_coupling=0.0, out=None):
         state_variables_ = state_variables.reshape(state_variables.shape[:-1]).T
         coupling_ = coupling.reshape(coupling.shape[:-1]).T
-        derivative = _numba_dfun(state_variables_, coupling_, self.E[0], self.E[1], self.E[2], self.F[0], self.F[1],
-                                 self.F[2], self.b, self.R, self.c, self.dstar, self.Ks, self.modification, self.N)
+        numba_dfun = self._gufunc_for(gufunc, state_variables_.dtype)
+        derivative = numba_dfun(state_variables_, coupling_, self.E[0], self.E[1], self.E[2], self.F[0], self.F[1],
+                                self.F[2], self.b, self.R, self.c, self.dstar, self.Ks, self.modification, self.N,
+                                out=self._gufunc_out(out))
         return derivative.T[..., numpy.newaxis]
 
+    def _numba_split_dfun(self):
+        return _numba_fast_dfun, _numba_slow_dfun
 
-@guvectorize([(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
-               float64[:], float64[:], float64[:], float64[:], float64[:], int_[:], int_[:], float64[:])],
-             '(n),(m)' + ',()' * 13 + '->(n)', nopython=True)
-def _numba_dfun(state_variables, coupling, E0, E1, E2, F0, F1, F2, b, R, c, dstar, Ks, modification, N, derivative):
-    """Gufunction for the Epileptor Codim 3 model"""
 
-    x = state_variables[0]
-    y = state_variables[1]
-    z = state_variables[2]
+@njit
+def _great_arc(z, R, E0, E1, E2, F0, F1, F2):
+    "Values of mu2, mu1 and nu on the great arc (E, F, R) at the value of the slow variable z."
+    mu2 = R * (E0 * numpy.cos(z) + F0 * numpy.sin(z))
+    mu1 = -R * (E1 * numpy.cos(z) + F1 * numpy.sin(z))
+    nu = R * (E2 * numpy.cos(z) + F2 * numpy.sin(z))
+    return mu2, mu1, nu
 
-    # Computes the values of mu2,mu1 and nu given the great arc (E,F,R) and the value of the slow variable z
-    mu2 = R[0] * (E0[0] * numpy.cos(z) + F0[0] * numpy.sin(z))
-    mu1 = -R[0] * (E1[0] * numpy.cos(z) + F1[0] * numpy.sin(z))
-    nu = R[0] * (E2[0] * numpy.cos(z) + F2[0] * numpy.sin(z))
 
-    # Computes x_s, which is the solution to x_s^3 - mu2*x_s - mu1 = 0
-    if N[0] == 1:
+@njit
+def _resting_state(mu2, mu1, N):
+    "x_s, the real part of the solution of branch N to x_s^3 - mu2*x_s - mu1 = 0."
+    if N == 1:
         xs = (mu1 / 2.0 + numpy.sqrt(
             mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) + (mu1 / 2.0 - numpy.sqrt(
             mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0)
-    elif N[0] == 2:
+    elif N == 2:
         xs = -1.0 / 2.0 * (1.0 - 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 + numpy.sqrt(
             mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) - 1.0 / 2.0 * (
             1.0 + 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 - numpy.sqrt(mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (
             1.0 / 3.0)
-    elif N[0] == 3:
+    elif N == 3:
         xs = -1.0 / 2.0 * (1.0 + 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 + numpy.sqrt(
             mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) - 1.0 / 2.0 * (
             1.0 - 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 - numpy.sqrt(mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (
             1.0 / 3.0)
-    xs = xs.real
+    return xs.real
+
 
+@njit
+def _fast_equations(x, y, mu2, mu1, nu, b, derivative):
+    "Equations of the fast subsystem x and y, shared by the generalized ufuncs."
     derivative[0] = -y
-    derivative[1] = x ** 3 - mu2 * x - mu1 - y * (nu + b[0] * x + x ** 2)
-    derivative[2] = -c[0] * (
-        numpy.sqrt((x - xs) ** 2 + y ** 2) - dstar[0] + modification[0] * 0.1 * (z - 0.5) ** 7 + Ks[0] * coupling[0])
+    derivative[1] = x ** 3 - mu2 * x - mu1 - y * (nu + b * x + x ** 2)
+
+
+@njit
+def _slow_equation(x, y, z, mu2, mu1, coupling, c, dstar, Ks, modification, N):
+    "Derivative of the slow variable z, shared by the generalized ufuncs."
+    xs = _resting_state(mu2, mu1, N)
+    return -c * (numpy.sqrt((x - xs) ** 2 + y ** 2) - dstar + modification * 0.1 * (z - 0.5) ** 7 + Ks * coupling)
+
+
+_CODIM3_SIGNATURE = [(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
+                      float64[:], float64[:], float64[:], float64[:], float64[:], int_[:], int_[:], float64[:])]
+_CODIM3_LAYOUT = '(n),(m)' + ',()' * 13 + '->(n)'
+
+
+@guvectorize(_CODIM3_SIGNATURE, _CODIM3_LAYOUT, nopython=True)
+def _numba_dfun(state_variables, coupling, E0, E1, E2, F0, F1, F2, b, R, c, dstar, Ks, modification, N, derivative):
+    """Gufunction for the Epileptor Codim 3 model"""
+
+    x = state_variables[0]
+    y = state_variables[1]
+    z = state_variables[2]
+
+    mu2, mu1, nu = _great_arc(z, R[0], E0[0], E1[0], E2[0], F0[0], F1[0], F2[0])
+    _fast_equations(x, y, mu2, mu1, nu, b[0], derivative)
+    derivative[2] = _slow_equation(x, y, z, mu2, mu1, coupling[0], c[0], dstar[0], Ks[0], modification[0], N[0])
+
+
+@guvectorize(_CODIM3_SIGNATURE, _CODIM3_LAYOUT, nopython=True)
+def _numba_fast_dfun(state_variables, coupling, E0, E1, E2, F0, F1, F2, b, R, c, dstar, Ks, modification, N,
+                     derivative):
+    """Gufunction for the fast subsystem of the Epileptor Codim 3 model, leaving the slow z at zero"""
+
+    x = state_variables[0]
+    y = state_variables[1]
+    z = state_variables[2]
+
+    mu2, mu1, nu = _great_arc(z, R[0], E0[0], E1[0], E2[0], F0[0], F1[0], F2[0])
+    _fast_equations(x, y, mu2, mu1, nu, b[0], derivative)
+    derivative[2] = 0.0
+
+
+@guvectorize(_CODIM3_SIGNATURE, _CODIM3_LAYOUT, nopython=True)
+def _numba_slow_dfun(state_variables, coupling, E0, E1, E2, F0, F1, F2, b, R, c, dstar, Ks, modification, N,
+                     derivative):
+    """Gufunction for the slow z of the Epileptor Codim 3 model, leaving the fast subsystem unevaluated"""
+
+    x = state_variables[0]
+    y = state_variables[1]
+    z = state_variables[2]
+
+    mu2, mu1, nu = _great_arc(z, R[0], E0[0], E1[0], E2[0], F0[0], F1[0], F2[0])
+    derivative[2] = _slow_equation(x, y, z, mu2, mu1, coupling[0], c[0], dstar[0], Ks[0], modification[0], N[0])
 
 
 class EpileptorCodim3SlowMod(ModelNumbaDfun):
@@ -487,6 +550,7 @@ class EpileptorCodim3SlowMod(ModelNumbaDfun):
 
     # state variables names
     state_variables = ('x', 'y', 'z', 'uA', 'uB')
+    slow_state_variables = ('z', 'uA', 'uB')
 
     # number of state variables
     _nvar = 5
@@ -642,21 +706,51 @@ class EpileptorCodim3SlowMod(ModelNumbaDfun):
         self.M = numpy.cross(numpy.cross(Bin, Bend), Bin)
         self.M = self.M / numpy.linalg.norm(self.M)
 
-    def dfun(self, state_variables, coupling, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun_slowmod, (self.G[0], self.G[1], self.G[2], self.H[0],
+                                     self.H[1], self.H[2], self.L[0], self.L[1], self.L[2], self.M[0], self.M[1],
+                                     self.M[2], self.b, self.R, self.c, self.cA, self.cB, self.dstar, self.Ks,
+                                     self.modification, self.N)
+
+    def dfun(self, state_variables, coupling, local_coupling=0.0, out=None):
         """"The dfun using numba for speed"""
+        return self._gufunc_dfun(_numba_dfun_slowmod, state_variables, coupling, local_coupling, out)
+
+    def _gufunc_dfun(self, gufunc, state_variables, coupling, local_coupling=0.0, out=None):
         state_variables_ = state_variables.reshape(state_variables.shape[:-1]).T
         coupling_ = coupling.reshape(coupling.shape[:-1]).T
-        derivative = _numba_dfun_slowmod(state_variables_, coupling_, self.G[0], self.G[1], self.G[2], self.H[0],
-                                         self.H[1], self.H[2], self.L[0], self.L[1], self.L[2], self.M[0], self.M[1],
-                                         self.M[2], self.b, self.R, self.c, self.cA, self.cB, self.dstar, self.Ks,
-                                         self.modification, self.N)
+        numba_dfun = self._gufunc_for(gufunc, state_variables_.dtype)
+        derivative = numba_dfun(state_variables_, coupling_, self.G[0], self.G[1], self.G[2], self.H[0],
+                                self.H[1], self.H[2], self.L[0], self.L[1], self.L[2], self.M[0], self.M[1],
+                                self.M[2], self.b, self.R, self.c, self.cA, self.cB, self.dstar, self.Ks,
+                                self.modification, self.N, out=self._gufunc_out(out))
         return derivative.T[..., numpy.newaxis]
 
+    def _numba_split_dfun(self):
+        return _numba_fast_dfun_slowmod, _numba_slow_dfun_slowmod
+
 
-@guvectorize([(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
-               float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
-               float64[:], float64[:], float64[:], float64[:], float64[:], int_[:], int_[:], float64[:])],
-             '(n),(m)' + ',()' * 21 + '->(n)', nopython=True)
+@njit
+def _moving_arc(uA, uB, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, R):
+    "Unit vectors E and F of the great arc between the offset and onset points moved by uA and uB."
+    A = R[0] * (numpy.array([G0[0], G1[0], G2[0]]) * numpy.cos(uA) + numpy.array([H0[0], H1[0], H2[0]]) * numpy.sin(uA))
+    B = R[0] * (numpy.array([L0[0], L1[0], L2[0]]) * numpy.cos(uB) + numpy.array([M0[0], M1[0], M2[0]]) * numpy.sin(uB))
+
+    E = A / (numpy.linalg.norm(A))
+    # Numba does not support numpy.cross so we compute the cross-product using the standard formula.
+    C = numpy.array([A[1] * B[2] - A[2] * B[1], A[2] * B[0] - A[0] * B[2], A[0] * B[1] - A[1] * B[0]])
+    F = numpy.array([C[1] * A[2] - C[2] * A[1], C[2] * A[0] - C[0] * A[2], C[0] * A[1] - C[1] * A[0]])
+    F = F / (numpy.linalg.norm(F))
+    return E, F
+
+
+_SLOWMOD_SIGNATURE = [(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
+                       float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:],
+                       float64[:], float64[:], float64[:], float64[:], float64[:], int_[:], int_[:], float64[:])]
+_SLOWMOD_LAYOUT = '(n),(m)' + ',()' * 21 + '->(n)'
+
+
+@guvectorize(_SLOWMOD_SIGNATURE, _SLOWMOD_LAYOUT, nopython=True)
 def _numba_dfun_slowmod(state_variables, coupling, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, b, R, c, cA, cB,
                         dstar, Ks, modification, N, derivative):
     """Gufunction for the Epileptor Codim 3 model with ultra-slow modulation of classes"""
@@ -667,40 +761,48 @@ def _numba_dfun_slowmod(state_variables, coupling, G0, G1, G2, H0, H1, H2, L0, L
     uA = state_variables[3]
     uB = state_variables[4]
 
-    A = R[0] * (numpy.array([G0[0], G1[0], G2[0]]) * numpy.cos(uA) + numpy.array([H0[0], H1[0], H2[0]]) * numpy.sin(uA))
-    B = R[0] * (numpy.array([L0[0], L1[0], L2[0]]) * numpy.cos(uB) + numpy.array([M0[0], M1[0], M2[0]]) * numpy.sin(uB))
+    E, F = _moving_arc(uA, uB, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, R)
+    mu2, mu1, nu = _great_arc(z, R[0], E[0], E[1], E[2], F[0], F[1], F[2])
+    _fast_equations(x, y, mu2, mu1, nu, b[0], derivative)
+    derivative[2] = _slow_equation(x, y, z, mu2, mu1, coupling[0], c[0], dstar[0], Ks[0], modification[0], N[0])
+    derivative[3] = cA[0]
+    derivative[4] = cB[0]
 
-    E = A / (numpy.linalg.norm(A))
-    # Numba does not support numpy.cross so we compute the cross-product using the standard formula.
-    C = numpy.array([A[1] * B[2] - A[2] * B[1], A[2] * B[0] - A[0] * B[2], A[0] * B[1] - A[1] * B[0]])
-    F = numpy.array([C[1] * A[2] - C[2] * A[1], C[2] * A[0] - C[0] * A[2], C[0] * A[1] - C[1] * A[0]])
-    F = F / (numpy.linalg.norm(F))
 
-    # Computes the values of mu2,mu1 and nu given the great arc (E,F,R) and the value of the slow variable z
-    mu2 = R[0] * (E[0] * numpy.cos(z) + F[0] * numpy.sin(z))
-    mu1 = -R[0] * (E[1] * numpy.cos(z) + F[1] * numpy.sin(z))
-    nu = R[0] * (E[2] * numpy.cos(z) + F[2] * numpy.sin(z))
+@guvectorize(_SLOWMOD_SIGNATURE, _SLOWMOD_LAYOUT, nopython=True)
+def _numba_fast_dfun_slowmod(state_variables, coupling, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, b, R, c, cA,
+                             cB, dstar, Ks, modification, N, derivative):
+    """Gufunction for the fast subsystem of the Epileptor Codim 3 model with ultra-slow modulation of classes,
+    leaving the slow z, uA and uB at zero"""
 
-    # Computes x_s, which is the solution to x_s^3 - mu2*x_s - mu1 = 0
-    if N[0] == 1:
-        xs = (mu1 / 2.0 + numpy.sqrt(
-            mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) + (mu1 / 2.0 - numpy.sqrt(
-            mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0)
-    elif N[0] == 2:
-        xs = -1.0 / 2.0 * (1.0 - 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 + numpy.sqrt(
-            mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) - 1.0 / 2.0 * (
-            1.0 + 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 - numpy.sqrt(mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (
-            1.0 / 3.0)
-    elif N[0] == 3:
-        xs = -1.0 / 2.0 * (1.0 + 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 + numpy.sqrt(
-            mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (1.0 / 3.0) - 1.0 / 2.0 * (
-            1.0 - 1j * 3 ** (1.0 / 2.0)) * (mu1 / 2.0 - numpy.sqrt(mu1 ** 2 / 4.0 - mu2 ** 3 / 27.0 + 0 * 1j)) ** (
-            1.0 / 3.0)
-    xs = xs.real
+    x = state_variables[0]
+    y = state_variables[1]
+    z = state_variables[2]
+    uA = state_variables[3]
+    uB = state_variables[4]
 
-    derivative[0] = -y
-    derivative[1] = x ** 3 - mu2 * x - mu1 - y * (nu + b[0] * x + x ** 2)
-    derivative[2] = -c[0] * (
-        numpy.sqrt((x - xs) ** 2 + y ** 2) - dstar[0] + modification[0] * 0.1 * (z - 0.5) ** 7 + Ks[0] * coupling[0])
+    E, F = _moving_arc(uA, uB, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, R)
+    mu2, mu1, nu = _great_arc(z, R[0], E[0], E[1], E[2], F[0], F[1], F[2])
+    _fast_equations(x, y, mu2, mu1, nu, b[0], derivative)
+    derivative[2] = 0.0
+    derivative[3] = 0.0
+    derivative[4] = 0.0
+
+
+@guvectorize(_SLOWMOD_SIGNATURE, _SLOWMOD_LAYOUT, nopython=True)
+def _numba_slow_dfun_slowmod(state_variables, coupling, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, b, R, c, cA,
+                             cB, dstar, Ks, modification, N, derivative):
+    """Gufunction for the slow z, uA and uB of the Epileptor Codim 3 model with ultra-slow modulation of classes,
+    leaving the fast subsystem unevaluated"""
+
+    x = state_variables[0]
+    y = state_variables[1]
+    z = state_variables[2]
+    uA = state_variables[3]
+    uB = state_variables[4]
+
+    E, F = _moving_arc(uA, uB, G0, G1, G2, H0, H1, H2, L0, L1, L2, M0, M1, M2, R)
+    mu2, mu1, nu = _great_arc(z, R[0], E[0], E[1], E[2], F[0], F[1], F[2])
+    derivative[2] = _slow_equation(x, y, z, mu2, mu1, coupling[0], c[0], dstar[0], Ks[0], modification[0], N[0])
     derivative[3] = cA[0]
     derivative[4] = cB[0]
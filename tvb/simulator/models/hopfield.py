@@ -186,3 +186,7 @@ class Hopfield(Model):
 
         derivative = numpy.array([dx, dtheta])
         return derivative
+
+    def linear_decay(self):
+        # without a dynamic threshold, the threshold is not a decaying state variable
+        return self._diagonal_decay(1.0 / self.taux, 1.0 / self.tauT if self.dynamic else 0.0)
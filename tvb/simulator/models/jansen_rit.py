@@ -264,14 +264,17 @@ class JansenRit(ModelNumbaDfun):
             self.B * self.b * (self.a_4 * self.J * sigm_y0_3) - 2.0 * self.b * y5 - self.b ** 2 * y2,
         ])
 
-    def dfun(self, y, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun_jr, (0.0, self.nu_max, self.r, self.v0, self.a, self.a_1, self.a_2, self.a_3,
+                                self.a_4, self.A, self.b, self.B, self.J, self.mu)
+
+    def dfun(self, y, c, local_coupling=0.0, out=None):
         src =  local_coupling*(y[1] - y[2])[:, 0]
         y_ = y.reshape(y.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
-        deriv = _numba_dfun_jr(y_, c_, src,
+        deriv = self._gufunc_for(_numba_dfun_jr, y_.dtype)(y_, c_, src,
                                self.nu_max, self.r, self.v0, self.a, self.a_1, self.a_2, self.a_3, self.a_4,
-                               self.A, self.b, self.B, self.J, self.mu
-                               )
+                               self.A, self.b, self.B, self.J, self.mu, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
 
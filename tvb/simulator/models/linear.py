@@ -64,3 +64,6 @@ class Linear(Model):
         c, = coupling
         dx = self.gamma * x + c + local_coupling * x
         return numpy.array([dx])
+
+    def linear_decay(self):
+        return self._diagonal_decay(-self.gamma)
@@ -378,12 +378,17 @@ class Generic2dOscillator(ModelNumbaDfun):
 
         return derivative
 
-    def dfun(self, vw, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun_g2d, (self.tau, self.I, self.a, self.b, self.c, self.d, self.e, self.f,
+                                 self.g, self.beta, self.alpha, self.gamma, 0.0)
+
+    def dfun(self, vw, c, local_coupling=0.0, out=None):
         lc_0 = local_coupling * vw[0, :, 0]
         vw_ = vw.reshape(vw.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
-        deriv = _numba_dfun_g2d(vw_, c_, self.tau, self.I, self.a, self.b, self.c, self.d, self.e, self.f, self.g,
-                                self.beta, self.alpha, self.gamma, lc_0)
+        numba_dfun = self._gufunc_for(_numba_dfun_g2d, vw_.dtype)
+        deriv = numba_dfun(vw_, c_, self.tau, self.I, self.a, self.b, self.c, self.d, self.e, self.f, self.g,
+                           self.beta, self.alpha, self.gamma, lc_0, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
 
@@ -482,8 +487,8 @@ class Kuramoto(Model):
 
         I = coupling[0, :] + local_range_coupling
 
-        if not hasattr(self, 'derivative'):
-            self.derivative = numpy.empty((1,) + theta.shape)
+        if not hasattr(self, 'derivative') or self.derivative.dtype != theta.dtype:
+            self.derivative = numpy.empty((1,) + theta.shape, dtype=theta.dtype)
 
         # phase update
         self.derivative[0] = self.omega + I
@@ -575,11 +580,15 @@ class SupHopf(ModelNumbaDfun):
 
         return ydot
 
-    def dfun(self, x, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun_supHopf, (self.a, self.omega, 0.0)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T
         lc_0 = local_coupling * x[0, :, 0]
-        deriv = _numba_dfun_supHopf(x_, c_, self.a, self.omega, lc_0)
+        deriv = self._gufunc_for(_numba_dfun_supHopf, x_.dtype)(x_, c_, self.a, self.omega, lc_0,
+                                                                 out=self._gufunc_out(out))
         
         return deriv.T[..., numpy.newaxis]
 
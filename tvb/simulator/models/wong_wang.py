@@ -175,9 +175,13 @@ class ReducedWongWang(ModelNumbaDfun):
         derivative = numpy.array([dS])
         return derivative
 
-    def dfun(self, x, c, local_coupling=0.0):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun, (self.a, self.b, self.d, self.gamma, self.tau_s, self.w, self.J_N, self.I_o)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T + local_coupling * x[0]
-        deriv = _numba_dfun(x_, c_, self.a, self.b, self.d, self.gamma,
-                        self.tau_s, self.w, self.J_N, self.I_o)
+        numba_dfun = self._gufunc_for(_numba_dfun, x_.dtype)
+        deriv = numba_dfun(x_, c_, self.a, self.b, self.d, self.gamma,
+                           self.tau_s, self.w, self.J_N, self.I_o, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
\ No newline at end of file
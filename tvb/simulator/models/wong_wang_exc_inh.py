@@ -268,14 +268,21 @@ class ReducedWongWangExcInh(ModelNumbaDfun):
 
         return derivative
 
-    def dfun(self, x, c, local_coupling=0.0, **kwargs):
+    def _numba_dfun_parameters(self):
+        return _numba_dfun, (self.a_e, self.b_e, self.d_e, self.gamma_e, self.tau_e,
+                             self.w_p, self.W_e, self.J_N,
+                             self.a_i, self.b_i, self.d_i, self.gamma_i, self.tau_i,
+                             self.W_i, self.J_i,
+                             self.G, self.lamda, self.I_o)
+
+    def dfun(self, x, c, local_coupling=0.0, out=None, **kwargs):
         x_ = x.reshape(x.shape[:-1]).T
         c_ = c.reshape(c.shape[:-1]).T + local_coupling * x[0]
-        deriv = _numba_dfun(x_, c_,
+        deriv = self._gufunc_for(_numba_dfun, x_.dtype)(x_, c_,
                             self.a_e, self.b_e, self.d_e, self.gamma_e, self.tau_e,
                             self.w_p, self.W_e, self.J_N,
                             self.a_i, self.b_i, self.d_i, self.gamma_i, self.tau_i,
                             self.W_i, self.J_i,
-                            self.G, self.lamda, self.I_o)
+                            self.G, self.lamda, self.I_o, out=self._gufunc_out(out))
         return deriv.T[..., numpy.newaxis]
 
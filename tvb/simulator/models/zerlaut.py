@@ -1,11 +1,16 @@
 """
 Mean field model based on Master equation about adaptative exponential leacky integrate and fire neurons population
 """
+import math
 import numpy
 import scipy.special as sp_spec
-from tvb.basic.neotraits.api import NArray, Range, Final, List
+from numba import guvectorize, float64
+from tvb.basic.neotraits.api import NArray, Range, Final, List, Attr
+from tvb.simulator.common import get_logger
 from tvb.simulator.models.base import Model
 
+LOG = get_logger(__name__)
+
 
 class ZerlautFirstOrder(Model):
     r"""
@@ -240,10 +245,43 @@ class ZerlautFirstOrder(Model):
                corresponding state-variable indices for this model are :math:`E = 0`,
                :math:`I = 1` and :math:`W = 2`.""")
 
+    tabulate_transfer_functions = Attr(
+        field_type=bool,
+        default=False,
+        required=False,
+        label="Tabulate transfer functions",
+        doc="""If True, the transfer functions (and for the second order model their
+        first and second derivatives) are evaluated once on the grid given by
+        `transfer_function_grid` when the model is configured, and ``dfun``
+        interpolates them trilinearly instead of evaluating them at each call.
+        Inputs outside the grid are evaluated directly. The tables use the
+        parameter values at configure time, which must then be the same for
+        all nodes, and the estimated interpolation error is logged and kept
+        in `transfer_function_error`.""")
+
+    transfer_function_grid = Attr(
+        field_type=dict,
+        default=lambda: {
+            "fe": numpy.array([0.0, 0.2, 128]),
+            "fi": numpy.array([0.0, 0.2, 128]),
+            "W": numpy.array([0.0, 6000.0, 41])
+        },
+        required=False,
+        label="Transfer function grid [lo, hi, points]",
+        doc="""Range and number of points of the tabulated transfer functions
+        along the excitatory and inhibitory firing rates (in KHz) and the
+        adaptation. Rate points are spaced evenly in the square root of the
+        rate, to resolve the steep rise of the transfer functions at low
+        rates.""")
+
     state_variables = 'E I W'.split()
     _nvar = 3
     cvar = numpy.array([0, 1, 2], dtype=numpy.int32)
 
+    _tf_term_names = ('TF', )
+    _tf_tables = {}
+    transfer_function_error = None
+
     def dfun(self, state_variables, coupling, local_coupling=0.00):
         r"""
         .. math::
@@ -264,14 +302,80 @@ class ZerlautFirstOrder(Model):
         lc_I = local_coupling * I
 
         # Excitatory firing rate derivation
-        derivative[0] = (self.TF_excitatory(E+c_0+lc_E+self.external_input, I+lc_I+self.external_input,W)-E)/self.T
+        _TF_e, = self._transfer_functions('excitatory', E+c_0+lc_E+self.external_input, I+lc_I+self.external_input, W)
+        derivative[0] = (_TF_e-E)/self.T
         # Inhibitory firing rate derivation
-        derivative[1] = (self.TF_inhibitory(E+lc_E+self.external_input, I+lc_I+self.external_input,W)-I)/self.T
+        _TF_i, = self._transfer_functions('inhibitory', E+lc_E+self.external_input, I+lc_I+self.external_input, W)
+        derivative[1] = (_TF_i-I)/self.T
         # Adaptation
         derivative[2] = -W/self.tau_w+self.b*E
 
         return derivative
 
+    def linear_decay(self):
+        return self._diagonal_decay(1.0 / self.T, 1.0 / self.T, 1.0 / self.tau_w)
+
+    def update_derived_parameters(self):
+        """Tabulate the transfer functions, if requested."""
+        self._tf_tables = {}
+        if not self.tabulate_transfer_functions:
+            return
+        names = 'g_L E_L_e E_L_i C_m E_e E_i Q_e Q_i tau_e tau_i N_tot p_connect g'.split()
+        if any(numpy.size(getattr(self, name)) > 1 for name in names):
+            raise ValueError("Tabulated transfer functions require the same value of %s for all nodes."
+                             % ", ".join(names))
+        for key in ('fe', 'fi', 'W'):
+            lo, hi, n = self.transfer_function_grid[key]
+            if not (hi > lo and n >= 2) or (key != 'W' and lo < 0.0):
+                raise ValueError("Invalid transfer function grid %s: %r." % (key, self.transfer_function_grid[key]))
+        # the interpolation error is estimated at the centres of every other cell of the grid
+        points, centres = self._tf_grid_points(0.0), [x[::2] for x in self._tf_grid_points(0.5)]
+        shape = "x".join(str(point.size) for point in points)
+        self.transfer_function_error = {}
+        for population in ('excitatory', 'inhibitory'):
+            TF = getattr(self, 'TF_' + population)
+            table = self._tf_terms(TF, *numpy.meshgrid(*points, indexing='ij'))
+            self._tf_tables[population] = (table.reshape((table.shape[0], -1)).T.copy(), ) + self._tf_grid()
+            fe, fi, W = numpy.meshgrid(*centres, indexing='ij')
+            error = abs(self._transfer_functions(population, fe, fi, W) - self._tf_terms(TF, fe, fi, W))
+            self.transfer_function_error[population] = dict(
+                zip(self._tf_term_names, error.reshape((error.shape[0], -1)).max(axis=1)))
+            LOG.info("%s %s transfer functions tabulated on a %s grid, max interpolation error %s",
+                     self.__class__.__name__, population, shape,
+                     ", ".join("%s %.3g" % item for item in self.transfer_function_error[population].items()))
+
+    def _tf_grid(self):
+        "Origin, spacing and number of points of the transfer function grid, in square root of rates and W."
+        lo, hi, n = numpy.array([self.transfer_function_grid[key] for key in ('fe', 'fi', 'W')]).T
+        lo, hi = numpy.r_[numpy.sqrt(lo[:2]), lo[2]], numpy.r_[numpy.sqrt(hi[:2]), hi[2]]
+        n = numpy.floor(n)
+        return lo, (hi - lo) / (n - 1), n
+
+    def _tf_grid_points(self, offset):
+        "Points of each axis of the transfer function grid, shifted by offset grid steps."
+        lo, step, n = self._tf_grid()
+        points = [lo_ + (numpy.r_[:int(n_) - (offset > 0)] + offset) * step_ for lo_, step_, n_ in zip(lo, step, n)]
+        return points[0]**2, points[1]**2, points[2]
+
+    def _tf_terms(self, TF, fe, fi, W):
+        "Transfer function terms used by dfun, evaluated at the given inputs."
+        return TF(fe, fi, W)[numpy.newaxis]
+
+    def _transfer_functions(self, population, fe, fi, W):
+        """
+        Transfer function terms of the excitatory or inhibitory population used by dfun,
+        interpolated from the tables if the transfer functions are tabulated.
+        """
+        table = self._tf_tables.get(population)
+        if table is None:
+            return self._tf_terms(getattr(self, 'TF_' + population), fe, fi, W)
+        terms = numpy.moveaxis(_numba_trilinear(fe, fi, W, *table), -1, 0)
+        outside = numpy.isnan(terms[0])
+        if outside.any():
+            fe, fi, W = [numpy.broadcast_to(x, outside.shape)[outside] for x in (fe, fi, W)]
+            terms[:, outside] = self._tf_terms(getattr(self, 'TF_' + population), fe, fi, W)
+        return terms
+
     def TF_excitatory(self, fe, fi, W):
         """
         transfer function for excitatory population
@@ -388,6 +492,32 @@ class ZerlautFirstOrder(Model):
         return sp_spec.erfc((Vthre-muV) / (numpy.sqrt(2)*sigmaV)) / (2*Tv)
 
 
+@guvectorize([(float64[:],) * 3 + (float64[:, :],) + (float64[:],) * 4], '(),(),(),(m,t),(d),(d),(d)->(t)',
+             nopython=True)
+def _numba_trilinear(fe, fi, W, table, lo, step, n, terms):
+    "Gufunc interpolating tabulated transfer functions, NaN outside the grid."
+    u0 = (math.sqrt(fe[0]) - lo[0]) / step[0] if fe[0] >= 0.0 else -1.0
+    u1 = (math.sqrt(fi[0]) - lo[1]) / step[1] if fi[0] >= 0.0 else -1.0
+    u2 = (W[0] - lo[2]) / step[2]
+    if not (0.0 <= u0 <= n[0] - 1.0 and 0.0 <= u1 <= n[1] - 1.0 and 0.0 <= u2 <= n[2] - 1.0):
+        terms[:] = numpy.nan
+        return
+    i0 = min(int(u0), int(n[0]) - 2)
+    i1 = min(int(u1), int(n[1]) - 2)
+    i2 = min(int(u2), int(n[2]) - 2)
+    t0, t1, t2 = u0 - i0, u1 - i1, u2 - i2
+    s2 = 1
+    s1 = int(n[2])
+    s0 = int(n[1]) * s1
+    j = i0 * s0 + i1 * s1 + i2
+    for k in range(terms.shape[0]):
+        c00 = (1.0 - t2) * table[j, k] + t2 * table[j + s2, k]
+        c01 = (1.0 - t2) * table[j + s1, k] + t2 * table[j + s1 + s2, k]
+        c10 = (1.0 - t2) * table[j + s0, k] + t2 * table[j + s0 + s2, k]
+        c11 = (1.0 - t2) * table[j + s0 + s1, k] + t2 * table[j + s0 + s1 + s2, k]
+        terms[k] = (1.0 - t0) * ((1.0 - t1) * c00 + t1 * c01) + t0 * ((1.0 - t1) * c10 + t1 * c11)
+
+
 class ZerlautSecondOrder(ZerlautFirstOrder):
     r"""
     **References**:
@@ -475,6 +605,8 @@ class ZerlautSecondOrder(ZerlautFirstOrder):
     _nvar = 6
     cvar = numpy.array([0, 1, 2, 3, 4, 5], dtype=numpy.int32)
 
+    _tf_term_names = ('TF', 'diff_fe', 'diff_fi', 'diff2_fe_fe', 'diff2_fi_fi', 'diff2_fe_fi')
+
     def dfun(self, state_variables, coupling, local_coupling=0.00):
         r"""
         .. math::
@@ -527,60 +659,25 @@ class ZerlautSecondOrder(ZerlautFirstOrder):
         I_input_excitatory = I+lc_I+self.external_input
         I_input_inhibitory = I+lc_I+self.external_input
 
-        # Transfer function of excitatory and inhibitory neurons
-        _TF_e = self.TF_excitatory(E_input_excitatory, I_input_excitatory, W)
-        _TF_i = self.TF_inhibitory(E_input_inhibitory, I_input_inhibitory, W)
-
-        # Derivatives taken numerically : use a central difference formula with spacing `dx`
-        def _diff_fe(TF, fe, fi, W, df=1e-7):
-            return (TF(fe+df, fi, W)-TF(fe-df, fi, W))/(2*df*1e3)
-
-        def _diff_fi(TF, fe, fi, W, df=1e-7):
-            return (TF(fe, fi+df, W)-TF(fe, fi-df, W))/(2*df*1e3)
-
-        def _diff2_fe_fe_e(fe, fi, W, df=1e-7):
-            TF = self.TF_excitatory
-            return (TF(fe+df, fi, W)-2*_TF_e+TF(fe-df, fi, W))/((df*1e3)**2)
-
-        def _diff2_fe_fe_i(fe, fi, W, df=1e-7):
-            TF = self.TF_inhibitory
-            return (TF(fe+df, fi, W)-2*_TF_i+TF(fe-df, fi, W))/((df*1e3)**2)
-
-        def _diff2_fi_fe(TF, fe, fi, W, df=1e-7):
-            return (_diff_fi(TF, fe+df, fi, W)-_diff_fi(TF, fe-df, fi, W))/(2*df*1e3)
-
-        def _diff2_fe_fi(TF, fe, fi, W, df=1e-7):
-            return (_diff_fe(TF, fe, fi+df, W)-_diff_fe(TF, fe, fi-df, W))/(2*df*1e3)
-
-        def _diff2_fi_fi_e(fe, fi, W, df=1e-7):
-            TF = self.TF_excitatory
-            return (TF(fe, fi+df, W)-2*_TF_e+TF(fe, fi-df, W))/((df*1e3)**2)
-
-        def _diff2_fi_fi_i(fe, fi, W, df=1e-7):
-            TF = self.TF_inhibitory
-            return (TF(fe, fi+df, W)-2*_TF_i+TF(fe, fi-df, W))/((df*1e3)**2)
-
-        #Precompute some result
-        _diff_fe_TF_e = _diff_fe(self.TF_excitatory, E_input_excitatory, I_input_excitatory, W)
-        _diff_fe_TF_i = _diff_fe(self.TF_inhibitory, E_input_inhibitory, I_input_inhibitory, W)
-        _diff_fi_TF_e = _diff_fi(self.TF_excitatory, E_input_excitatory, I_input_excitatory, W)
-        _diff_fi_TF_i = _diff_fi(self.TF_inhibitory, E_input_inhibitory, I_input_inhibitory, W)
+        # Transfer functions of excitatory and inhibitory neurons and their derivatives
+        _TF_e, _diff_fe_TF_e, _diff_fi_TF_e, _diff2_fe_fe_e, _diff2_fi_fi_e, _diff2_fe_fi_e = \
+            self._transfer_functions('excitatory', E_input_excitatory, I_input_excitatory, W)
+        _TF_i, _diff_fe_TF_i, _diff_fi_TF_i, _diff2_fe_fe_i, _diff2_fi_fi_i, _diff2_fe_fi_i = \
+            self._transfer_functions('inhibitory', E_input_inhibitory, I_input_inhibitory, W)
 
         # equation is inspired from github of Zerlaut :
         # https://github.com/yzerlaut/notebook_papers/blob/master/modeling_mesoscopic_dynamics/mean_field/master_equation.py
         # Excitatory firing rate derivation
         derivative[0] = (_TF_e - E
-                         + .5*C_ee*_diff2_fe_fe_e(E_input_excitatory, I_input_excitatory, W)
-                         + .5*C_ei*_diff2_fe_fi(self.TF_excitatory, E_input_excitatory, I_input_excitatory, W)
-                         + .5*C_ei*_diff2_fi_fe(self.TF_excitatory, E_input_excitatory, I_input_excitatory, W)
-                         + .5*C_ii*_diff2_fi_fi_e(E_input_excitatory, I_input_excitatory, W)
+                         + .5*C_ee*_diff2_fe_fe_e
+                         + .5*C_ei*_diff2_fe_fi_e
+                         + .5*C_ii*_diff2_fi_fi_e
                          )/self.T
         # Inhibitory firing rate derivation
         derivative[1] = (_TF_i - I
-                         + .5*C_ee*_diff2_fe_fe_i(E_input_inhibitory, I_input_inhibitory, W)
-                         + .5*C_ei*_diff2_fe_fi(self.TF_inhibitory, E_input_inhibitory, I_input_inhibitory, W)
-                         + .5*C_ei*_diff2_fi_fe(self.TF_inhibitory, E_input_inhibitory, I_input_inhibitory, W)
-                         + .5*C_ii*_diff2_fi_fi_i(E_input_inhibitory, I_input_inhibitory, W)
+                         + .5*C_ee*_diff2_fe_fe_i
+                         + .5*C_ei*_diff2_fe_fi_i
+                         + .5*C_ii*_diff2_fi_fi_i
                          )/self.T
         # Covariance excitatory-excitatory derivation
         derivative[2] = (_TF_e*(1./self.T-_TF_e)/N_e
@@ -609,3 +706,28 @@ class ZerlautSecondOrder(ZerlautFirstOrder):
 
         return derivative
 
+    def _tf_terms(self, TF, fe, fi, W, df=1e-7):
+        """
+        Transfer function and its first and second derivatives with respect to the rates,
+        the mixed derivative term being the sum of both orders of differentiation.
+        """
+        # Derivatives taken numerically : use a central difference formula with spacing `dx`,
+        # each point of the stencil being evaluated once
+        _TF = TF(fe, fi, W)
+        TF_pe, TF_me = TF(fe+df, fi, W), TF(fe-df, fi, W)
+        TF_pi, TF_mi = TF(fe, fi+df, W), TF(fe, fi-df, W)
+        TF_pp, TF_mp = TF(fe+df, fi+df, W), TF(fe-df, fi+df, W)
+        TF_pm, TF_mm = TF(fe+df, fi-df, W), TF(fe-df, fi-df, W)
+        _diff_fe = (TF_pe-TF_me)/(2*df*1e3)
+        _diff_fi = (TF_pi-TF_mi)/(2*df*1e3)
+        _diff2_fe_fe = (TF_pe-2*_TF+TF_me)/((df*1e3)**2)
+        _diff2_fi_fi = (TF_pi-2*_TF+TF_mi)/((df*1e3)**2)
+        _diff2_fe_fi = ((TF_pp-TF_mp)/(2*df*1e3)-(TF_pm-TF_mm)/(2*df*1e3))/(2*df*1e3)
+        _diff2_fi_fe = ((TF_pp-TF_pm)/(2*df*1e3)-(TF_mp-TF_mm)/(2*df*1e3))/(2*df*1e3)
+        return numpy.array(numpy.broadcast_arrays(_TF, _diff_fe, _diff_fi, _diff2_fe_fe,
+                                                  _diff2_fi_fi, _diff2_fe_fi + _diff2_fi_fe))
+
+    def linear_decay(self):
+        return self._diagonal_decay(1.0 / self.T, 1.0 / self.T, 2.0 / self.T, 2.0 / self.T, 2.0 / self.T,
+                                    1.0 / self.tau_w)
+
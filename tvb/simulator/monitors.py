@@ -65,7 +65,7 @@ from tvb.datatypes.region_mapping import RegionMapping
 from tvb.datatypes.projections import (ProjectionMatrix, ProjectionSurfaceEEG, ProjectionSurfaceMEG,
                                        ProjectionSurfaceSEEG)
 import tvb.datatypes.equations as equations
-from tvb.simulator.common import iround, numpy_add_at
+from tvb.simulator.common import iround, RegionOperator
 from tvb.basic.neotraits.api import HasTraits, Attr, NArray, Float, narray_describe
 
 
@@ -91,6 +91,8 @@ class Monitor(HasTraits):
         required=False)
 
     istep = None
+    # names of array attributes holding the sampling state carried between steps
+    _state_attrs = ()
     dt = None
     voi = None
     _stock = numpy.empty([])
@@ -126,6 +128,34 @@ class Monitor(HasTraits):
         """
         return self.sample(step, observed)
 
+    def number_of_samples(self, current_step, n_steps):
+        """Number of samples returned over the n_steps integration steps following current_step."""
+        return (current_step + n_steps) // self.istep - current_step // self.istep
+
+    def get_state(self):
+        """Return a dict of the arrays holding the sampling state carried between steps."""
+        return dict((name, getattr(self, name)) for name in self._state_attrs)
+
+    def set_state(self, state):
+        """Resume sampling from a state returned by `get_state`."""
+        for name in self._state_attrs:
+            current = getattr(self, name)
+            if current.shape != state[name].shape:
+                raise ValueError("%s state %s has shape %s, expected %s." % (
+                    type(self).__name__, name, state[name].shape, current.shape))
+            current[...] = state[name]
+
+    def record_block(self, steps, observed):
+        """Record samples of a block of consecutive steps.
+
+        Called by the simulator when stepping in chunks, with `observed` holding
+        the observed state of each step, i.e. of shape (n_step, n_voi, n_node, n_mode).
+        Returns the list of outputs of each step. Monitor subclasses may override
+        this method to sample a whole block at once.
+
+        """
+        return [self.record(step, state) for step, state in zip(steps, observed)]
+
     @abc.abstractmethod
     def sample(self, step, state):
         """
@@ -201,6 +231,12 @@ class SubSample(Monitor):
             time = step * self.dt
             return [time, state[self.voi, :]]
 
+    def record_block(self, steps, observed):
+        outputs = [None] * len(steps)
+        for k in numpy.flatnonzero(steps % self.istep == 0):
+            outputs[k] = [int(steps[k]) * self.dt, observed[k, self.voi, :]]
+        return outputs
+
 
 class SpatialAverage(Monitor):
     """
@@ -279,22 +315,16 @@ class SpatialAverage(Monitor):
 
         self.log.debug("spatial_mask")
         self.log.debug(narray_describe(self.spatial_mask))
-        spatial_sum = numpy.zeros((number_of_nodes, number_of_areas))
-        spatial_sum[numpy.arange(number_of_nodes), self.spatial_mask] = 1
-        spatial_sum = spatial_sum.T
-        self.log.debug("spatial_sum")
-        self.log.debug(narray_describe(spatial_sum))
-        nodes_per_area = numpy.sum(spatial_sum, axis=1)[:, numpy.newaxis]
-        self.spatial_mean = spatial_sum / nodes_per_area
-        self.log.debug("spatial_mean")
-        self.log.debug(narray_describe(self.spatial_mean))
+        self._spatial_operator = RegionOperator(self.spatial_mask, number_of_areas, dtype=simulator.dtype)
+        self.spatial_mean = self._spatial_operator.mean_matrix
+        self.log.debug("spatial_mean (sparse) has %d non-zeros", self.spatial_mean.nnz)
 
 
     def sample(self, step, state):
         if step % self.istep == 0:
             time = step * self.dt
-            monitored_state = numpy.dot(self.spatial_mean, state[self.voi, :])
-            return [time, monitored_state.transpose((1, 0, 2))]
+            monitored_state = self._spatial_operator.average(state[self.voi, :], axis=1)
+            return [time, monitored_state]
 
     def create_time_series(self, connectivity=None, surface=None,
                            region_map=None, region_volume_map=None):
@@ -341,6 +371,7 @@ class TemporalAverage(Monitor):
 
     """
     _ui_name = "Temporal average"
+    _state_attrs = ('_stock', )
 
     def config_for_sim(self, simulator):
         super(TemporalAverage, self).config_for_sim(simulator)
@@ -348,7 +379,7 @@ class TemporalAverage(Monitor):
                       simulator.number_of_nodes,
                       simulator.model.number_of_modes)
         self.log.debug("Temporal average stock_size is %s" % (str(stock_size), ))
-        self._stock = numpy.zeros(stock_size)
+        self._stock = numpy.zeros(stock_size, dtype=simulator.dtype)
 
 
     def sample(self, step, state):
@@ -364,12 +395,31 @@ class TemporalAverage(Monitor):
             time = (step - self.istep / 2.0) * self.dt
             return [time, avg_stock]
 
+    def record_block(self, steps, observed):
+        """
+        Updates the ``_stock`` with all steps up to each sampling step of the
+        block at once, averaging it at the sampling steps.
+
+        """
+        outputs = [None] * len(steps)
+        start = 0
+        for k in numpy.flatnonzero(steps % self.istep == 0):
+            self._stock[(steps[start:k + 1] % self.istep) - 1] = observed[start:k + 1, self.voi]
+            avg_stock = numpy.mean(self._stock, axis=0)
+            time = (int(steps[k]) - self.istep / 2.0) * self.dt
+            outputs[k] = [time, avg_stock]
+            start = k + 1
+        if start < len(steps):
+            self._stock[(steps[start:] % self.istep) - 1] = observed[start:, self.voi]
+        return outputs
+
 
 # mhtodo: this is not a proper superclass but a mixin, it refers to fields that don't exist
 
 class Projection(Monitor):
     "Base class monitor providing lead field suppport."
     _ui_name = "Projection matrix"
+    _state_attrs = ('_state', )
 
     region_mapping = Attr(
         RegionMapping,
@@ -433,6 +483,7 @@ class Projection(Monitor):
         # handle observation noise and configure white/coloured noise
         # pass in access to the: i) dt and ii) sample shape
         if self.obsnoise is not None:
+            self.obsnoise.dtype = simulator.dtype
             # configure the noise level
             if self.obsnoise.ntau > 0.0:
                 noiseshape = self.sensors.labels[:,numpy.newaxis].shape
@@ -476,8 +527,7 @@ class Projection(Monitor):
 
         # reduce to region lead field if region sim
         if not using_cortical_surface and self.gain.shape[1] == self.rmap.size:
-            gain = numpy.zeros((self.gain.shape[0], conn.number_of_regions))
-            numpy_add_at(gain.T, self.rmap, self.gain.T)
+            gain = RegionOperator(self.rmap, conn.number_of_regions).sum(self.gain, axis=1)
             self.log.debug('Region mapping gain shape %s to %s', self.gain.shape, gain.shape)
             self.gain = gain
 
@@ -499,7 +549,8 @@ class Projection(Monitor):
         self.log.debug('Zeroed %d NaN gain coefficients', nan_mask.sum())
 
         # attrs used for recording
-        self._state = numpy.zeros((self.gain.shape[0], len(self.voi)))
+        self.gain = self.gain.astype(simulator.dtype, copy=False)
+        self._state = numpy.zeros((self.gain.shape[0], len(self.voi)), dtype=simulator.dtype)
         self._period_in_steps = int(self.period / self.dt)
         self.log.debug('State shape %s, period in steps %s', self._state.shape, self._period_in_steps)
 
@@ -510,6 +561,24 @@ class Projection(Monitor):
         self.sensors.configure()
 
 
+    def number_of_samples(self, current_step, n_steps):
+        period = self._period_in_steps
+        return (current_step + n_steps) // period - current_step // period
+
+    def get_state(self):
+        state = super(Projection, self).get_state()
+        if self.obsnoise is not None:
+            for key, value in self.obsnoise.get_state().items():
+                state['obsnoise_' + key] = value
+        return state
+
+    def set_state(self, state):
+        super(Projection, self).set_state(state)
+        if self.obsnoise is not None:
+            prefix = 'obsnoise_'
+            self.obsnoise.set_state(dict((key[len(prefix):], value) for key, value in state.items()
+                                         if key.startswith(prefix)))
+
     def sample(self, step, state):
         "Record state, returning sample at sampling frequency / period."
         self._state += self.gain.dot(state[self.voi].sum(axis=-1).T)
@@ -813,6 +882,7 @@ class Bold(Monitor):
         #order=-1)
 
     _interim_period = None
+    _state_attrs = ('_interim_stock', '_stock')
     _interim_istep = None
     _interim_stock = None
     _stock_steps = None
@@ -848,11 +918,12 @@ class Bold(Monitor):
     def config_for_sim(self, simulator):
         super(Bold, self).config_for_sim(simulator)
         self.compute_hrf()
+        self.hemodynamic_response_function = self.hemodynamic_response_function.astype(simulator.dtype)
         sample_shape = self.voi.shape[0], simulator.number_of_nodes, simulator.model.number_of_modes
-        self._interim_stock = numpy.zeros((self._interim_istep,) + sample_shape)
+        self._interim_stock = numpy.zeros((self._interim_istep,) + sample_shape, dtype=simulator.dtype)
         self.log.debug("BOLD inner buffer %s %.2f MB" % (
             self._interim_stock.shape, self._interim_stock.nbytes/2**20))
-        self._stock = numpy.zeros((self._stock_steps,) + sample_shape)
+        self._stock = numpy.zeros((self._stock_steps,) + sample_shape, dtype=simulator.dtype)
         self.log.debug("BOLD outer buffer %s %.2f MB" % (
             self._stock.shape, self._stock.nbytes/2**20))
 
@@ -896,14 +967,13 @@ class BoldRegionROI(Bold):
     def config_for_sim(self, simulator):
         super(BoldRegionROI, self).config_for_sim(simulator)
         self.region_mapping = simulator.surface.region_mapping
+        self._region_operator = simulator.region_operator
 
-    def sample(self, step, state, array=numpy.array):
+    def sample(self, step, state):
         result = super(BoldRegionROI, self).sample(step, state)
         if result:
             t, data = result
-            # TODO use reduceat
-            return [t, array([data.flat[self.region_mapping==i].mean()
-                              for i in range(self.region_mapping.max())])]
+            return [t, self._region_operator.average(data, axis=1)]
         else:
             return None
 
@@ -926,5 +996,8 @@ class ProgressLogger(Monitor):
         if (step - self._last_step) % self._istep == 0:
             self.log.info('step %d time %.4f s', step, step * self._dt / 1e3)
 
+    def number_of_samples(self, current_step, n_steps):
+        return 0
+
     def sample(self, step, state):
         raise NotImplementedError
\ No newline at end of file
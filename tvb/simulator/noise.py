@@ -39,13 +39,110 @@ Specific noises inherit from the abstract class Noise
 
 """
 import abc
+import math
+import weakref
 import numpy
+from concurrent.futures import ThreadPoolExecutor
 from tvb.datatypes import equations
-from .common import simple_gen_astr
+from .common import simple_gen_astr, empty_state
 from tvb.basic.neotraits.api import HasTraits, Attr, NArray, Range, Int, Float
 
 
 
+class NoiseStreams(object):
+    """
+    Normal variates of realizations of given (nvar, n_node, n_mode) shape, drawn
+    from independent streams of a counter-based or splittable bit generator, each
+    covering a fixed range of nodes. Each stream is seeded anew for every block of
+    `steps_per_seed` steps, from the seed, the stream index and the block index,
+    such that the streams start at any step without drawing the preceding ones.
+
+    Blocks of realizations are generated ahead of time by a pool of threads, the
+    next block being filled while the current one is consumed. The realizations
+    do not depend on the block size or the number of threads. If `streams` is
+    given, only those streams are drawn, e.g. those of the nodes of sparse noise.
+
+    """
+
+    # nodes sharing a stream; changing it changes the realizations
+    nodes_per_stream = 64
+    # steps per seeding of a stream; changing it changes the realizations
+    steps_per_seed = 64
+
+    def __init__(self, seed, shape, bit_generator='Philox', block_size=64, n_thread=1, step=0, streams=None):
+        self._args = seed, shape, bit_generator, block_size, n_thread
+        self.seed = seed
+        self.step = step
+        self.shape = tuple(shape)
+        nvar, n_node, n_mode = self.shape
+        self._bit_generator = getattr(numpy.random, bit_generator)
+        self._nodes = [slice(start, min(start + self.nodes_per_stream, n_node))
+                       for start in range(0, n_node, self.nodes_per_stream)]
+        # indices of the streams drawn if not all, the nodes of the others being zero
+        self.streams = None if streams is None else tuple(sorted(streams))
+        self._drawn = range(len(self._nodes)) if streams is None else self.streams
+        # seedings per generated block
+        self.n_seed = max(1, -(-int(block_size) // self.steps_per_seed))
+        self.n_thread = max(1, min(int(n_thread), len(self._drawn)))
+        self._pool = ThreadPoolExecutor(max_workers=self.n_thread)
+        # worker threads are stopped once the streams are closed or collected
+        self._finalizer = weakref.finalize(self, self._pool.shutdown)
+        self._block = None
+        self._next_seed, self._index = divmod(step, self.steps_per_seed)
+        self._pending = self._submit()
+
+    @staticmethod
+    def _fill(block, seed, bit_generator, streams, first_seed, steps_per_seed):
+        "Fill block from the (index, nodes) streams, without referencing the streams object from the threads."
+        n_step, nvar, _, n_mode = block.shape
+        for i, nodes in streams:
+            size = steps_per_seed, nvar, nodes.stop - nodes.start, n_mode
+            for k in range(n_step // steps_per_seed):
+                seed_sequence = numpy.random.SeedSequence(seed, spawn_key=(i, first_seed + k))
+                generator = numpy.random.Generator(bit_generator(seed_sequence))
+                block[k * steps_per_seed:(k + 1) * steps_per_seed, :, nodes] = generator.standard_normal(size)
+
+    def _submit(self):
+        "Start generating the next block in the threads."
+        shape = (self.n_seed * self.steps_per_seed, ) + self.shape
+        block = numpy.empty(shape) if self.streams is None else numpy.zeros(shape)
+        streams = [(i, self._nodes[i]) for i in self._drawn]
+        futures = [self._pool.submit(self._fill, block, self.seed, self._bit_generator, streams[i::self.n_thread],
+                                     self._next_seed, self.steps_per_seed)
+                   for i in range(self.n_thread)]
+        self._next_seed += self.n_seed
+        return block, futures
+
+    def _collect(self):
+        block, futures = self._pending
+        for future in futures:
+            future.result()
+        return block
+
+    def normal(self):
+        "Normal variates of the next realization."
+        if self._block is None or self._index == self._block.shape[0]:
+            if self._block is not None:
+                self._index = 0
+            self._block = self._collect()
+            self._pending = self._submit()
+        self._index += 1
+        self.step += 1
+        return self._block[self._index - 1]
+
+    @classmethod
+    def of_nodes(cls, nodes):
+        "Indices of the streams covering the given node indices."
+        return tuple(numpy.unique(numpy.asarray(nodes) // cls.nodes_per_stream).tolist())
+
+    def close(self):
+        self._finalizer()
+
+    def __reduce__(self):
+        # threads can't be copied, so copies start new streams at the current step
+        return type(self), self._args + (self.step, self.streams)
+
+
 class Noise(HasTraits):
     """
     Defines a base class for noise. Specific noises are derived from this class
@@ -102,17 +199,57 @@ class Noise(HasTraits):
             "specific Noise object. Used when you need to resume a simulation from a state saved to disk"
     )
 
+    bit_generator = Attr(
+        str,
+        choices=("legacy", "Philox", "PCG64"),
+        default="legacy",
+        required=False,
+        label="Bit generator",
+        doc="""Generator of the normal variates. With legacy, they are drawn at
+        each step from the random_stream. Otherwise, they are drawn from
+        independent streams of the given bit generator, seeded by noise_seed and
+        covering fixed ranges of nodes, in blocks generated ahead of time by
+        background threads, see NoiseStreams.""")
+
+    block_size = Int(
+        default=64,
+        required=False,
+        label="Block size",
+        doc="""Number of realizations generated per block by the noise streams,
+        rounded up to a multiple of NoiseStreams.steps_per_seed.""")
+
+    n_thread = Int(
+        default=1,
+        required=False,
+        label="Number of threads",
+        doc="""Number of threads generating the blocks of the noise streams.""")
+
     def __init__(self, **kwargs):
         super(Noise, self).__init__(**kwargs)
         if self.random_stream is None:
             self.random_stream = numpy.random.RandomState(self.noise_seed)
 
         self.dt = None
+        # Floating point type of realizations, set by the simulator to its precision
+        self.dtype = numpy.float64
+        # Memory layout of realizations, set by the simulator to its state layout
+        self.layout = 'variable'
         # For use if coloured
         self._E = None
         self._sqrt_1_E2 = None
         self._eta = None
         self._h = None
+        # For use if normal variates are drawn ahead in blocks
+        self._block = None
+        self._block_index = 0
+        # For use with a bit generator other than legacy
+        self._streams = None
+        self._stream_step = 0
+        # For use if normal variates are only drawn on a support
+        self._support = None
+        self._support_streams = None
+        self._support_shape = None
+        self._sparse = None
 
     def configure(self):
         """
@@ -168,30 +305,161 @@ class Noise(HasTraits):
         #NOTE: The actual implementation factors out the explicit Box-Muller,
         #      using numpy's normal() instead.
         self.dt = dt
-        self._E = numpy.exp(-self.dt / self.ntau)
-        self._sqrt_1_E2 = numpy.sqrt((1.0 - self._E ** 2))
-        self._eta = self.random_stream.normal(size=shape)
-        self._dt_sqrt_lambda = self.dt * numpy.sqrt(1.0 / self.ntau)
+        self._E = math.exp(-self.dt / self.ntau)
+        self._sqrt_1_E2 = math.sqrt((1.0 - self._E ** 2))
+        self._eta = self.random_stream.normal(size=shape).astype(self.dtype, copy=False)
+        self._dt_sqrt_lambda = self.dt * math.sqrt(1.0 / self.ntau)
         self.log.info('Colored noise configured with dt=%g E=%g sqrt_1_E2=%g eta=%g & dt_sqrt_lambda=%g',
                   self.dt, self._E, self._sqrt_1_E2, self._eta, self._dt_sqrt_lambda)
 
-    def generate(self, shape, lo=-1.0, hi=1.0):
-        "Generate noise realization."
+    def generate(self, shape, lo=-1.0, hi=1.0, out=None):
+        "Generate noise realization, into the array out if given."
+        if out is None and self.layout != 'variable':
+            out = empty_state(shape, self.dtype, self.layout)
         if self.ntau > 0.0:
-            noise = self.coloured(shape)
+            noise = self.coloured(shape, out)
         else:
-            noise = self.white(shape)
+            noise = self.white(shape, out)
         return noise
 
-    def coloured(self, shape):
-        "Generate colored noise. [FoxVemuri_1988]_"
-        self._h = self._sqrt_1_E2 * self.random_stream.normal(size=shape)
-        self._eta =  self._eta * self._E + self._h
-        return self._dt_sqrt_lambda * self._eta
+    def get_state(self):
+        """
+        Return a dict of the arrays describing the state of the noise process, i.e. of the
+        random stream, the coloured noise and any prefetched variates, such that the process
+        may be resumed bit-identically with `set_state`.
+
+        """
+        _, keys, pos, has_gauss, cached_gaussian = self.random_stream.get_state()
+        state = {'rng_keys': keys,
+                 'rng_pos': numpy.array(pos),
+                 'rng_has_gauss': numpy.array(has_gauss),
+                 'rng_cached_gaussian': numpy.array(cached_gaussian)}
+        if self._eta is not None:
+            state['eta'] = numpy.array(self._eta)
+        if self._block is not None:
+            state['block'] = self._block[self._block_index:]
+        if self.bit_generator != 'legacy':
+            state['stream_step'] = numpy.array(self._stream_step)
+        return state
+
+    def set_state(self, state):
+        "Resume the noise process from a state returned by `get_state`."
+        self.random_stream.set_state(('MT19937', state['rng_keys'], int(state['rng_pos']),
+                                      int(state['rng_has_gauss']), float(state['rng_cached_gaussian'])))
+        if 'eta' in state:
+            self._eta = numpy.array(state['eta'])
+        self._block = numpy.array(state['block']) if 'block' in state else None
+        self._block_index = 0
+        if 'stream_step' in state:
+            # the streams start anew at the step
+            self._close_streams()
+            self._stream_step = int(state['stream_step'])
+
+    def prefetch(self, n_block, shape):
+        """
+        Draw the normal variates of the next `n_block` realizations of given `shape` in a
+        single call to the random stream. Subsequent realizations consume the block first,
+        yielding the same sequence as drawing them one at a time.
+
+        """
+        if self.bit_generator != 'legacy':
+            # the streams generate blocks ahead of time
+            return
+        shape = self._support_draw_shape(shape)
+        self._block = self.random_stream.normal(size=(n_block, ) + tuple(shape)).astype(self.dtype, copy=False)
+        self._block_index = 0
+
+    def _stream_normal(self, shape, streams=None):
+        """
+        Draw standard normal variates from the noise streams, created on first use, or
+        only from the given streams, the others being zero.
+
+        """
+        if self._streams is not None and self._streams.shape != tuple(shape):
+            self._close_streams()
+            self._stream_step = 0
+        if self._streams is not None and self._streams.streams != streams:
+            self._close_streams()
+        if self._streams is None:
+            self._streams = NoiseStreams(self.noise_seed, shape, self.bit_generator, self.block_size,
+                                         self.n_thread, self._stream_step, streams)
+        self._stream_step += 1
+        return self._streams.normal().astype(self.dtype, copy=False)
+
+    def _close_streams(self):
+        if self._streams is not None:
+            self._streams.close()
+            self._streams = None
+
+    def configure_support(self, shape, support):
+        """
+        Draw normal variates of realizations of given shape only for the flat
+        indices in support, the others being zero, such that the cost of the random
+        numbers scales with the support. If support is None, they are all drawn.
 
-    def white(self, shape):
+        """
+        self._support = support
+        self._support_shape = tuple(shape)
+        self._sparse = None
+        self._support_streams = None
+        if support is not None:
+            _, n_node, n_mode = shape
+            self._support_streams = NoiseStreams.of_nodes(support // n_mode % n_node)
+
+    def _support_draw_shape(self, shape):
+        "Shape of the normal variates drawn for realizations of given shape."
+        if self._support is not None and tuple(shape) == self._support_shape:
+            return 1, self._support.size, 1
+        return shape
+
+    def _normal(self, shape):
+        """
+        Draw standard normal variates, scattering those drawn on the support if configured.
+        The noise streams are only drawn for the nodes of the support, but over the whole
+        state, such that each node keeps its realizations whatever the support.
+
+        """
+        draw_shape = self._support_draw_shape(shape)
+        if draw_shape == tuple(shape):
+            return self._draw_normal(shape)
+        if self._sparse is None:
+            self._sparse = numpy.zeros(shape, self.dtype)
+        if self.bit_generator != 'legacy':
+            normal = self._stream_normal(shape, self._support_streams).reshape(-1)[self._support]
+        else:
+            normal = self._draw_normal(draw_shape).reshape(-1)
+        self._sparse.reshape(-1)[self._support] = normal
+        return self._sparse
+
+    def _draw_normal(self, shape):
+        "Draw standard normal variates, from the prefetched block if available."
+        if self.bit_generator != 'legacy':
+            return self._stream_normal(shape)
+        block = self._block
+        if block is not None:
+            if self._block_index < block.shape[0] and block.shape[1:] == tuple(shape):
+                self._block_index += 1
+                return block[self._block_index - 1]
+            self._block = None
+        return self.random_stream.normal(size=shape).astype(self.dtype, copy=False)
+
+    def coloured(self, shape, out=None):
+        "Generate colored noise. [FoxVemuri_1988]_"
+        if out is None:
+            self._h = self._sqrt_1_E2 * self._normal(shape)
+            self._eta =  self._eta * self._E + self._h
+            return self._dt_sqrt_lambda * self._eta
+        # update the process in place
+        if self._h is None or self._h.shape != out.shape or self._h.dtype != out.dtype:
+            self._h = numpy.empty_like(out)
+        numpy.multiply(self._normal(shape), self._sqrt_1_E2, out=self._h)
+        self._eta = numpy.multiply(self._eta, self._E, out=self._eta if self._eta.shape == out.shape else None)
+        self._eta += self._h
+        return numpy.multiply(self._eta, self._dt_sqrt_lambda, out=out)
+
+    def white(self, shape, out=None):
         "Generate white noise."
-        noise = numpy.sqrt(self.dt) * self.random_stream.normal(size=shape)
+        noise = numpy.multiply(self._normal(shape), math.sqrt(self.dt), out=out)
         return noise
 
     @abc.abstractmethod
@@ -226,7 +494,7 @@ class Additive(Noise):
             g(x) = \sqrt{2D}
 
         """
-        g_x = numpy.sqrt(2.0 * self.nsig)
+        g_x = numpy.sqrt(2.0 * self.nsig).astype(self.dtype, copy=False)
         return g_x
 
 
@@ -274,4 +542,4 @@ class Multiplicative(Noise):
 
         """
         g_x = numpy.sqrt(2.0 * self.nsig) * self.b.evaluate(state_variables)
-        return g_x
+        return g_x.astype(self.dtype, copy=False)
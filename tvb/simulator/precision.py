@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Validation of single precision simulations against double precision.
+
+Each model is simulated from identical initial conditions with the simulator's
+``precision`` set to float64 and float32, and the deviation of the single precision
+trajectory is reported, along with whether it remained in single precision::
+
+    for report in validate():
+        print(report)
+
+"""
+
+import inspect
+import numpy
+from tvb.datatypes.connectivity import Connectivity
+from . import models, coupling, integrators, monitors
+from .common import get_logger
+from .simulator import Simulator
+
+LOG = get_logger(__name__)
+
+
+class PrecisionReport(object):
+    "Deviation of a single precision trajectory from the double precision one."
+
+    def __init__(self, model, dtype, max_abs_error, max_rel_error):
+        self.model = model
+        self.dtype = dtype
+        self.max_abs_error = max_abs_error
+        self.max_rel_error = max_rel_error
+
+    @property
+    def upcast(self):
+        "Whether the single precision simulation was silently upcast."
+        return self.dtype != numpy.float32
+
+    def __str__(self):
+        return '%s: dtype %s, max abs error %.3g, max rel error %.3g' % (
+            self.model, self.dtype, self.max_abs_error, self.max_rel_error)
+
+
+def compare(model_class, connectivity=None, simulation_length=5.0, dt=0.01, seed=42):
+    """
+    Simulate `model_class` with the deterministic Heun scheme and linear coupling in
+    double and single precision, returning a PrecisionReport. The relative error is
+    the maximum absolute error over the maximum magnitude of the double precision
+    trajectory.
+
+    """
+    if connectivity is None:
+        connectivity = Connectivity.from_file()
+    initial_conditions = None
+    trajectories = []
+    for precision in ('float64', 'float32'):
+        sim = Simulator(model=model_class(), connectivity=connectivity, coupling=coupling.Linear(),
+                        integrator=integrators.HeunDeterministic(dt=dt), monitors=[monitors.Raw()],
+                        simulation_length=simulation_length, precision=precision)
+        sim.configure()
+        if initial_conditions is None:
+            rng = numpy.random.RandomState(seed)
+            initial_conditions = sim.model.initial(dt, sim.good_history_shape, rng)
+        sim.initial_conditions = initial_conditions
+        sim.configure()
+        (_, data), = sim.run()
+        trajectories.append(data)
+    double, single = trajectories
+    max_abs_error = numpy.abs(single.astype('d') - double).max()
+    scale = numpy.abs(double).max()
+    max_rel_error = max_abs_error / scale if scale > 0.0 else max_abs_error
+    if not numpy.isfinite(max_rel_error):
+        max_rel_error = numpy.inf
+    return PrecisionReport(model_class.__name__, single.dtype, max_abs_error, max_rel_error)
+
+
+def validate(model_classes=None, **kwds):
+    """
+    Compare single to double precision simulations of each of `model_classes`, by
+    default all models bundled with the simulator, yielding a PrecisionReport per
+    model. Keyword arguments are passed on to `compare`.
+
+    """
+    if model_classes is None:
+        # known subclasses are registered by name, which some couplings share with models
+        model_classes = [cls for _, cls in sorted(vars(models).items())
+                         if isinstance(cls, type) and issubclass(cls, models.Model) and not inspect.isabstract(cls)]
+    kwds.setdefault('connectivity', Connectivity.from_file())
+    for model_class in model_classes:
+        report = compare(model_class, **kwds)
+        if report.upcast:
+            LOG.warning('%s upcast to %s in single precision', report.model, report.dtype)
+        LOG.info('%s', report)
+        yield report
@@ -39,16 +39,19 @@ simulation and the method for running the simulation.
 
 """
 
+import os
 import time
 import math
 import numpy
 import scipy.sparse
 from tvb.basic.profile import TvbProfile
 from tvb.datatypes import cortex, connectivity, patterns
-from tvb.simulator import models, integrators, monitors, coupling
-from .common import psutil, numpy_add_at
-from .history import SparseHistory
-from tvb.basic.neotraits.api import HasTraits, Attr, NArray, List, Float
+from tvb.simulator import models, integrators, monitors, coupling, calibration
+from .common import psutil, RegionOperator, empty_state, as_state_layout
+from .history import SparseHistory, LAYOUTS, select_layout
+from .sinks import NpySink, set_mapped_data
+from ._numba.fused import NumbaBackend
+from tvb.basic.neotraits.api import HasTraits, Attr, NArray, List, Float, Int
 
 
 # TODO with refactor, this becomes more of a builder, since iterator will account for
@@ -160,8 +163,107 @@ class Simulator(HasTraits):
         required=True,
         doc="""The length of a simulation (default in milliseconds).""")
 
+    chunk_size = Int(
+        label="Steps per chunk",
+        default=1,
+        required=False,
+        doc="""Maximum number of integration steps advanced per iteration of the
+        simulation loop. With chunks of more than one step, coupling lookups, noise
+        draws, history updates and monitor sampling are performed once per chunk.
+        The chunk is bounded by the minimum non-zero-weight delay, such that no
+        step requires a delayed state from the same chunk, and chunking only
+        applies to sparse couplings. Results are identical to stepping one
+        step at a time.""")
+
+    precision = Attr(
+        str,
+        choices=("float64", "float32"),
+        default="float64",
+        required=False,
+        label="Floating point precision",
+        doc="""Precision of the simulated state. In single precision, model and
+        coupling parameters, initial conditions, noise, stimuli and monitor buffers
+        are converted to float32, such that states are integrated without being
+        upcast, halving memory traffic at the expense of accuracy.""")
+
+    backend = Attr(
+        str,
+        choices=("numpy", "numba"),
+        default="numpy",
+        required=False,
+        label="Backend",
+        doc="""Implementation of the simulation loop. The numba backend compiles
+        sparse delayed coupling, model, integration scheme and Raw, SubSample or
+        TemporalAverage monitors of region simulations into a single kernel,
+        advancing blocks of steps with nodes in parallel. It supports models with
+        Numba dfuns, linear, scaling, difference, hyperbolic tangent and Kuramoto
+        couplings, and Euler or Heun schemes with additive noise.""")
+
+    history_layout = Attr(
+        str,
+        choices=("sparse", "delay", "node", "memmap", "auto"),
+        default="sparse",
+        required=False,
+        label="History layout",
+        doc="""Memory layout of the delayed state history. The sparse layout gathers
+        the delayed states of non-zero weights from a time major buffer, the delay
+        layout groups connections by delay to read one time slice per group, and
+        the node layout stores the buffer with time innermost. With auto, the
+        layouts are benchmarked for the connectivity and horizon at configure time
+        and the fastest is used. The memmap layout keeps the buffer in a temporary
+        file with only recent steps in memory, for horizons exceeding the memory.""")
+
+    state_layout = Attr(
+        str,
+        choices=("variable", "node", "model"),
+        default="variable",
+        required=False,
+        label="State layout",
+        doc="""Memory layout of the simulated state, of shape (nvar, node, mode). In the
+        variable layout, each state variable is contiguous over the nodes, while in
+        the node layout the state variables of each node are contiguous, as read and
+        written by the Numba dfuns without strided access. The node layout applies to
+        the current state, the in-place integration workspace, noise realizations, the
+        sparse or delay history buffer and the node coupling, and monitor outputs are
+        converted back to the variable layout. With model, the layout preferred by the
+        model is used.""")
+
+    stage_coupling = Attr(
+        field_type=bool,
+        default=False,
+        required=False,
+        label="Coupling at intermediate stages",
+        doc="""When all delays are zero, coupling is computed directly from the current
+        state rather than from the history. With this option, multi-stage schemes such
+        as Heun or Runge-Kutta also recompute the coupling from the state of each of
+        their intermediate stages, instead of holding it fixed over the step.""")
+
     history = None  # type: SparseHistory
 
+    # maps between vertices and regions in surface simulations, built in preconfigure
+    region_operator = None  # type: RegionOperator
+
+    # fused kernel of the numba backend, built in configure
+    _numba_backend = None  # type: NumbaBackend
+
+    # set to an instrument.PhaseProfiler to time the phases of the simulation loop
+    profiler = None  # type: PhaseProfiler
+
+    # measured by calibrate for the configured simulator
+    _calibration = None  # type: Calibration
+
+    @property
+    def dtype(self):
+        "Floating point type of the simulated state, according to `precision`."
+        return numpy.dtype(self.precision)
+
+    @property
+    def layout(self):
+        "Memory layout of the simulated state, according to `state_layout`."
+        if self.state_layout == "model":
+            return self.model.state_layout
+        return self.state_layout
+
     @property
     def good_history_shape(self):
         """Returns expected history shape."""
@@ -212,6 +314,10 @@ class Simulator(HasTraits):
         else:
             self.integrator.bounded_state_variable_indices = None
             self.integrator.state_variable_boundaries = None
+        if isinstance(self.integrator, integrators.MultiRateHeunDeterministic):
+            self.integrator.slow_state_variable_indices = numpy.array(
+                [self.model.state_variables.index(sv) for sv in self.model.slow_state_variables], dtype=int)
+            self.integrator.configure_split_dfun(self.model.split_dfun())
         # monitors needs to be a list or tuple, even if there is only one...
         if not isinstance(self.monitors, (list, tuple)):
             self.monitors = [self.monitors]
@@ -227,6 +333,8 @@ class Simulator(HasTraits):
             unmapped = self.connectivity.unmapped_indices(rm)
             self._regmap = numpy.r_[rm, unmapped]
             self.number_of_nodes = self._regmap.shape[0]
+            self.region_operator = RegionOperator(self._regmap, self.connectivity.number_of_regions,
+                                                  dtype=self.dtype)
             self.log.info('Surface simulation with %d vertices + %d non-cortical, %d total nodes',
                      rm.size, unmapped.size, self.number_of_nodes)
         self._guesstimate_memory_requirement()
@@ -263,6 +371,8 @@ class Simulator(HasTraits):
                 continue
             # If it's a surface sim and model parameters were provided at the region level
             region_parameters = getattr(self.model, param)
+            if not isinstance(region_parameters, numpy.ndarray):
+                continue
             if self.surface is not None:
                 if region_parameters.size == self.connectivity.number_of_regions:
                     new_parameters = region_parameters[self.surface.region_mapping].reshape(spatial_reshape)
@@ -271,6 +381,9 @@ class Simulator(HasTraits):
             if region_parameters.size == self.number_of_nodes:
                 new_parameters = region_parameters.reshape(spatial_reshape)
                 setattr(self.model, param, new_parameters)
+        self._configure_precision(excluded_params)
+        if isinstance(self.integrator, integrators.IntegratorLinearDecay):
+            self.integrator.configure_linear_decay(self.model.linear_decay())
         # Configure spatial component of any stimuli
         self._configure_stimuli()
         # Set delays, provided in physical units, in integration steps.
@@ -279,15 +392,35 @@ class Simulator(HasTraits):
         # Reshape integrator.noise.nsig, if necessary.
         if isinstance(self.integrator, integrators.IntegratorStochastic):
             self._configure_integrator_noise()
+            self.integrator.configure_noise_support(self.good_history_shape[1:])
         # Setup history
         self._configure_history(self.initial_conditions)
+        if self.integrator.inplace:
+            self.integrator.configure_workspace(self.current_state.shape, self.current_state.dtype,
+                                                self.model._dfun_out, self.layout)
         # Configure Monitors to work with selected Model, etc...
         self._configure_monitors()
         # Estimate of memory usage.
         self._census_memory_requirement()
+        self._numba_backend = NumbaBackend(self) if self.backend == "numba" else None
+        # a calibration of a previous configuration no longer applies
+        self._calibration = None
         # Allow user to chain configure to another call or assignment.
         return self
 
+    def _configure_precision(self, excluded_params):
+        "Convert floating point model and coupling parameters to the simulation precision."
+        if self.dtype == numpy.float64:
+            return
+        for component, excluded in ((self.model, excluded_params), (self.coupling, ())):
+            for param in type(component).declarative_attrs:
+                value = getattr(component, param)
+                if param in excluded or not isinstance(value, numpy.ndarray) or value.dtype.kind != 'f':
+                    continue
+                # bypass the trait, which would convert the value back to its float64 dtype
+                vars(component)[param] = value.astype(self.dtype)
+        self.model.update_derived_parameters()
+
     def _handle_random_state(self, random_state):
         if random_state is not None:
             if isinstance(self.integrator, integrators.IntegratorStochastic):
@@ -319,6 +452,7 @@ class Simulator(HasTraits):
                 rpad = csr_matrix((local_coupling.shape[0], npad))
                 bpad = csr_matrix((npad, nn))
                 local_coupling = vstack([hstack([local_coupling, rpad]), bpad])
+            local_coupling = local_coupling.astype(self.dtype)
         return local_coupling
 
     def _prepare_stimulus(self):
@@ -327,17 +461,29 @@ class Simulator(HasTraits):
         else:
             time = numpy.r_[0.0 : self.simulation_length : self.integrator.dt]
             self.stimulus.configure_time(time.reshape((1, -1)))
-            stimulus = numpy.zeros((self.model.nvar, self.number_of_nodes, 1))
+            stimulus = empty_state((self.model.nvar, self.number_of_nodes, 1), self.dtype, self.layout)
+            stimulus[:] = 0.0
             self.log.debug("stimulus shape is: %s", stimulus.shape)
         return stimulus
 
-    def _loop_compute_node_coupling(self, step):
-        """Compute delayed node coupling values."""
-        coupling = self.coupling(step, self.history)
+    def _node_coupling(self, coupling):
+        """Map coupling values from history nodes to simulation nodes."""
         if self.surface is not None:
-            coupling = coupling[:, self._regmap]
+            coupling = self.region_operator.broadcast(coupling, axis=1)
+        if self.layout == "node":
+            coupling = as_state_layout(coupling, "node")
         return coupling
 
+    def _history_state(self, state):
+        """Map simulation state to the nodes stored in history."""
+        if self.surface is not None and state.shape[1] > self.connectivity.number_of_regions:
+            state = self.region_operator.average(state, axis=1)
+        return state
+
+    def _loop_compute_node_coupling(self, step):
+        """Compute delayed node coupling values."""
+        return self._node_coupling(self.coupling(step, self.history))
+
     def _loop_update_stimulus(self, step, stimulus):
         """Update stimulus values for current time step."""
         if self.stimulus is not None:
@@ -347,18 +493,112 @@ class Simulator(HasTraits):
 
     def _loop_update_history(self, step, n_reg, state):
         """Update history."""
-        if self.surface is not None and state.shape[1] > self.connectivity.number_of_regions:
-            region_state = numpy.zeros((n_reg, state.shape[0], state.shape[2]))         # temp (node, cvar, mode)
-            numpy_add_at(region_state, self._regmap, state.transpose((1, 0, 2)))        # sum within region
-            region_state /= numpy.bincount(self._regmap).reshape((-1, 1, 1))            # div by n node in region
-            state = region_state.transpose((1, 0, 2))                                   # (cvar, node, mode)
-        self.history.update(step, state)
+        self.history.update(step, self._history_state(state))
 
     def _loop_monitor_output(self, step, state):
         observed = self.model.observe(state)
         output = [monitor.record(step, observed) for monitor in self.monitors]
         if any(outputi is not None for outputi in output):
-            return output
+            return self._output_layout(output)
+
+    def _output_layout(self, output):
+        """Monitor output with its data in the variable layout."""
+        if self.layout == "node":
+            output = [None if outputi is None else [outputi[0], numpy.ascontiguousarray(outputi[1])]
+                      for outputi in output]
+        return output
+
+    def _instantaneous_coupling(self):
+        """Whether coupling is computed from the current state, as all delays are zero."""
+        return self.horizon == 1 and isinstance(self.coupling, coupling.SparseCoupling)
+
+    def _instantaneous_node_coupling(self, state):
+        """Compute node coupling values from the state, without delays."""
+        x_i = self._history_state(state)[self.history.cvars].astype(self.history.buffer.dtype)
+        return self._node_coupling(self.coupling.evaluate_instantaneous(self.history, x_i))
+
+    def _loop_instantaneous(self, start, stop, local_coupling, stimulus, state):
+        """
+        Iterate over steps without delays, bypassing the history, which is only updated
+        with the final state. Generates monitor outputs.
+
+        """
+        dfun = self.model.dfun
+        if self.stage_coupling:
+            def dfun(X, node_coupling, local_coupling, **kwds):
+                return self.model.dfun(X, self._instantaneous_node_coupling(X), local_coupling, **kwds)
+        step = start - 1
+        try:
+            for step in range(start, stop):
+                node_coupling = self._instantaneous_node_coupling(state)
+                self._loop_update_stimulus(step, stimulus)
+                state = self.integrator.scheme(state, dfun, node_coupling, local_coupling, stimulus)
+                self.current_state = state
+                output = self._loop_monitor_output(step, state)
+                if output is not None:
+                    yield output
+        finally:
+            if step >= start:
+                self.history.update(step, self._history_state(self.current_state))
+
+    def _chunk_steps(self):
+        """Number of steps which may be advanced per chunk, bounded by the minimum delay."""
+        if self.chunk_size <= 1 or not isinstance(self.coupling, coupling.SparseCoupling):
+            return 1
+        n_step = self.chunk_size
+        if self.history.n_nnzw > 0:
+            n_step = min(n_step, int(self.history.nnz_idelays.min()) + 1)
+        return n_step
+
+    def _chunk_compute_node_coupling(self, step, current_state, delayed_state):
+        """
+        Compute node coupling values from the state of the previous step and the delayed state,
+        which is None if the coupling sums over delay groups of the history.
+
+        """
+        if delayed_state is None:
+            return self._node_coupling(self.coupling.evaluate_grouped(self.history, step, current_state))
+        return self._node_coupling(self.coupling.evaluate(self.history, current_state, delayed_state))
+
+    def _chunk_monitor_output(self, steps, states):
+        """Sample monitors on the states of a chunk, returning outputs for each step."""
+        observed = self.model.observe(states.transpose((1, 0, 2, 3))).transpose((1, 0, 2, 3))
+        outputs = [monitor.record_block(steps, observed) for monitor in self.monitors]
+        return [self._output_layout(list(output)) if any(outputi is not None for outputi in output) else None
+                for output in zip(*outputs)]
+
+    def _loop_chunks(self, start, stop, n_chunk, local_coupling, stimulus, state):
+        """Iterate over chunks of up to n_chunk steps, generating monitor outputs."""
+        stochastic = isinstance(self.integrator, integrators.IntegratorStochastic)
+        for chunk_start in range(start, stop, n_chunk):
+            steps = numpy.r_[chunk_start:min(chunk_start + n_chunk, stop)]
+            if self.coupling.delay_grouped_sum(self.history) is None:
+                delayed_states = self.history.query_sparse_block(chunk_start, len(steps))
+            else:
+                delayed_states = [None] * len(steps)
+            if stochastic:
+                self.integrator.noise.prefetch(len(steps), state.shape)
+            # states are copied, as in-place schemes reuse the arrays of the states they return
+            states = history_states = None
+            # history is updated once per chunk, so coupling of later steps uses the chunk's states
+            current_state = self.history.buffer[(chunk_start - 1) % self.history.n_time]
+            for i, (step, delayed_state) in enumerate(zip(steps, delayed_states)):
+                node_coupling = self._chunk_compute_node_coupling(step, current_state, delayed_state)
+                self._loop_update_stimulus(int(step), stimulus)
+                state = self.integrator.scheme(state, self.model.dfun, node_coupling, local_coupling, stimulus)
+                history_state = self._history_state(state)
+                current_state = history_state[self.history.cvars].astype(self.history.buffer.dtype)
+                if states is None:
+                    states = empty_state((len(steps), ) + state.shape, state.dtype, self.layout)
+                    history_states = empty_state((len(steps), ) + history_state.shape, history_state.dtype,
+                                                 self.layout)
+                states[i] = state
+                history_states[i] = history_state
+            self.history.update_block(chunk_start, history_states)
+            self.current_state = state
+            for output in self._chunk_monitor_output(steps, states):
+                if output is not None:
+                    yield output
 
     def __call__(self, simulation_length=None, random_state=None):
         """
@@ -386,16 +626,46 @@ class Simulator(HasTraits):
 
         # integration loop
         n_steps = int(math.ceil(self.simulation_length / self.integrator.dt))
-        for step in range(self.current_step + 1, self.current_step + n_steps + 1):
-            # needs implementing by hsitory + coupling?
-            node_coupling = self._loop_compute_node_coupling(step)
-            self._loop_update_stimulus(step, stimulus)
-            state = self.integrator.scheme(state, self.model.dfun, node_coupling, local_coupling, stimulus)
-            self._loop_update_history(step, n_reg, state)
-            output = self._loop_monitor_output(step, state)
-            if output is not None:
-                yield output
-
+        n_chunk = self._chunk_steps()
+        if self.profiler is not None:
+            self.profiler.install(self)
+        try:
+            if self._numba_backend is not None:
+                for output in self._numba_backend(self.current_step + 1, self.current_step + n_steps + 1, state):
+                    yield output
+                state = self.current_state
+            elif self._instantaneous_coupling():
+                self.log.debug("computing coupling from the current state, as all delays are zero")
+                steps = self._loop_instantaneous(self.current_step + 1, self.current_step + n_steps + 1,
+                                                 local_coupling, stimulus, state)
+                for output in steps:
+                    yield output
+                state = self.current_state
+            elif n_chunk > 1:
+                self.log.debug("advancing up to %d steps per chunk", n_chunk)
+                chunks = self._loop_chunks(self.current_step + 1, self.current_step + n_steps + 1, n_chunk,
+                                           local_coupling, stimulus, state)
+                for output in chunks:
+                    yield output
+                state = self.current_state
+            else:
+                for step in range(self.current_step + 1, self.current_step + n_steps + 1):
+                    # needs implementing by hsitory + coupling?
+                    node_coupling = self._loop_compute_node_coupling(step)
+                    self._loop_update_stimulus(step, stimulus)
+                    state = self.integrator.scheme(state, self.model.dfun, node_coupling, local_coupling, stimulus)
+                    self._loop_update_history(step, n_reg, state)
+                    output = self._loop_monitor_output(step, state)
+                    if output is not None:
+                        yield output
+        finally:
+            if self.profiler is not None:
+                self.profiler.uninstall()
+                self.log.info(self.profiler.summary())
+
+        if self.integrator.inplace:
+            # the state is a workspace array of the integrator
+            state = state.copy(order="K")
         self.current_state = state
         self.current_step = self.current_step + n_steps
 
@@ -429,7 +699,7 @@ class Simulator(HasTraits):
             n_time, n_svar, n_node, n_mode = ic_shape = initial_conditions.shape
             nr = self.connectivity.number_of_regions
             if self.surface is not None and n_node == nr:
-                initial_conditions = initial_conditions[:, :, self._regmap]
+                initial_conditions = self.region_operator.broadcast(initial_conditions, axis=2)
                 return self._configure_history(initial_conditions)
             elif ic_shape[1:] != self.good_history_shape[1:]:
                 raise ValueError("Incorrect history sample shape %s, expected %s"
@@ -452,25 +722,26 @@ class Simulator(HasTraits):
         self.log.info('Final initial history shape is %r', history.shape)
 
         # create initial state from history
-        self.current_state = history[self.current_step % self.horizon].copy()
+        self.current_state = as_state_layout(history[self.current_step % self.horizon].astype(self.dtype),
+                                             self.layout)
         self.log.debug('initial state has shape %r' % (self.current_state.shape, ))
         if self.surface is not None and history.shape[2] > self.connectivity.number_of_regions:
-            n_reg = self.connectivity.number_of_regions
-            (nt, ns, _, nm), ax = history.shape, (2, 0, 1, 3)
-            region_history = numpy.zeros((nt, ns, n_reg, nm))
-            numpy_add_at(region_history.transpose(ax), self._regmap, history.transpose(ax))
-            region_history /= numpy.bincount(self._regmap).reshape((-1, 1))
-            history = region_history
-        # create history query implementation
-        self.history = SparseHistory(
-            self.connectivity.weights,
-            self.connectivity.idelays,
-            self.model.cvar,
-            self.model.number_of_modes
-        )
-        # initialize its buffer
+            history = self.region_operator.average(history, axis=2)
+        self._create_history(history)
+
+    def _create_history(self, history):
+        """Create the history query implementation and initialize its buffer."""
+        self.history = self._make_history(self.model.number_of_modes)
         self.history.initialize(history)
 
+    def _make_history(self, n_mode):
+        """Create the history implementation of the configured layout."""
+        args = self.connectivity.weights, self.connectivity.idelays, self.model.cvar, n_mode
+        layout = self.history_layout
+        if layout == "auto":
+            layout = select_layout(*args)
+        return LAYOUTS[layout](*args, state_layout=self.layout)
+
     def _configure_integrator_noise(self):
         """
         This enables having noise to be state variable specific and/or to enter 
@@ -487,7 +758,9 @@ class Simulator(HasTraits):
 
         """
 
-        noise = self.integrator.noise        
+        noise = self.integrator.noise
+        noise.dtype = self.dtype
+        noise.layout = self.layout
 
         if self.integrator.noise.ntau > 0.0:
             self.integrator.noise.configure_coloured(self.integrator.dt,
@@ -538,12 +811,25 @@ class Simulator(HasTraits):
             else:
                 self.stimulus.configure_space()
 
+    def calibrate(self, cache_dir=None, n_repeat=20, refresh=False):
+        """
+        Benchmark the configured simulator on the current machine, or load its cached
+        calibration, see the calibration module, such that `memory_requirement` and
+        `runtime` return calibrated estimates with lower and upper bounds.
+
+        """
+        self._calibration = calibration.calibrate(self, cache_dir=cache_dir, n_repeat=n_repeat, refresh=refresh)
+        return self._calibration
+
     # used by simulator adaptor
     def memory_requirement(self):
         """
         Return an estimated of the memory requirements (Bytes) for this
-        simulator's current configuration.
+        simulator's current configuration. Once calibrated, see `calibrate`,
+        the estimate carries lower and upper bounds.
         """
+        if self._calibration is not None:
+            return self._calibration.memory()
         self._guesstimate_memory_requirement()
         return self._memory_requirement_guess
 
@@ -551,12 +837,16 @@ class Simulator(HasTraits):
     def runtime(self, simulation_length):
         """
         Return an estimated run time (seconds) for the simulator's current 
-        configuration and a specified simulation length.
+        configuration and a specified simulation length. Once calibrated, see
+        `calibrate`, the estimate carries lower and upper bounds.
 
         """
         self.simulation_length = simulation_length
-        self._guesstimate_runtime()
-        return self._runtime
+        if self._calibration is None:
+            self._guesstimate_runtime()
+            return self._runtime
+        n_steps = int(math.ceil(self.simulation_length / self.integrator.dt))
+        return self._calibration.runtime(n_steps)
 
     # used by simulator adaptor
     def storage_requirement(self, simulation_length):
@@ -605,7 +895,7 @@ class Simulator(HasTraits):
         if self.surface:
             memreq += self.surface.number_of_triangles * 3 * bits_32 * 2  # normals
             memreq += self.surface.number_of_vertices * 3 * bits_64 * 2   # normals
-            memreq += number_of_nodes * number_of_regions * bits_64 * 4   # region_mapping, region_average, region_sum
+            memreq += number_of_nodes * (bits_64 + bits_32) * 2          # sparse region sum & mean operators
             # ???memreq += self.surface.local_connectivity.matrix.nnz * 8
 
         if not hasattr(self.monitors, '__len__'):
@@ -662,7 +952,7 @@ class Simulator(HasTraits):
         try:
             memreq += self.surface.triangles.nbytes * 2
             memreq += self.surface.vertices.nbytes * 2
-            memreq += self.surface.region_mapping.nbytes * self.number_of_nodes * 8. * 4  # region_average, region_sum
+            memreq += self.number_of_nodes * (8. + 4.) * 2  # sparse region sum & mean operators
             memreq += self.surface.local_connectivity.matrix.nnz * 8
         except AttributeError:
             pass
@@ -735,3 +1025,98 @@ class Simulator(HasTraits):
             ts[i] = numpy.array(ts[i])
             xs[i] = numpy.array(xs[i])
         return list(zip(ts, xs))
+
+    def run_to_sink(self, directory, **kwds):
+        """
+        Call the simulator with **kwds, writing the output of each monitor to a
+        preallocated, memory mapped .npy file in directory instead of collecting it in
+        memory. Returns a list with, for each monitor, a TimeSeries whose data is backed
+        by the monitor's file, or None for monitors which do not return samples.
+
+        """
+        if kwds.get('simulation_length') is not None:
+            self.simulation_length = float(kwds['simulation_length'])
+        n_steps = int(math.ceil(self.simulation_length / self.integrator.dt))
+        sinks = []
+        for i, monitor in enumerate(self.monitors):
+            path = os.path.join(directory, '%d_%s.npy' % (i, type(monitor).__name__))
+            sinks.append(NpySink(path, monitor.number_of_samples(self.current_step, n_steps)))
+        for data in self(**kwds):
+            for sink, t_x in zip(sinks, data):
+                if t_x is not None:
+                    sink.write(*t_x)
+        time_series = []
+        for monitor, sink in zip(self.monitors, sinks):
+            data = sink.close()
+            if data is None:
+                time_series.append(None)
+                continue
+            if self.surface is None:
+                ts = monitor.create_time_series(connectivity=self.connectivity)
+            else:
+                ts = monitor.create_time_series(surface=self.surface)
+            set_mapped_data(ts, data)
+            ts.time = sink.time[:sink.n_written]
+            ts.start_time = float(ts.time[0]) if sink.n_written else 0.0
+            time_series.append(ts)
+        return time_series
+
+    def _checkpoint_state(self):
+        """Collect the arrays required to continue the simulation, keyed by name."""
+        state = {'current_step': numpy.array(self.current_step),
+                 'current_state': self.current_state,
+                 'history_buffer': self.history.buffer}
+        for key, value in self.integrator.get_state().items():
+            state['integrator_' + key] = value
+        if isinstance(self.integrator, integrators.IntegratorStochastic):
+            for key, value in self.integrator.noise.get_state().items():
+                state['noise_' + key] = value
+        for i, monitor in enumerate(self.monitors):
+            for key, value in monitor.get_state().items():
+                state['monitor%d_%s' % (i, key)] = value
+        return state
+
+    def checkpoint(self, path):
+        """
+        Write the state required to continue the simulation to an uncompressed NumPy .npz
+        file at `path`: the current step and state, the history buffer, the state carried
+        between steps by the integrator, the noise stream and the sampling state of
+        monitors. See `restore`.
+
+        """
+        with open(path, 'wb') as fd:
+            numpy.savez(fd, **self._checkpoint_state())
+        self.log.info("checkpoint of step %d written to %s", self.current_step, path)
+
+    def restore(self, path):
+        """
+        Restore the state written by `checkpoint` into this simulator, such that subsequent
+        calls continue bit-identically to the checkpointed simulation. The simulator must be
+        configured with the same components as the checkpointed one; initial conditions
+        are replaced by the restored history.
+
+        """
+        with numpy.load(path) as npz:
+            state = dict((key, npz[key]) for key in npz.files)
+        self._restore_state(state)
+        self.log.info("restored step %d from %s", self.current_step, path)
+
+    def _restore_state(self, state):
+        """Restore the arrays collected by `_checkpoint_state`."""
+        for key, current in (('current_state', self.current_state), ('history_buffer', self.history.buffer)):
+            if state[key].shape != current.shape:
+                raise ValueError("Checkpoint %s has shape %s, expected %s." % (key, state[key].shape, current.shape))
+        self.current_step = int(state['current_step'])
+        self.current_state = state['current_state'].copy()
+        self.history.initialize(state['history_buffer'])
+        prefix = 'integrator_'
+        self.integrator.set_state(dict((key[len(prefix):], value) for key, value in state.items()
+                                       if key.startswith(prefix)))
+        if isinstance(self.integrator, integrators.IntegratorStochastic):
+            prefix = 'noise_'
+            self.integrator.noise.set_state(dict((key[len(prefix):], value) for key, value in state.items()
+                                                 if key.startswith(prefix)))
+        for i, monitor in enumerate(self.monitors):
+            prefix = 'monitor%d_' % i
+            monitor.set_state(dict((key[len(prefix):], value) for key, value in state.items()
+                                   if key.startswith(prefix)))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Sinks writing monitor outputs to disk while the simulation runs, such that
+memory use does not grow with the length of the simulation.
+
+"""
+
+import numpy
+from numpy.lib.format import open_memmap
+from .common import get_logger
+
+LOG = get_logger(__name__)
+
+
+class NpySink(object):
+    """
+    Writes the samples of a monitor to a preallocated, memory mapped .npy file
+    of shape (n_sample, ) + sample shape, allocated on the first sample. The
+    sample times are kept in memory.
+
+    """
+
+    def __init__(self, path, n_sample, flush_interval=256):
+        self.path = path
+        self.n_sample = n_sample
+        self.flush_interval = flush_interval
+        self.time = numpy.zeros((n_sample, ))
+        self.n_written = 0
+        self._data = None
+
+    def write(self, time, sample):
+        "Write the sample at given time to the next slot of the file."
+        if self.n_written == self.n_sample:
+            raise ValueError("Sink %s is full with %d samples." % (self.path, self.n_sample))
+        if self._data is None:
+            sample = numpy.asarray(sample)
+            self._data = open_memmap(self.path, mode='w+', dtype=sample.dtype,
+                                     shape=(self.n_sample, ) + sample.shape)
+            LOG.debug('sink %s allocated %.2f MB', self.path, self._data.nbytes * 2 ** -20)
+        self._data[self.n_written] = sample
+        self.time[self.n_written] = time
+        self.n_written += 1
+        if self.n_written % self.flush_interval == 0:
+            self._data.flush()
+
+    def close(self):
+        "Flush and close the file, returning its data memory mapped read-only."
+        if self._data is None:
+            return None
+        self._data.flush()
+        self._data = None
+        if self.n_written < self.n_sample:
+            LOG.warning('sink %s received %d of %d samples', self.path, self.n_written, self.n_sample)
+        return numpy.load(self.path, mmap_mode='r')[:self.n_written]
+
+
+def set_mapped_data(time_series, data):
+    """
+    Set the data of the time series to the memory mapped array without copying it,
+    bypassing the NArray trait which copies assigned arrays, when the dtype and number
+    of dimensions are those the trait accepts as is. Other arrays are assigned through
+    the trait.
+
+    """
+    field = type(time_series).data
+    if data.dtype == field.dtype and (field.ndim is None or data.ndim == field.ndim):
+        vars(time_series)[field.field_name] = data
+    else:
+        time_series.data = data
@@ -344,6 +344,16 @@ def test_const_attr():
     a.final_c = 24
 
 
+def test_narr_copies_memmap(tmpdir):
+    class Boo(HasTraits):
+        x = NArray(dtype=np.float64)
+
+    mapped = np.lib.format.open_memmap(str(tmpdir.join('x.npy')), mode='w+', dtype=np.float64, shape=(3, ))
+    boo = Boo(x=mapped)
+    mapped[:] = 1.0
+    np.testing.assert_array_equal(boo.x, 0.0)
+
+
 def test_named_dimensions():
     class A(HasTraits):
         x = NArray(dim_names=('time', 'space'), required=False)
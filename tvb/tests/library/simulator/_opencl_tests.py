@@ -70,6 +70,36 @@ class TestCLRWW():
 
         numpy.testing.assert_allclose(cl_dx, np_dx, 1e-5, 1e-6)
 
+
+@pytest.mark.skipif(not PYOPENCL_AVAILABLE, reason='PyOpenCL not available')
+class TestCLDeclared():
+
+    def setup_method(self):
+        from tvb.simulator._opencl.util import create_cpu_context, context_and_queue
+        self.context, self.queue = context_and_queue(create_cpu_context())
+        self.n_nodes = 100
+        self.state = numpy.random.rand(2, self.n_nodes, 1)
+        self.coupling = numpy.random.rand(1, self.n_nodes, 1)
+
+    def test_numpy_against_opencl(self):
+        from tvb.simulator.models.dsl import ModelSpec
+        from tvb.simulator._opencl.models import declared_model
+        spec = ModelSpec(
+            name='SpecCLFitzHughNagumo',
+            state_variables={'V': (-2.0, 2.0), 'W': (-2.0, 2.0)},
+            parameters={'tau': 3.0, 'a': 0.7, 'b': 0.8},
+            derivatives={'V': 'tau * (V - V**3 / 3.0 + W + c_0)', 'W': '(a - V - b * W) / tau'},
+            coupling_variables=('V', ))
+        np_model = spec.model_class()()
+        np_model.configure()
+        cl_model = declared_model(type(np_model))()
+        cl_model.configure()
+        cl_model.configure_opencl(self.context, self.queue)
+
+        np_dx = np_model._numpy_dfun(self.state, self.coupling)
+        cl_dx = cl_model.dfunKernel(self.state, self.coupling)
+        numpy.testing.assert_allclose(cl_dx, np_dx, rtol=1e-4, atol=1e-5)
+
 @pytest.mark.skipif(not PYOPENCL_AVAILABLE, reason='PyOpenCL not available')
 class TestModels():
     def setup_method(self):
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test for tvb.simulator.calibration module
+
+"""
+import os
+import numpy
+import pytest
+from tvb.tests.library.base_testcase import BaseTestCase
+from tvb.simulator import simulator, models, coupling, integrators, monitors, noise, calibration
+from tvb.datatypes.connectivity import Connectivity
+
+
+class TestCalibration(BaseTestCase):
+
+    def _sim(self, **kwds):
+        numpy.random.seed(42)
+        kwds.setdefault('monitors', (monitors.TemporalAverage(period=1.0), monitors.Bold(period=10.0)))
+        conn = Connectivity.from_file()
+        # delays of at least 20 steps, for chunks
+        conn.speed = numpy.r_[1.0]
+        conn.tract_lengths = numpy.maximum(conn.tract_lengths, 2.0)
+        return simulator.Simulator(
+            connectivity=conn,
+            model=models.Generic2dOscillator(),
+            coupling=coupling.Linear(),
+            integrator=integrators.HeunStochastic(dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], noise_seed=1)),
+            simulation_length=10.0, **kwds).configure()
+
+    def test_estimates(self, tmpdir):
+        sim = self._sim()
+        cal = calibration.calibrate(sim, cache_dir=str(tmpdir), n_repeat=5)
+        assert sorted(cal.costs) == ['coupling', 'history', 'monitor0_TemporalAverage', 'monitor1_Bold',
+                                     'observe', 'scheme']
+        runtime = cal.runtime(100)
+        assert 0.0 < runtime.lo <= runtime <= runtime.hi
+        memory = cal.memory()
+        assert sim.history.nbytes < memory.lo <= memory <= memory.hi
+        # simulator is unaffected by the benchmarks
+        for (_, y), (_, y_ref) in zip(sim.run(), self._sim().run()):
+            numpy.testing.assert_array_equal(y, y_ref)
+
+    def test_cache(self, tmpdir, monkeypatch):
+        sim = self._sim()
+        cal = calibration.calibrate(sim, cache_dir=str(tmpdir), n_repeat=5)
+        assert os.path.exists(calibration.cache_path(str(tmpdir)))
+
+        def measure(*args, **kwargs):
+            raise AssertionError('calibration should be cached')
+        monkeypatch.setattr(calibration.Calibration, 'measure', measure)
+        cached = calibration.calibrate(self._sim(), cache_dir=str(tmpdir))
+        assert cached.runtime(100) == pytest.approx(cal.runtime(100))
+        assert cached.memory() == cal.memory()
+
+    @pytest.mark.parametrize('kwds', [dict(backend='numba'), dict(chunk_size=4)])
+    def test_loop_estimates(self, tmpdir, kwds):
+        kwds['monitors'] = (monitors.TemporalAverage(period=1.0), )
+        sim = self._sim(**kwds)
+        cal = calibration.calibrate(sim, cache_dir=str(tmpdir), n_repeat=3)
+        assert list(cal.costs) == ['loop']
+        assert 0.0 < cal.runtime(100).lo
+        for (_, y), (_, y_ref) in zip(sim.run(), self._sim(**kwds).run()):
+            numpy.testing.assert_array_equal(y, y_ref)
+
+    def test_signature(self):
+        keys = set(calibration.signature(self._sim(**kwds))
+                   for kwds in (dict(), dict(precision='float32'), dict(chunk_size=4), dict(state_layout='node')))
+        assert len(keys) == 4
+
+    def test_getters_do_not_calibrate(self, tmpdir, monkeypatch):
+        def calibrate(*args, **kwargs):
+            raise AssertionError('getters should not calibrate')
+        monkeypatch.setattr(calibration, 'calibrate', calibrate)
+        sim = self._sim()
+        assert sim.memory_requirement() == sim._memory_requirement_guess
+        assert not isinstance(sim.runtime(10.0), calibration.Estimate)
+        monkeypatch.undo()
+        sim.calibrate(cache_dir=str(tmpdir), n_repeat=3)
+        assert isinstance(sim.memory_requirement(), calibration.Estimate)
+        assert isinstance(sim.runtime(10.0), calibration.Estimate)
@@ -90,3 +90,17 @@ class TestCommon(BaseTestCase):
             numpy.add.at(expected, map, source)
             common._add_at(actual, map, source)
             assert numpy.allclose(expected, actual)
+
+    def test_region_operator(self):
+        ri = numpy.random.randint
+        n_region, n_node = 10, 200
+        region_map = ri(0, n_region - 1, n_node)  # last region empty
+        x = numpy.random.randn(3, n_node, 2)
+        op = common.RegionOperator(region_map, n_region)
+        expected = numpy.zeros((3, n_region, 2))
+        numpy.add.at(expected.transpose((1, 0, 2)), region_map, x.transpose((1, 0, 2)))
+        assert numpy.allclose(op.sum(x, axis=1), expected)
+        counts = numpy.maximum(numpy.bincount(region_map, minlength=n_region), 1)
+        assert numpy.allclose(op.average(x, axis=1), expected / counts.reshape((-1, 1)))
+        y = numpy.random.randn(3, n_region, 2)
+        assert numpy.array_equal(op.broadcast(y, axis=1), y[:, region_map])
@@ -35,13 +35,17 @@ Test for tvb.simulator.coupling module
 
 """
 
+import os
+import sys
 import copy
+import subprocess
+import concurrent.futures
 import numpy
 import pytest
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.simulator import coupling, models, simulator
 from tvb.datatypes import cortex, connectivity
-from tvb.simulator.history import SparseHistory
+from tvb.simulator.history import DenseHistory, SparseHistory
 
 
 class TestCoupling(BaseTestCase):
@@ -141,6 +145,155 @@ class TestCoupling(BaseTestCase):
         self._apply_coupling_2sv(k)
 
 
+    @pytest.mark.parametrize('name', ['Linear', 'Scaling', 'HyperbolicTangent', 'Sigmoidal', 'SigmoidalJansenRit',
+                                      'PreSigmoidal', 'Difference', 'Kuramoto'])
+    def test_sparse_native(self, name):
+        k = getattr(coupling, name)()
+        k.configure()
+        history = SparseHistory(self.weights, self.weights * 0, numpy.r_[0, 1], 1)
+        history.update(0, self.state_2sv)
+        k(1, history)
+        assert isinstance(k, coupling.SparseCoupling)
+        assert history not in DenseHistory.__dict__['delayed_state'].instance_state
+
+    def test_sigmoidal_matches_dense(self):
+        k = coupling.Sigmoidal(midpoint=numpy.r_[1.0], sigma=numpy.r_[0.5])
+        k.configure()
+        numpy.testing.assert_allclose(k(1, self.history_1sv), coupling.Coupling.__call__(k, 1, self.history_1sv))
+
+
+    @pytest.mark.parametrize('cfun', [coupling.Linear(b=numpy.r_[0.1]), coupling.Scaling(), coupling.Difference()])
+    def test_delay_grouped_sum(self, cfun):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(64, 64) * (rng.rand(64, 64) < 0.5)
+        history = SparseHistory(weights, rng.randint(0, 3, (64, 64)) * 5, numpy.r_[0, 1], 2)
+        history.initialize(rng.randn(history.n_time, 2, 64, 2))
+        cfun.configure()
+        assert cfun.delay_grouped_sum(history) is not None
+        for step in range(1, 12):
+            numpy.testing.assert_allclose(cfun(step, history), cfun.evaluate(history, *history.query_sparse(step)),
+                                          rtol=1e-5, atol=1e-6)
+
+    def test_delay_grouped_sum_many_delays(self):
+        rng = numpy.random.RandomState(42)
+        history = SparseHistory(numpy.ones((8, 8)), rng.randint(0, 64, (8, 8)), numpy.r_[0], 1)
+        assert coupling.Linear().delay_grouped_sum(history) is None
+        assert coupling.HyperbolicTangent().delay_grouped_sum(history) is None
+
+    @pytest.mark.parametrize('cfun', [coupling.HyperbolicTangent(midpoint=numpy.r_[0.2]), coupling.Kuramoto()])
+    def test_source_delay_pairs(self, cfun):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(64, 64) * (rng.rand(64, 64) < 0.5)
+        history = SparseHistory(weights, rng.randint(0, 3, (64, 64)) * 5, numpy.r_[0, 1], 2)
+        history.initialize(rng.randn(history.n_time, 2, 64, 2))
+        cfun.configure()
+        per_weight = copy.deepcopy(cfun)
+        per_weight._pairs = False
+        assert cfun.source_delay_pairs(history).n_pair == 3 * 64
+        for step in range(1, 12):
+            numpy.testing.assert_allclose(cfun(step, history), per_weight(step, history), rtol=1e-5, atol=1e-6)
+
+    def test_source_delay_pairs_many_delays(self):
+        rng = numpy.random.RandomState(42)
+        history = SparseHistory(numpy.ones((8, 8)), rng.randint(0, 64, (8, 8)), numpy.r_[0], 1)
+        assert coupling.HyperbolicTangent().source_delay_pairs(history) is None
+        assert coupling.Kuramoto().source_delay_pairs(history) is None
+
+    @pytest.mark.parametrize('cfun', [coupling.Linear(b=numpy.r_[0.1]), coupling.Scaling(),
+                                      coupling.Sigmoidal(sigma=numpy.r_[2.0]), coupling.HyperbolicTangent(),
+                                      coupling.Difference(), coupling.Kuramoto()])
+    def test_expression_matches_builtin(self, cfun):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(32, 32) * (rng.rand(32, 32) < 0.5)
+        history = SparseHistory(weights, rng.randint(0, 40, (32, 32)), numpy.r_[0, 1], 2)
+        history.initialize(rng.randn(history.n_time, 2, 32, 2))
+        cfun.configure()
+        expr = coupling.Expression.from_coupling(cfun)
+        expr.configure()
+        for step in range(1, 12):
+            numpy.testing.assert_allclose(expr(step, history), cfun(step, history), rtol=1e-5, atol=1e-6)
+            numpy.testing.assert_allclose(expr.evaluate(history, *history.query_sparse(step)), cfun(step, history),
+                                          rtol=1e-5, atol=1e-6)
+
+    def test_expression_reuse_with_other_histories(self):
+        expr = coupling.Expression.from_coupling(coupling.Difference())
+        expr.configure()
+        pristine = copy.deepcopy(expr)
+        for history, fresh_history in self._histories(2):
+            fresh = copy.deepcopy(pristine)
+            for step in range(1, 12):
+                numpy.testing.assert_allclose(expr(step, history), fresh(step, fresh_history), rtol=1e-5, atol=1e-6)
+
+    def test_expression_per_mode_parameters(self):
+        history = SparseHistory(self.weights, self.weights * 0, numpy.r_[0], 2)
+        history.update(0, numpy.ones((1, 2, 2)))
+        expr = coupling.Expression(pre_expr='exp(-x_j) * c', post_expr='gx - b', parameters={'c': 2.0, 'b': [0.0, 1.0]})
+        numpy.testing.assert_allclose(expr(1, history)[0], [[2 / numpy.e, 2 / numpy.e - 1]] * 2, rtol=1e-6)
+
+    def test_expression_kernel_process_exits(self):
+        # the resource tracker started by shared memory used to hang the exit under TBB
+        script = ("import numpy\n"
+                  "from multiprocessing import shared_memory\n"
+                  "from tvb.simulator import coupling\n"
+                  "from tvb.simulator.history import SparseHistory\n"
+                  "history = SparseHistory(numpy.ones((4, 4)), numpy.ones((4, 4), int), numpy.r_[0], 1)\n"
+                  "expr = coupling.Expression(pre_expr='x_j', post_expr='gx')\n"
+                  "expr(1, history)\n"
+                  "block = shared_memory.SharedMemory(create=True, size=8)\n"
+                  "block.close()\n"
+                  "block.unlink()\n")
+        env = {key: value for key, value in os.environ.items() if key != 'NUMBA_THREADING_LAYER'}
+        subprocess.run([sys.executable, '-c', script], env=env, check=True, timeout=300)
+
+    def test_expression_kernel_threads(self):
+        history = SparseHistory(self.weights, self.weights.astype(int), numpy.r_[0], 2)
+        history.initialize(numpy.random.RandomState(42).randn(history.n_time, 1, history.n_node, 2))
+        expr = coupling.Expression(pre_expr='sin(x_j - x_i)', post_expr='gx')
+        expected = expr(1, history)
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            for out in pool.map(lambda _: expr(1, history), range(64)):
+                numpy.testing.assert_array_equal(out, expected)
+
+    @staticmethod
+    def _histories(n_cvar):
+        "Histories of different connectivities and delays, and the same again, for reusing a coupling."
+        rng = numpy.random.RandomState(42)
+        specs = (64, rng.randint(0, 3, (64, 64)) * 5), (64, rng.randint(0, 3, (64, 64))), \
+                (16, rng.randint(0, 40, (16, 16)))
+        for n_node, delays in specs:
+            weights = rng.rand(n_node, n_node) * (rng.rand(n_node, n_node) < 0.5)
+            state = rng.randn(delays.max() + 1, n_cvar, n_node, 1)
+            histories = []
+            for _ in range(2):
+                histories.append(SparseHistory(weights, delays, numpy.r_[:n_cvar], 1))
+                histories[-1].initialize(state)
+            yield histories
+
+    @pytest.mark.parametrize('cfun', [coupling.PreSigmoidal(dynamic=False), coupling.Linear(b=numpy.r_[0.1]),
+                                      coupling.Difference(), coupling.HyperbolicTangent(midpoint=numpy.r_[0.2]),
+                                      coupling.Kuramoto()])
+    def test_reuse_with_other_histories(self, cfun):
+        cfun.configure()
+        pristine = copy.deepcopy(cfun)
+        for history, fresh_history in self._histories(2):
+            fresh = copy.deepcopy(pristine)
+            for step in range(1, 12):
+                numpy.testing.assert_allclose(cfun(step, history), fresh(step, fresh_history), rtol=1e-5, atol=1e-6)
+
+
+    @pytest.mark.parametrize('cfun', [coupling.Linear(b=numpy.r_[0.1]), coupling.Difference()])
+    def test_instantaneous_reuse_with_other_histories(self, cfun):
+        rng = numpy.random.RandomState(42)
+        cfun.configure()
+        for n_node in (64, 64, 16):
+            weights = rng.rand(n_node, n_node) * (rng.rand(n_node, n_node) < 0.5)
+            history = SparseHistory(weights, numpy.zeros((n_node, n_node), int), numpy.r_[0, 1], 2)
+            x_i = rng.randn(2, n_node, 2)
+            numpy.testing.assert_allclose(cfun.evaluate_instantaneous(history, x_i),
+                                          cfun.evaluate(history, x_i, x_i[:, history.nnz_col_el_idx]),
+                                          rtol=1e-5, atol=1e-6)
+
+
 class TestCouplingShape(BaseTestCase):
     @pytest.mark.slow
     def test_shape(self):
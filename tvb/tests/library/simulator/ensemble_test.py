@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test for tvb.simulator.ensemble module
+
+"""
+import numpy
+from tvb.tests.library.base_testcase import BaseTestCase
+from tvb.simulator import simulator, models, coupling, integrators, monitors, noise, ensemble
+from tvb.datatypes.connectivity import Connectivity
+
+
+class TestEnsemble(BaseTestCase):
+
+    def _sim(self):
+        return simulator.Simulator(
+            connectivity=Connectivity.from_file(),
+            model=models.Generic2dOscillator(),
+            coupling=coupling.Linear(),
+            integrator=integrators.HeunStochastic(dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3])),
+            monitors=(monitors.TemporalAverage(period=1.0), ),
+            simulation_length=10.0)
+
+    def test_matches_serial_runs(self):
+        overrides = [{'coupling.a': numpy.r_[a]} for a in (0.0, 0.01, 0.02)]
+        seeds = [1, 2, 3]
+        results = list(ensemble.Ensemble(self._sim(), max_workers=2).run(overrides, seeds))
+        assert sorted(result.index for result in results) == [0, 1, 2]
+        for result in results:
+            assert result.elapsed > 0.0
+            sim = self._sim()
+            sim.coupling.a = overrides[result.index]['coupling.a']
+            numpy.random.seed(seeds[result.index])
+            sim.integrator.noise.random_stream.seed(seeds[result.index])
+            (time, data), = sim.configure().run()
+            (time_e, data_e), = result.output
+            numpy.testing.assert_array_equal(time, time_e)
+            numpy.testing.assert_array_equal(data, data_e)
+
+    def test_broadcast_seeds(self):
+        results = list(ensemble.Ensemble(self._sim(), max_workers=2).run(seeds=[1, 2], simulation_length=5.0))
+        assert len(results) == 2
+        assert all(result.output[0][1].shape == (5, 1, 76, 1) for result in results)
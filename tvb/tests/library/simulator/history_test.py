@@ -36,12 +36,14 @@ Test history in simulator.
 """
 
 import numpy
+import pytest
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.basic.neotraits.api import List
 from tvb.datatypes.connectivity import Connectivity
-from tvb.simulator.coupling import Coupling
-from tvb.simulator.integrators import Identity
-from tvb.simulator.models import Model
+from tvb.simulator.coupling import Coupling, Difference
+from tvb.simulator.history import LAYOUTS, SparseHistory, MemmapHistory, benchmark_layouts, select_layout
+from tvb.simulator.integrators import Identity, HeunDeterministic
+from tvb.simulator.models import Model, Generic2dOscillator
 from tvb.simulator.monitors import Raw
 from tvb.simulator.simulator import Simulator
 
@@ -110,3 +112,100 @@ class TestsExactPropagation(BaseTestCase):
                            [38., 13., 10., 1.],
                            [48., 17., 11., 1.]])
         assert numpy.allclose(xs, xs_)
+
+
+class TestLayouts(BaseTestCase):
+
+    def _histories(self, n=16, n_mode=2, min_delay=0, state_layout='variable'):
+        rng = numpy.random.RandomState(42)
+        weights = rng.rand(n, n) * (rng.rand(n, n) < 0.5)
+        delays = rng.randint(min_delay, 10, (n, n))
+        cvars = numpy.array([0, 2])
+        init = rng.randn(delays.max() + 1, 3, n, n_mode)
+        histories = {}
+        for name, cls in LAYOUTS.items():
+            histories[name] = cls(weights, delays, cvars, n_mode, state_layout)
+            histories[name].initialize(init)
+        return histories
+
+    @pytest.mark.parametrize('name', sorted(LAYOUTS))
+    def test_query_sparse(self, name):
+        histories = self._histories()
+        sparse, history = histories['sparse'], histories[name]
+        new_state = numpy.random.RandomState(0).randn(3, 16, 2)
+        order = history.nnz_row_order
+        for step in range(1, 25):
+            x_i, x_j = history.query_sparse(step)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step)[0], x_i)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step)[1], x_j[:, order])
+            numpy.testing.assert_array_equal(sparse.query_sparse_block(step, 3),
+                                             history.query_sparse_block(step, 3)[:, :, order])
+            sparse.update(step, new_state * step)
+            history.update(step, new_state * step)
+        numpy.testing.assert_array_equal(sparse.buffer, history.buffer)
+
+    @pytest.mark.parametrize('name', ['sparse', 'delay'])
+    def test_node_state_layout(self, name):
+        sparse = self._histories()['sparse']
+        history = self._histories(state_layout='node')[name]
+        # state variables of each node are contiguous in the buffer's time slices
+        assert history.buffer[0].swapaxes(0, 1).flags.c_contiguous
+        new_state = numpy.random.RandomState(0).randn(3, 16, 2)
+        order = history.nnz_row_order
+        for step in range(1, 25):
+            x_i, x_j = history.query_sparse(step)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step)[0], x_i)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step)[1], x_j[:, order])
+            numpy.testing.assert_array_equal(sparse.query_sparse_block(step, 3),
+                                             history.query_sparse_block(step, 3)[:, :, order])
+            sparse.update(step, new_state * step)
+            history.update(step, new_state * step)
+        numpy.testing.assert_array_equal(sparse.buffer, history.buffer)
+
+    def test_memmap_hot_window(self, tmpdir):
+        # blocks of 4 steps require delays of at least 3 steps
+        sparse = self._histories(min_delay=3)['sparse'] # type: SparseHistory
+        slab_bytes = sparse.buffer[0].nbytes
+        history = MemmapHistory(sparse.weights, sparse.delays.astype('i'), sparse.cvars, sparse.n_mode,
+                                hot_bytes=5 * slab_bytes, directory=str(tmpdir))
+        history.initialize(sparse.buffer)
+        assert history.hot_steps == 5
+        assert history.nbytes < sparse.nbytes
+        new_states = numpy.random.RandomState(0).randn(4, 3, 16, 2)
+        order = history.nnz_row_order
+        for step in range(1, 40, 4):
+            numpy.testing.assert_array_equal(sparse.query_sparse_block(step, 4),
+                                             history.query_sparse_block(step, 4)[:, :, order])
+            sparse.update_block(step, new_states * step)
+            history.update_block(step, new_states * step)
+            x_i, x_j = history.query_sparse(step + 4)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step + 4)[0], x_i)
+            numpy.testing.assert_array_equal(sparse.query_sparse(step + 4)[1], x_j[:, order])
+
+    def test_select_layout(self):
+        sparse = self._histories()['sparse'] # type: SparseHistory
+        name = select_layout(sparse.weights, sparse.delays.astype('i'), sparse.cvars, sparse.n_mode, n_step=4, n_repeat=1)
+        assert name in LAYOUTS
+        # delays far beyond the horizon are benchmarked without their full buffers
+        delays = sparse.delays.astype('i') * 10 ** 6
+        times = benchmark_layouts(sparse.weights, delays, sparse.cvars, sparse.n_mode, n_step=4, n_repeat=1,
+                                  n_horizon=8)
+        assert sorted(times) == ['delay', 'node', 'sparse']
+
+    @pytest.mark.parametrize('layout', sorted(LAYOUTS) + ['auto'])
+    def test_simulator(self, layout):
+        xs = []
+        for history_layout in ('sparse', layout):
+            numpy.random.seed(42)
+            sim = Simulator(
+                connectivity=Connectivity.from_file(),
+                model=Generic2dOscillator(),
+                coupling=Difference(a=numpy.r_[0.01]),
+                integrator=HeunDeterministic(dt=0.1),
+                monitors=(Raw(),),
+                simulation_length=10.0,
+                history_layout=history_layout).configure()
+            (_, x), = sim.run()
+            xs.append(x)
+        numpy.testing.assert_array_equal(*xs)
+
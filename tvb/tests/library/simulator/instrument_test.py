@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test for tvb.simulator.instrument module
+
+"""
+import json
+import numpy
+from tvb.tests.library.base_testcase import BaseTestCase
+from tvb.simulator import simulator, models, coupling, integrators, monitors, noise, instrument
+from tvb.datatypes.connectivity import Connectivity
+
+
+class TestPhaseProfiler(BaseTestCase):
+
+    def _sim(self):
+        numpy.random.seed(42)
+        return simulator.Simulator(
+            connectivity=Connectivity.from_file(),
+            model=models.Generic2dOscillator(),
+            coupling=coupling.Linear(),
+            integrator=integrators.HeunStochastic(dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], noise_seed=1)),
+            monitors=(monitors.Raw(), monitors.TemporalAverage(period=1.0)),
+            simulation_length=10.0).configure()
+
+    def test_report(self):
+        sim = self._sim()
+        observe = sim.model.observe
+        sim.profiler = instrument.PhaseProfiler(track_memory=True)
+        output = sim.run()
+        report = sim.profiler.report()
+        assert report['n_steps'] == 100
+        phases = report['phases']
+        assert list(phases) == ['coupling', 'stimulus', 'scheme', 'dfun', 'noise', 'history', 'observe',
+                                'monitor0_Raw', 'monitor1_TemporalAverage']
+        assert phases['dfun']['calls'] == 200
+        assert phases['monitor1_TemporalAverage']['calls'] == 100
+        assert 0.0 < sum(entry['fraction'] for entry in phases.values()) <= 1.0
+        assert phases['history']['peak_bytes'] >= 0
+        assert json.loads(sim.profiler.to_json())['n_steps'] == 100
+        # wrappers are removed and results unchanged
+        assert '_loop_compute_node_coupling' not in sim.__dict__
+        assert sim.model.observe is observe
+        for (t, y), (t_ref, y_ref) in zip(output, self._sim().run()):
+            numpy.testing.assert_array_equal(y, y_ref)
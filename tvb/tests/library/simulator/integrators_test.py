@@ -41,6 +41,7 @@ import pytest
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.simulator import integrators
 from tvb.simulator import noise
+from tvb.simulator import models
 
 # For the moment all integrators inherit dt from the base class
 dt = integrators.Integrator.dt.default
@@ -154,3 +155,143 @@ class TestIntegrators(BaseTestCase):
             x = vode.scheme(x, self._dummy_dfun, 0.0, 0.0, 0.0)
         for idx, val in zip(vode.clamped_state_variable_indices, vode.clamped_state_variable_values):
             assert numpy.allclose(x[idx], val)
+
+    @pytest.mark.parametrize('cls, ntau', [(integrators.HeunDeterministic, 0.0),
+                                           (integrators.HeunStochastic, 0.0),
+                                           (integrators.HeunStochastic, 1.0),
+                                           (integrators.EulerDeterministic, 0.0),
+                                           (integrators.EulerStochastic, 0.0),
+                                           (integrators.RungeKutta4thOrderDeterministic, 0.0)])
+    def test_inplace_matches_scheme(self, cls, ntau):
+        sh = 2, 10, 1
+        stimulus = numpy.random.randn(*sh)
+
+        def dfun(X, coupling, local_coupling):
+            return -X ** 3 + coupling
+
+        def make(inplace):
+            integrator = cls(dt=0.1, inplace=inplace,
+                             bounded_state_variable_indices=numpy.r_[0],
+                             state_variable_boundaries=numpy.array([[-0.5, 0.5]]))
+            if isinstance(integrator, integrators.IntegratorStochastic):
+                integrator.noise = noise.Additive(nsig=numpy.r_[1e-2], ntau=ntau, noise_seed=42)
+                if ntau > 0.0:
+                    integrator.noise.configure_coloured(integrator.dt, sh)
+                else:
+                    integrator.noise.configure_white(integrator.dt, sh)
+            return integrator
+
+        integrator, inplace = make(False), make(True)
+        inplace.configure_workspace(sh, numpy.float64)
+        x = x_inplace = numpy.random.randn(*sh)
+        for i in range(5):
+            x = integrator.scheme(x, dfun, 0.1, 0.0, stimulus)
+            x_next = inplace.scheme(x_inplace, dfun, 0.1, 0.0, stimulus)
+            assert x_next is not x_inplace
+            x_inplace = x_next
+            numpy.testing.assert_array_equal(x, x_inplace)
+
+    @pytest.mark.parametrize('split', [True, False])
+    def test_multirate_matches_heun(self, split):
+        model = models.Epileptor()
+        model.configure()
+        x0 = model.initial(0.05, (1, model.nvar, 1, 1), numpy.random.RandomState(42))[0]
+        coupling = numpy.zeros((len(model.cvar), 1, 1))
+        heun = integrators.HeunDeterministic(dt=0.05)
+        multirate = integrators.MultiRateHeunDeterministic(dt=0.05, n_slow=10, slow_state_variable_indices=numpy.r_[2])
+        multirate.configure()
+        calls = {'dfun': 0, 'fast': 0, 'slow': 0}
+
+        def counted(name, dfun):
+            def wrapper(*args):
+                calls[name] += 1
+                return dfun(*args)
+            return wrapper
+
+        if split:
+            fast_dfun, slow_dfun = model.split_dfun()
+            multirate.configure_split_dfun((counted('fast', fast_dfun), counted('slow', slow_dfun)))
+        x, y, xs, ys = x0, x0, [], []
+        for i in range(4000):
+            x = heun.scheme(x, model.dfun, coupling, 0.0, 0.0)
+            y = multirate.scheme(y, counted('dfun', model.dfun), coupling, 0.0, 0.0)
+            xs.append(x)
+            ys.append(y)
+        xs, ys = numpy.array(xs), numpy.array(ys)
+        # the slow permittivity variable is tracked closely, the fast variables on average
+        numpy.testing.assert_allclose(ys[:, 2], xs[:, 2], atol=1e-2)
+        numpy.testing.assert_allclose(ys.mean(axis=0), xs.mean(axis=0), atol=5e-2)
+        # slow terms are evaluated once per slow step, if the model declares them apart
+        if split:
+            assert calls == {'dfun': 0, 'fast': 2 * 4000, 'slow': 4000 // 10}
+        else:
+            assert calls == {'dfun': 2 * 4000, 'fast': 0, 'slow': 0}
+
+    @pytest.mark.parametrize('model_class', [models.Epileptor, models.Epileptor2D, models.EpileptorRestingState,
+                                             models.EpileptorCodim3, models.EpileptorCodim3SlowMod])
+    def test_multirate_split_dfun(self, model_class):
+        model = model_class()
+        model.configure()
+        state = model.initial(0.05, (1, model.nvar, 8, 1), numpy.random.RandomState(42))[0]
+        coupling = numpy.random.RandomState(42).randn(len(model.cvar), 8, 1)
+        fast_dfun, slow_dfun = model.split_dfun()
+        dX = model.dfun(state, coupling)
+        slow = [model.state_variables.index(name) for name in model.slow_state_variables]
+        fast = [i for i in range(model.nvar) if i not in slow]
+        # the split evaluates the same equations as the dfun
+        numpy.testing.assert_array_equal(fast_dfun(state, coupling)[fast], dX[fast])
+        numpy.testing.assert_array_equal(slow_dfun(state, coupling), dX[slow])
+
+    @pytest.mark.parametrize('declared', [True, False])
+    def test_exponential_euler_linear_decay(self, declared):
+        decay, drive = numpy.r_[50.0, 0.5].reshape((2, 1, 1)), 1.0
+
+        def dfun(X, coupling, local_coupling):
+            return -decay * X + drive
+
+        # the step is far beyond the stability limit of explicit schemes for the stiff variable
+        integrator = integrators.ExponentialEulerDeterministic(dt=0.5)
+        if declared:
+            integrator.configure_linear_decay(decay)
+        x0 = numpy.ones((2, 3, 1))
+        x = x0
+        for i in range(10):
+            x = integrator.scheme(x, dfun, 0.0, 0.0, 0.0)
+        used_decay = integrator._coefficients[1][0]
+        numpy.testing.assert_allclose(numpy.broadcast_to(used_decay, x.shape), numpy.broadcast_to(decay, x.shape),
+                                      rtol=1e-6)
+        exact = drive / decay + (x0 - drive / decay) * numpy.exp(-decay * 10 * 0.5)
+        numpy.testing.assert_allclose(x, exact, rtol=1e-6)
+
+    def test_imex_euler_stable(self):
+        integrator = integrators.IMEXEulerDeterministic(dt=0.5, linear_decay=numpy.r_[50.0])
+        x = numpy.ones((1, 3, 1))
+        for i in range(100):
+            x = integrator.scheme(x, lambda X, c, lc: -50.0 * X + 1.0, 0.0, 0.0, 0.0)
+        numpy.testing.assert_allclose(x, 1.0 / 50.0)
+
+    def test_exponential_euler_stochastic_variance(self):
+        # the Ornstein-Uhlenbeck process has the exact stationary variance D / decay for any step
+        decay, nsig = 10.0, 0.5
+        integrator = integrators.ExponentialEulerStochastic(
+            dt=0.5, linear_decay=numpy.r_[decay], noise=noise.Additive(nsig=numpy.r_[nsig], noise_seed=42))
+        integrator.noise.configure_white(integrator.dt, (1, 4000, 1))
+        x = numpy.zeros((1, 4000, 1))
+        for i in range(20):
+            x = integrator.scheme(x, lambda X, c, lc: -decay * X, 0.0, 0.0, 0.0)
+        numpy.testing.assert_allclose(x.var(), nsig / decay, rtol=0.1)
+
+    def test_sparse_noise(self):
+        sh = 2, 10, 1
+        heun_det = integrators.HeunDeterministic()
+        heun_sto = integrators.HeunStochastic(sparse_noise=True, noise=noise.Additive(nsig=numpy.r_[0.0, 1e-3]))
+        heun_sto.noise.nsig = heun_sto.noise.nsig.reshape((2, 1, 1))
+        heun_sto.noise.configure_white(heun_sto.dt, sh)
+        heun_sto.configure_noise_support(sh)
+        x = y = numpy.random.randn(*sh)
+        for i in range(10):
+            x = heun_det.scheme(x, self._dummy_dfun, 0.0, 0.0, 0.0)
+            y = heun_sto.scheme(y, self._dummy_dfun, 0.0, 0.0, 0.0)
+        # only the state variable with non-zero dispersion is noisy
+        numpy.testing.assert_array_equal(y[0], x[0])
+        assert (y[1] != x[1]).all()
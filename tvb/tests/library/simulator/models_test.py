@@ -35,8 +35,10 @@ Test for tvb.simulator.models module
 
 """
 
+import pytest
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.simulator import models
+from tvb.simulator.models.dsl import ModelSpec, benchmark_backends
 import numpy
 
 
@@ -178,3 +180,97 @@ class TestModels(BaseTestCase):
 
         model = models.ReducedWongWangExcInh()
         self._validate_initialization(model, 2)
+
+    def test_zerlaut_tabulated_transfer_functions(self):
+        grid = {"fe": numpy.array([0.0, 0.2, 128]),
+                "fi": numpy.array([0.0, 0.2, 128]),
+                "W": numpy.array([0.0, 1000.0, 21])}
+        for model_class in (models.ZerlautFirstOrder, models.ZerlautSecondOrder):
+            model = model_class()
+            model.configure()
+            tabulated = model_class(tabulate_transfer_functions=True, transfer_function_grid=grid)
+            tabulated.configure()
+            assert set(tabulated.transfer_function_error) == {'excitatory', 'inhibitory'}
+            state = numpy.random.uniform(0.001, 0.05, (model.nvar, 10, 1))
+            state[-1] = numpy.random.uniform(0.0, 1000.0, (10, 1))
+            # adaptation outside of the grid, evaluated directly
+            state[-1, -1] = 2000.0
+            coupling = numpy.random.uniform(0.0, 0.01, (model.nvar, 10, 1))
+            expected = model.dfun(state, coupling)
+            actual = tabulated.dfun(state, coupling)
+            for dx, dx_expected in zip(actual, expected):
+                numpy.testing.assert_allclose(dx, dx_expected, atol=0.03 * abs(dx_expected).max())
+            numpy.testing.assert_array_equal(actual[:, -1], expected[:, -1])
+            with pytest.raises(ValueError):
+                model_class(tabulate_transfer_functions=True, g_L=numpy.r_[10.0, 12.0]).configure()
+
+    def test_numba_dfun_out(self):
+        for model_class in models.base.ModelNumbaDfun.get_known_subclasses().values():
+            if not model_class.__module__.startswith(models.__name__):
+                continue
+            model = model_class()
+            model.configure()
+            state = model.initial(0.1, (1, model.nvar, 5, 1))[0]
+            coupling = numpy.random.rand(len(model.cvar), 5, 1)
+            out = numpy.empty_like(state)
+            model.dfun(state, coupling, out=out)
+            numpy.testing.assert_array_equal(out, model.dfun(state, coupling))
+
+
+def g2d_spec(name):
+    "Declaration of the Generic2dOscillator, with its default parameters."
+    g2d = models.Generic2dOscillator()
+    names = 'tau I a b c d e f g beta alpha gamma'.split()
+    return ModelSpec(
+        name=name,
+        state_variables={'V': (-2.0, 4.0), 'W': (-6.0, 6.0)},
+        parameters={name: getattr(g2d, name)[0] for name in names},
+        derivatives={'V': 'd * tau * (alpha * W - f * V**3 + e * V**2 + g * V + gamma * I + gamma * c_0 + lc_0)',
+                     'W': 'd * (a + b * V + c * V**2 - beta * W) / tau'},
+        coupling_variables=('V', ),
+        variables_of_interest=('V', ))
+
+
+class TestModelSpec(BaseTestCase):
+
+    def _state(self, model, n_node=32):
+        rng = numpy.random.RandomState(42)
+        state = model.initial(0.1, (1, model.nvar, n_node, 1), rng)[0]
+        return state, rng.randn(len(model.cvar), n_node, 1)
+
+    def test_backends_match_handwritten(self):
+        model = g2d_spec('SpecG2D').model_class()()
+        model.configure()
+        g2d = models.Generic2dOscillator()
+        g2d.configure()
+        state, coupling = self._state(model)
+        expected = g2d.dfun(state, coupling, 0.1)
+        numpy.testing.assert_allclose(model.dfun(state, coupling, 0.1), expected, rtol=1e-12)
+        numpy.testing.assert_allclose(model._numpy_dfun(state, coupling, 0.1), expected, rtol=1e-12)
+        times = benchmark_backends(model, n_node=64, n_repeat=2)
+        assert sorted(times) == ['numba', 'numpy']
+
+    def test_conditional_and_math(self):
+        spec = ModelSpec(
+            name='SpecRectified',
+            state_variables={'x': (-1.0, 1.0), 'y': (-1.0, 1.0)},
+            parameters={'k': 2.0, 'e': 0.5},
+            derivatives={'x': 'k * (y if x > 0.0 else -x**2) + c_0 + lc_0',
+                         'y': 'tanh(c_1) - e * abs(y)**1.5 + exp(-x) * pi'},
+            coupling_variables=('x', 'y'))
+        model = spec.model_class()()
+        model.configure()
+        state, coupling = self._state(model)
+        numpy.testing.assert_allclose(model.dfun(state, coupling), model._numpy_dfun(state, coupling), rtol=1e-12)
+        # parameters shadow math constants
+        assert 'float e = param[1 * n + i];' in spec.opencl_source()
+        assert '((x > 0.0f) ? y : (-(x * x)))' in spec.opencl_source()
+        assert 'M_PI_F' in spec.opencl_source()
+
+    def test_invalid_declarations(self):
+        with pytest.raises(ValueError):
+            ModelSpec('SpecInvalid', {'x': (0.0, 1.0)}, {}, {'x': 'k * x'}, ('x', ))
+        with pytest.raises(ValueError):
+            ModelSpec('SpecInvalid', {'x': (0.0, 1.0)}, {}, {'y': 'x'}, ('x', ))
+        with pytest.raises(ValueError):
+            ModelSpec('SpecInvalid', {'x': (0.0, 1.0)}, {}, {'x': 'x'}, ('y', ))
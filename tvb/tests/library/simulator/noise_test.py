@@ -34,6 +34,10 @@ Test for tvb.simulator.noise module
 .. moduleauthor:: Paula Sanz Leon <sanzleon.paula@gmail.com>
 
 """
+import copy
+import gc
+import numpy
+import pytest
 from tvb.tests.library.base_testcase import BaseTestCase
 from tvb.simulator import noise
 from tvb.datatypes import equations
@@ -48,3 +52,74 @@ class TestNoise(BaseTestCase):
         noise_multiplicative = noise.Multiplicative()
         assert noise_multiplicative.ntau == 0.0
         assert isinstance(noise_multiplicative.b, equations.Linear)
+
+    @staticmethod
+    def _streams(shape, **kwds):
+        noise_streams = noise.Additive(bit_generator='Philox', noise_seed=42, **kwds)
+        noise_streams.configure_white(0.1, shape)
+        return noise_streams
+
+    @pytest.mark.parametrize('block_size, n_thread', [(1, 1), (7, 2), (64, 3)])
+    def test_streams_independent_of_blocks(self, block_size, n_thread):
+        shape = 2, 150, 1
+        reference = self._streams(shape)
+        noise_streams = self._streams(shape, block_size=block_size, n_thread=n_thread)
+        for i in range(100):
+            numpy.testing.assert_array_equal(noise_streams.generate(shape), reference.generate(shape))
+
+    def test_streams_resume(self):
+        shape = 2, 150, 1
+        noise_streams = self._streams(shape, block_size=8)
+        for i in range(11):
+            noise_streams.generate(shape)
+        copied = copy.deepcopy(noise_streams)
+        resumed = self._streams(shape)
+        resumed.set_state(noise_streams.get_state())
+        for i in range(10):
+            expected = noise_streams.generate(shape)
+            numpy.testing.assert_array_equal(copied.generate(shape), expected)
+            numpy.testing.assert_array_equal(resumed.generate(shape), expected)
+
+    def test_streams_start_at_step(self):
+        shape = 2, 150, 1
+        streams = noise.NoiseStreams(42, shape, block_size=32)
+        expected = [streams.normal().copy() for _ in range(300)]
+        for step in (0, 63, 64, 200):
+            started = noise.NoiseStreams(42, shape, n_thread=2, step=step)
+            for i in range(step, 300):
+                numpy.testing.assert_array_equal(started.normal(), expected[i])
+            started.close()
+        streams.close()
+
+    def test_streams_support(self):
+        shape = 2, 150, 1
+        reference = self._streams(shape)
+        expected = [reference.generate(shape) for _ in range(70)]
+        for nodes in (numpy.r_[3], numpy.r_[3, 100, 149]):
+            support = numpy.ravel_multi_index((numpy.zeros_like(nodes), nodes, numpy.zeros_like(nodes)), shape)
+            sparse = self._streams(shape)
+            sparse.configure_support(shape, support)
+            assert sparse._support_streams == tuple(numpy.unique(nodes // noise.NoiseStreams.nodes_per_stream))
+            for realization in expected:
+                actual = sparse.generate(shape)
+                numpy.testing.assert_array_equal(actual.flat[support], realization.flat[support])
+                assert numpy.count_nonzero(actual) == support.size
+
+    def test_streams_stop_threads(self):
+        streams = noise.NoiseStreams(42, (1, 10, 1), n_thread=2)
+        streams.normal()
+        finalizer = streams._finalizer
+        del streams
+        gc.collect()
+        assert not finalizer.alive
+
+    def test_support(self):
+        shape = 2, 5, 1
+        support = numpy.r_[1, 6, 8]
+        noise_support = noise.Additive(noise_seed=42)
+        noise_support.configure_white(1.0, shape)
+        noise_support.configure_support(shape, support)
+        realization = noise_support.generate(shape)
+        expected = numpy.zeros(shape)
+        expected.flat[support] = numpy.random.RandomState(42).normal(size=support.size)
+        numpy.testing.assert_array_equal(realization, expected)
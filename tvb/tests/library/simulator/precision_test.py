@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test for tvb.simulator.precision module
+
+"""
+import numpy
+import pytest
+from tvb.tests.library.base_testcase import BaseTestCase
+from tvb.simulator import simulator, models, coupling, integrators, monitors, noise, precision
+from tvb.datatypes.connectivity import Connectivity
+
+
+class TestPrecision(BaseTestCase):
+
+    def test_validate(self):
+        reports = list(precision.validate(simulation_length=1.0))
+        assert len(reports) == 20
+        for report in reports:
+            assert not report.upcast, str(report)
+            assert report.max_rel_error < 1e-2, str(report)
+
+    @pytest.mark.parametrize('noise_', [noise.Additive(nsig=numpy.r_[1e-3]),
+                                        noise.Additive(nsig=numpy.r_[1e-3], ntau=1.0),
+                                        noise.Multiplicative(nsig=numpy.r_[1e-3])])
+    def test_stochastic_monitors(self, noise_):
+        conn = Connectivity.from_file()
+        sim = simulator.Simulator(
+            model=models.Generic2dOscillator(), connectivity=conn, coupling=coupling.Sigmoidal(),
+            integrator=integrators.HeunStochastic(dt=0.1, noise=noise_),
+            monitors=[monitors.Raw(), monitors.TemporalAverage(period=1.0),
+                      monitors.SpatialAverage(period=1.0, spatial_mask=numpy.r_[:76] % 3),
+                      monitors.Bold(period=10.0)],
+            simulation_length=20.0, precision='float32').configure()
+        assert sim.current_state.dtype == numpy.float32
+        assert sim.model.a.dtype == numpy.float32
+        for _, data in sim.run():
+            assert data.dtype == numpy.float32
@@ -38,22 +38,54 @@ schemes (region and surface based simulations).
 
 """
 
+import copy
 import pytest
 import numpy
 import itertools
 from tvb.datatypes.surfaces import CorticalSurface
 from tvb.tests.library.base_testcase import BaseTestCase
-from tvb.simulator import simulator, models, coupling, integrators, monitors, noise
+from tvb.simulator import simulator, models, coupling, integrators, monitors, noise, batch
 from tvb.datatypes.connectivity import Connectivity
 from tvb.datatypes.cortex import Cortex
 from tvb.datatypes.local_connectivity import LocalConnectivity
 from tvb.datatypes.region_mapping import RegionMapping
 from tvb.simulator.integrators import HeunDeterministic, IntegratorStochastic
+from tvb.simulator.models.dsl import ModelSpec
 
 MODEL_CLASSES = models.Model.get_known_subclasses().values()
 METHOD_CLASSES = integrators.Integrator.get_known_subclasses().values()
 
 
+def _simulator(seed=42, horizon=None, **kwds):
+    """
+    Configure a 10 ms simulation of the default connectivity, with any of its attributes
+    overridden by keyword. Given a ``horizon``, initial conditions of that length are
+    drawn from ``seed``; otherwise they are left to the global random state.
+
+    """
+    numpy.random.seed(seed)
+    params = dict(
+        model=models.Generic2dOscillator(),
+        coupling=coupling.Linear(a=numpy.r_[0.01]),
+        integrator=HeunDeterministic(dt=0.1),
+        monitors=(monitors.Raw(), monitors.TemporalAverage(period=0.7)),
+        simulation_length=10.0)
+    params.update(kwds)
+    if 'connectivity' not in params:
+        params['connectivity'] = Connectivity.from_file()
+    if horizon is not None:
+        shape = horizon, params['model'].nvar, params['connectivity'].weights.shape[0], 1
+        params['initial_conditions'] = numpy.random.RandomState(seed).uniform(-1.0, 1.0, shape)
+    return simulator.Simulator(**params).configure()
+
+
+def _assert_outputs_equal(outputs, expected, rtol=0.0, atol=0.0):
+    "Compare the time and data of each monitor's output, exactly unless tolerances are given."
+    for (t, y), (t_e, y_e) in zip(outputs, expected):
+        numpy.testing.assert_allclose(t, t_e, rtol=rtol, atol=atol)
+        numpy.testing.assert_allclose(y, y_e, rtol=rtol, atol=atol)
+
+
 class Simulator(object):
     """
     Simulator test class
@@ -178,3 +210,259 @@ class TestSimulator(BaseTestCase):
         result = test_simulator.run_simulation(simulation_length=2)
 
         assert len(test_simulator.monitors) == len(result)
+
+
+class TestBatchedSimulator(BaseTestCase):
+
+    def _run(self, sim_class, initial_conditions, **kwargs):
+        kwargs.setdefault('monitors', (monitors.Raw(), monitors.TemporalAverage(period=1.0)))
+        sim = sim_class(
+            connectivity=Connectivity.from_file(),
+            model=models.Generic2dOscillator(),
+            coupling=coupling.Linear(),
+            integrator=HeunDeterministic(dt=0.1),
+            initial_conditions=initial_conditions,
+            simulation_length=10.0,
+            **kwargs
+        ).configure()
+        return sim.run()
+
+    def test_sweep_matches_individual_runs(self):
+        a_values = numpy.r_[0.0, 0.01, 0.02]
+        I_values = numpy.r_[-0.5, 0.0, 0.5]
+        numpy.random.seed(42)
+        ic = numpy.random.uniform(-1.0, 1.0, (600, 2, 76, 1))
+        (_, raw), (_, tavg) = self._run(batch.BatchedSimulator, ic,
+                                        model_sweep={'I': I_values},
+                                        coupling_sweep={'a': a_values})
+        assert raw.shape == (100, 3, 1, 76, 1)
+        assert tavg.shape == (10, 3, 1, 76, 1)
+        for i, (a, I) in enumerate(zip(a_values, I_values)):
+            sim = simulator.Simulator(
+                connectivity=Connectivity.from_file(),
+                model=models.Generic2dOscillator(I=numpy.r_[I]),
+                coupling=coupling.Linear(a=numpy.r_[a]),
+                integrator=HeunDeterministic(dt=0.1),
+                initial_conditions=ic,
+                monitors=(monitors.Raw(), monitors.TemporalAverage(period=1.0)),
+                simulation_length=10.0).configure()
+            (_, raw_i), (_, tavg_i) = sim.run()
+            numpy.testing.assert_allclose(raw[:, i], raw_i, rtol=1e-6, atol=1e-9)
+            numpy.testing.assert_allclose(tavg[:, i], tavg_i, rtol=1e-6, atol=1e-9)
+
+    def test_unsupported_monitor(self):
+        with pytest.raises(ValueError):
+            self._run(batch.BatchedSimulator, None, coupling_sweep={'a': numpy.r_[0.0, 0.1]},
+                      monitors=(monitors.GlobalAverage(), ))
+
+
+class TestChunkedSimulator(BaseTestCase):
+
+    def _run(self, chunk_size, cfun, ntau=0.0, n_delay=None):
+        conn = Connectivity.from_file()
+        conn.speed = numpy.r_[1.0]
+        conn.tract_lengths = numpy.maximum(conn.tract_lengths, 2.0)
+        if n_delay is not None:
+            conn.tract_lengths = numpy.ceil(conn.tract_lengths / conn.tract_lengths.max() * n_delay) * 10.0
+        sim = _simulator(
+            horizon=300, connectivity=conn, coupling=cfun, chunk_size=chunk_size,
+            integrator=integrators.HeunStochastic(
+                dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], ntau=ntau, noise_seed=42)),
+            monitors=(monitors.Raw(), monitors.SubSample(period=0.5), monitors.TemporalAverage(period=0.7)))
+        return sim, sim.run()
+
+    @pytest.mark.parametrize('cfun, ntau', [(coupling.Linear(a=numpy.r_[0.01]), 0.0),
+                                            (coupling.Linear(a=numpy.r_[0.01]), 1.0),
+                                            (coupling.Kuramoto(), 0.0)])
+    def test_chunks_match_steps(self, cfun, ntau):
+        sim, chunked = self._run(32, cfun, ntau)
+        assert sim._chunk_steps() == 21
+        _, stepped = self._run(1, cfun, ntau)
+        _assert_outputs_equal(chunked, stepped)
+
+    @pytest.mark.parametrize('cfun', [coupling.Linear(a=numpy.r_[0.01]), coupling.Difference(a=numpy.r_[0.01])])
+    def test_delay_grouped_chunks_match_steps(self, cfun):
+        sim, chunked = self._run(32, cfun, n_delay=4)
+        assert sim.coupling.delay_grouped_sum(sim.history) is not None
+        _, stepped = self._run(1, cfun, n_delay=4)
+        _assert_outputs_equal(chunked, stepped)
+
+    def test_dense_coupling_not_chunked(self):
+        sim, _ = self._run(32, coupling.Coupling())
+        assert sim._chunk_steps() == 1
+
+
+class TestInstantaneousCoupling(BaseTestCase):
+
+    def _run(self, cfun, integrator, instantaneous=True, stage_coupling=False):
+        conn = Connectivity.from_file()
+        conn.speed = numpy.r_[numpy.inf]
+        sim = _simulator(horizon=1, connectivity=conn, coupling=cfun, integrator=integrator,
+                         monitors=(monitors.Raw(), ), stage_coupling=stage_coupling)
+        if not instantaneous:
+            sim._instantaneous_coupling = lambda: False
+        return sim, sim.run()
+
+    @pytest.mark.parametrize('cfun', [coupling.Linear(a=numpy.r_[0.01]), coupling.Difference(a=numpy.r_[0.01]),
+                                      coupling.Sigmoidal()])
+    def test_matches_history(self, cfun):
+        sim, instantaneous = self._run(copy.deepcopy(cfun), HeunDeterministic(dt=0.1))
+        assert sim.horizon == 1 and sim._instantaneous_coupling()
+        ref_sim, stepped = self._run(cfun, HeunDeterministic(dt=0.1), instantaneous=False)
+        _assert_outputs_equal(instantaneous, stepped, rtol=1e-6, atol=1e-9)
+        numpy.testing.assert_allclose(sim.history.buffer, ref_sim.history.buffer, rtol=1e-6, atol=1e-9)
+
+    def test_stage_coupling(self):
+        cfun = coupling.Linear(a=numpy.r_[0.1])
+        rk4 = integrators.RungeKutta4thOrderDeterministic
+        held, _ = self._run(copy.deepcopy(cfun), rk4(dt=0.1))
+        staged, _ = self._run(copy.deepcopy(cfun), rk4(dt=0.1), stage_coupling=True)
+        fine, _ = self._run(cfun, rk4(dt=0.001), stage_coupling=True)
+        # with coupling at each stage, RK4 keeps its order of accuracy
+        staged_err = numpy.abs(staged.current_state - fine.current_state).max()
+        assert staged_err < 0.1 * numpy.abs(held.current_state - fine.current_state).max()
+
+
+class TestInplaceIntegration(BaseTestCase):
+
+    @pytest.mark.parametrize('chunk_size', [1, 32])
+    @pytest.mark.parametrize('integrator', [
+        integrators.HeunStochastic(dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], noise_seed=42)),
+        integrators.RungeKutta4thOrderDeterministic(dt=0.1)])
+    def test_matches_default(self, integrator, chunk_size):
+        inplace = copy.deepcopy(integrator)
+        inplace.inplace = True
+        inplace_sim = _simulator(horizon=300, integrator=inplace, chunk_size=chunk_size)
+        inplace_out = inplace_sim.run()
+        assert inplace_sim.integrator._workspace is not None and inplace_sim.integrator._dfun_out
+        sim = _simulator(horizon=300, integrator=copy.deepcopy(integrator), chunk_size=chunk_size)
+        _assert_outputs_equal(inplace_out, sim.run())
+        numpy.testing.assert_array_equal(inplace_sim.current_state, sim.current_state)
+        assert not any(inplace_sim.current_state is array for array in inplace_sim.integrator._workspace.values())
+
+
+class TestStateLayout(BaseTestCase):
+
+    def _sim(self, state_layout, inplace, chunk_size):
+        return _simulator(
+            model=models.Epileptor(), coupling=coupling.Difference(a=numpy.r_[1e-3]),
+            integrator=integrators.HeunStochastic(dt=0.05, inplace=inplace, noise=noise.Additive(
+                nsig=numpy.r_[0.0, 0.0, 0.0, 1e-4, 1e-4, 0.0], noise_seed=42)),
+            monitors=(monitors.Raw(), monitors.TemporalAverage(period=1.0)),
+            state_layout=state_layout, chunk_size=chunk_size)
+
+    @pytest.mark.parametrize('chunk_size', [1, 32])
+    @pytest.mark.parametrize('inplace', [False, True])
+    def test_node_layout_matches_variable(self, inplace, chunk_size):
+        node_sim = self._sim('model', inplace, chunk_size)
+        node_out = node_sim.run()
+        assert node_sim.layout == 'node'
+        # state variables of each node are contiguous
+        assert node_sim.current_state.swapaxes(0, 1).flags.c_contiguous
+        assert node_sim.history.buffer[0].swapaxes(0, 1).flags.c_contiguous
+        assert all(y.flags.c_contiguous for _, y in node_out)
+        sim = self._sim('variable', inplace, chunk_size)
+        _assert_outputs_equal(node_out, sim.run())
+        numpy.testing.assert_array_equal(node_sim.current_state, sim.current_state)
+
+
+class TestNumbaBackend(BaseTestCase):
+
+    def _run(self, backend, model, cfun, integrator):
+        sim = _simulator(
+            horizon=300, backend=backend, model=model, coupling=cfun, integrator=integrator,
+            monitors=(monitors.Raw(), monitors.SubSample(period=0.5), monitors.TemporalAverage(period=0.7)))
+        return sim, sim.run()
+
+    @pytest.mark.parametrize('model, cfun, integrator', [
+        (models.Generic2dOscillator(), coupling.Linear(a=numpy.r_[0.01]),
+         integrators.HeunStochastic(dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], noise_seed=42))),
+        (models.ReducedWongWang(), coupling.Difference(a=numpy.r_[0.01]), integrators.EulerDeterministic(dt=0.1)),
+    ])
+    def test_matches_numpy(self, model, cfun, integrator):
+        fused_sim, fused = self._run('numba', copy.deepcopy(model), copy.deepcopy(cfun), copy.deepcopy(integrator))
+        sim, stepped = self._run('numpy', model, cfun, integrator)
+        _assert_outputs_equal(fused, stepped, rtol=1e-6, atol=1e-9)
+        numpy.testing.assert_allclose(fused_sim.current_state, sim.current_state, rtol=1e-6, atol=1e-9)
+        # the NumPy loop continues from the history and monitor state left by the kernel
+        fused_sim.backend = 'numpy'
+        fused_sim._numba_backend = None
+        _assert_outputs_equal(fused_sim.run(), sim.run(), rtol=1e-6, atol=1e-9)
+
+    def test_unsupported(self):
+        with pytest.raises(ValueError):
+            self._run('numba', models.Kuramoto(), coupling.Kuramoto(), integrators.HeunDeterministic(dt=0.1))
+
+    def test_unsupported_batch(self):
+        sim = batch.BatchedSimulator(
+            connectivity=Connectivity.from_file(),
+            model=models.Generic2dOscillator(),
+            coupling=coupling.Linear(a=numpy.r_[0.01]),
+            integrator=integrators.HeunDeterministic(dt=0.1),
+            monitors=(monitors.Raw(), ),
+            model_sweep={'I': numpy.r_[0.0, 0.5]},
+            backend='numba')
+        with pytest.raises(ValueError, match='batched'):
+            sim.configure()
+
+    def test_unsupported_memmap(self):
+        with pytest.raises(ValueError, match='memory mapped'):
+            _simulator(monitors=(monitors.Raw(), ), history_layout='memmap', backend='numba')
+
+    def test_declared_model(self):
+        spec = ModelSpec(
+            name='SpecFitzHughNagumo',
+            state_variables={'V': (-2.0, 2.0), 'W': (-2.0, 2.0)},
+            parameters={'tau': 3.0, 'a': 0.7, 'b': 0.8},
+            derivatives={'V': 'tau * (V - V**3 / 3.0 + W + c_0)', 'W': '(a - V - b * W) / tau'},
+            coupling_variables=('V', ))
+        model_class = spec.model_class()
+        cfun = coupling.Linear(a=numpy.r_[0.01])
+        fused_sim, fused = self._run('numba', model_class(), cfun, integrators.HeunDeterministic(dt=0.1))
+        sim, stepped = self._run('numpy', model_class(), copy.deepcopy(cfun), integrators.HeunDeterministic(dt=0.1))
+        _assert_outputs_equal(fused, stepped, rtol=1e-6, atol=1e-7)
+
+
+class TestCheckpoint(BaseTestCase):
+
+    def _sim(self, seed, **kwds):
+        kwds.setdefault('integrator', integrators.HeunStochastic(
+            dt=0.1, noise=noise.Additive(nsig=numpy.r_[1e-3], ntau=1.0, noise_seed=seed)))
+        kwds.setdefault('monitors', (monitors.Raw(), monitors.TemporalAverage(period=0.7), monitors.Bold(period=5.0)))
+        return _simulator(seed=seed, **kwds)
+
+    def _assert_resume_is_bit_identical(self, path, **kwds):
+        sim = self._sim(42, **kwds)
+        first = sim.run()
+        sim.checkpoint(path)
+        second = sim.run()
+
+        resumed = self._sim(43, **kwds)
+        resumed.restore(path)
+        assert resumed.current_step == 100
+        _assert_outputs_equal(second, resumed.run())
+
+    def test_resume_is_bit_identical(self, tmpdir):
+        self._assert_resume_is_bit_identical(str(tmpdir.join('checkpoint.npz')))
+
+    def test_resume_multirate(self, tmpdir):
+        # the slow step spans the checkpoint, whose Adams-Bashforth rate is carried over
+        self._assert_resume_is_bit_identical(
+            str(tmpdir.join('checkpoint.npz')), model=models.Epileptor(), coupling=coupling.Difference(),
+            integrator=integrators.MultiRateHeunDeterministic(dt=0.1, n_slow=7), monitors=(monitors.Raw(), ))
+
+    def test_resume_linear_decay(self, tmpdir):
+        # decay rates extracted at the first step, rather than at the restored state
+        self._assert_resume_is_bit_identical(
+            str(tmpdir.join('checkpoint.npz')), integrator=integrators.ExponentialEulerDeterministic(dt=0.1),
+            monitors=(monitors.Raw(), ))
+
+    def test_restore_mismatched_simulator(self, tmpdir):
+        path = str(tmpdir.join('checkpoint.npz'))
+        sim = self._sim(42)
+        sim.checkpoint(path)
+        other = self._sim(42)
+        other.model = models.ReducedWongWang()
+        other.configure()
+        with pytest.raises(ValueError):
+            other.restore(path)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+#
+#  TheVirtualBrain-Scientific Package. This package holds all simulators, and 
+# analysers necessary to run brain-simulations. You can use it stand alone or
+# in conjunction with TheVirtualBrain-Framework Package. See content of the
+# documentation-folder for more details. See also http://www.thevirtualbrain.org
+#
+# (c) 2012-2017, Baycrest Centre for Geriatric Care ("Baycrest") and others
+#
+# This program is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this
+# program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#   CITATION:
+# When using The Virtual Brain for scientific publications, please cite it as follows:
+#
+#   Paula Sanz Leon, Stuart A. Knock, M. Marmaduke Woodman, Lia Domide,
+#   Jochen Mersmann, Anthony R. McIntosh, Viktor Jirsa (2013)
+#       The Virtual Brain: a simulator of primate brain network dynamics.
+#   Frontiers in Neuroinformatics (7:10. doi: 10.3389/fninf.2013.00010)
+#
+#
+
+"""
+Test for tvb.simulator.sinks module
+
+"""
+import numpy
+import pytest
+from tvb.tests.library.base_testcase import BaseTestCase
+from tvb.simulator import simulator, models, coupling, integrators, monitors, sinks
+from tvb.datatypes.connectivity import Connectivity
+from tvb.datatypes.time_series import TimeSeriesRegion
+
+
+class TestNpySink(BaseTestCase):
+
+    def test_write(self, tmpdir):
+        sink = sinks.NpySink(str(tmpdir.join('sink.npy')), 3)
+        for i in range(3):
+            sink.write(i * 0.5, numpy.full((2, 4), i))
+        with pytest.raises(ValueError):
+            sink.write(1.5, numpy.zeros((2, 4)))
+        data = sink.close()
+        assert isinstance(data, numpy.memmap)
+        assert data.shape == (3, 2, 4)
+        numpy.testing.assert_array_equal(data[:, 0, 0], [0, 1, 2])
+        numpy.testing.assert_array_equal(sink.time, [0.0, 0.5, 1.0])
+
+    def test_run_to_sink(self, tmpdir):
+        def sim():
+            numpy.random.seed(42)
+            return simulator.Simulator(
+                connectivity=Connectivity.from_file(),
+                model=models.Generic2dOscillator(),
+                coupling=coupling.Linear(),
+                integrator=integrators.HeunDeterministic(dt=0.1),
+                monitors=(monitors.Raw(), monitors.TemporalAverage(period=0.7), monitors.ProgressLogger()),
+                simulation_length=10.0).configure()
+        expected = sim().run()
+        raw, tavg, progress = sim().run_to_sink(str(tmpdir))
+        assert progress is None
+        for ts, (time, data) in zip((raw, tavg), expected[:2]):
+            assert isinstance(ts, TimeSeriesRegion)
+            assert isinstance(ts.data, numpy.memmap)
+            numpy.testing.assert_array_equal(ts.time, time)
+            numpy.testing.assert_array_equal(ts.data, data)